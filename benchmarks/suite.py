@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Measures how fast jobs are rendered and submitted: renders per second and memory allocated per render for the
+templates in tests/templates and large synthetic templates, the template helpers of k8s_jobs.klib, and job arrays
+rendered and submitted end to end to a fake kubectl and a fake Kubernetes API server.
+
+The report can be written as JSON and compared with the report of another commit, so a change that makes any of them
+slower shows up in review, e.g.:
+
+    git stash && python benchmarks/suite.py --output /tmp/before.json && git stash pop
+    python benchmarks/suite.py --compare /tmp/before.json
+
+Usage: python benchmarks/suite.py [--quick] [--min-time SECONDS] [--filter TEXT] [--output FILE]
+                                  [--compare FILE] [--threshold FRACTION]
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest.mock import patch
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root_dir)
+
+from k8s_jobs import __version__, batch, cache, klib  # noqa: E402
+from k8s_jobs.api import KubernetesClient  # noqa: E402
+from template_render import synthetic_template  # noqa: E402
+
+
+# Creates one job per yaml document on stdin, like `kubectl create -f -`
+FAKE_KUBECTL = """#!/bin/sh
+if [ "$1" = create ]; then
+  awk '/^---/ { n++ } END { for (i = 0; i <= n; i++) printf "job.batch/kjob-%d created\\n", i }'
+fi
+"""
+
+SYNTHETIC_TEMPLATES = {
+    'synthetic-10x50': dict(n_containers=10, n_env=50, n_volumes=10),
+    'synthetic-50x20': dict(n_containers=50, n_env=20, n_volumes=20),
+}
+
+
+def job_args(**kwargs):
+    args = dict(file=None,
+                script=None,
+                cmd_args=['process', '--shard', '$(ARRAY_INDEX)'],
+                image='syncing/the-ship',
+                preemptible=True,
+                name='kjob',
+                container_name=None,
+                time='30',
+                cpu='4',
+                memory='16Gi',
+                disk='100Gi',
+                cpu_limit=None,
+                memory_limit=None,
+                disk_limit=None,
+                persistent_disk_name='reference-disk',
+                mount_path=None,
+                volume_name=None,
+                retry_limit=None,
+                labels=['pool=batch'],
+                partition=None,
+                volume_read_write=None,
+                array=None,
+                params_file=None,
+                chunk_size=200,
+                concurrency=4,
+                rate=None,
+                backend='kubectl',
+                render_mode='text',
+                use_temp_file=False,
+                batch_id='benchmark')
+    args.update(kwargs)
+
+    return Namespace(**args)
+
+
+class FakeApiServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """Creates every job posted to it, naming it after the number of jobs created so far."""
+    protocol_version = 'HTTP/1.1'
+    # Responses are written with one send, so that they aren't delayed by Nagle's algorithm waiting for an ACK
+    wbufsize = -1
+    lock = threading.Lock()
+    n_created = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        with self.lock:
+            FakeApiHandler.n_created += 1
+            name = 'kjob-{n}'.format(n=FakeApiHandler.n_created)
+
+        data = json.dumps({'metadata': {'name': name}}).encode('utf-8')
+
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(func, min_time):
+    """Calls func repeatedly for at least min_time seconds (and at least once after warming up) and returns the
+        seconds per call."""
+    func()
+
+    n_calls = 0
+    started = time.perf_counter()
+
+    while True:
+        func()
+        n_calls += 1
+        elapsed = time.perf_counter() - started
+
+        if elapsed >= min_time:
+            break
+
+    return elapsed / n_calls
+
+
+def peak_memory(func):
+    """Returns the peak number of bytes allocated by one call of func."""
+    func()
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def template_benchmarks(template_paths):
+    """Yields (name, function, number of jobs per call) for rendering each template."""
+    for name, path in template_paths:
+        yield ('render_job_yaml[{name}]'.format(name=name),
+               lambda path=path: klib.render_job_yaml(job_args(file=path)),
+               1)
+        yield ('render_job[{name}]'.format(name=name),
+               lambda path=path: klib.render_job(job_args(file=path)),
+               1)
+
+
+def helper_benchmarks(synthetic_path):
+    with open(synthetic_path) as f:
+        data = f.read()
+
+    lines = data.split('\n')
+    config_template = klib.load_template(data)
+    toleration = copy.deepcopy(klib.yaml_tolerate_preemptible)
+    containers = klib.get_path(config_template, 'spec.template.spec.containers')
+    last_path = 'spec.template.spec.containers.{i}.env.{j}.value'.format(
+        i=len(containers) - 1,
+        j=len(containers[-1]['env']) - 1,
+    )
+
+    def insert_and_remove():
+        klib.insert_or_append_path(config_template, 'spec.template.spec.tolerations', toleration)
+        config_template['spec']['template']['spec']['tolerations'].pop()
+
+    def parse_uncached():
+        # Neither the in-memory nor the on-disk cache has the template
+        cache.template_cache.clear()
+
+        with patch.dict(os.environ, {'K8S_JOBS_TEMPLATE_CACHE': '0'}):
+            klib.load_template(data)
+
+    yield 'replace_template[synthetic-10x50]', lambda: klib.replace_template(lines, 'CPU_REQUEST', '4'), 1
+    yield 'get_path[synthetic-10x50]', lambda: klib.get_path(config_template, last_path), 1
+    yield 'insert_or_append_path[synthetic-10x50]', insert_and_remove, 1
+    yield 'load_template_uncached[synthetic-10x50]', parse_uncached, 1
+
+
+def array_benchmarks(n_jobs):
+    for render_mode in ['text', 'object']:
+        yield ('render_array_manifests[{render_mode}]'.format(render_mode=render_mode),
+               lambda render_mode=render_mode: klib.render_array_manifests(
+                   job_args(), klib.array_template_values(n_jobs), render_mode),
+               n_jobs)
+
+
+def submit_benchmarks(n_jobs, temp_dir):
+    """Yields the end to end benchmarks of rendering and submitting job arrays, to a fake kubectl on the PATH and to a
+        fake API server."""
+    kubectl_path = os.path.join(temp_dir, 'kubectl')
+    with open(kubectl_path, 'w') as f:
+        f.write(FAKE_KUBECTL)
+    os.chmod(kubectl_path, 0o755)
+    os.environ['PATH'] = temp_dir + os.pathsep + os.environ.get('PATH', '')
+
+    server = FakeApiServer(('127.0.0.1', 0), FakeApiHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    client = KubernetesClient('http://127.0.0.1:{port}'.format(port=server.server_address[1]))
+
+    def submit(backend, render_mode):
+        args = job_args(array=n_jobs, backend=backend, render_mode=render_mode)
+        summary = batch.submit_job_array(args, batch.manifest_submitter(backend, client))
+
+        if summary.failed:
+            raise RuntimeError(summary.report(unit='jobs', size=len))
+
+    yield 'submit_array[kubectl]', lambda: submit('kubectl', 'text'), n_jobs
+    yield 'submit_array[api]', lambda: submit('api', 'object'), n_jobs
+
+
+def run_benchmarks(benchmarks, min_time, name_filter=None):
+    results = {}
+
+    for name, func, n_jobs in benchmarks:
+        if name_filter and name_filter not in name:
+            continue
+
+        seconds = measure(func, min_time)
+        results[name] = {
+            'seconds_per_call': seconds,
+            'jobs_per_second': n_jobs / seconds,
+            'peak_memory_bytes_per_job': peak_memory(func) / n_jobs,
+        }
+
+        print('{name:<44} {jobs_per_second:>14.1f} {ms:>12.3f} {memory:>14.0f}'.format(
+            name=name,
+            jobs_per_second=results[name]['jobs_per_second'],
+            ms=seconds * 1000,
+            memory=results[name]['peak_memory_bytes_per_job'],
+        ))
+        sys.stdout.flush()
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of each benchmark from the baseline report, and returns the names of those that got slower by
+        more than the threshold (a fraction of their jobs per second)."""
+    regressions = []
+
+    print('{name:<44} {baseline:>14} {current:>14} {change:>8}'.format(
+        name='benchmark', baseline='baseline/s', current='current/s', change='change',
+    ))
+
+    for name, result in sorted(results.items()):
+        if name not in baseline['benchmarks']:
+            continue
+
+        before = baseline['benchmarks'][name]['jobs_per_second']
+        change = result['jobs_per_second'] / before - 1
+
+        if change < -threshold:
+            regressions.append(name)
+
+        print('{name:<44} {before:>14.1f} {after:>14.1f} {change:>+7.1f}%{flag}'.format(
+            name=name,
+            before=before,
+            after=result['jobs_per_second'],
+            change=100 * change,
+            flag='  SLOWER' if change < -threshold else '',
+        ))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true', help='Use small job arrays and a short time per benchmark, '
+                                                             'e.g. to check that the benchmarks run')
+    parser.add_argument('--min-time', type=float, help='Minimum seconds to time each benchmark for (default is 1, '
+                                                       'or 0.01 with --quick)')
+    parser.add_argument('--filter', help='Only run the benchmarks with names containing this text')
+    parser.add_argument('--output', help='Write the report to this file as JSON')
+    parser.add_argument('--compare', help='Compare the results with a report written by --output')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='With --compare, exit with 1 if any benchmark is slower than this fraction of its '
+                             'baseline (default is 0.1)')
+    args = parser.parse_args()
+
+    min_time = args.min_time if args.min_time is not None else (0.01 if args.quick else 1.0)
+    n_jobs = 20 if args.quick else 1000
+
+    temp_dir = tempfile.mkdtemp(prefix='k8s-jobs-benchmark-')
+    # Templates are cached in memory as they would be in kbatchd, but not on disk in the user's cache
+    os.environ['K8S_JOBS_CACHE_DIR'] = os.path.join(temp_dir, 'cache')
+
+    try:
+        templates_dir = os.path.join(root_dir, 'tests', 'templates')
+        template_paths = [(name, os.path.join(templates_dir, name)) for name in sorted(os.listdir(templates_dir))
+                          if name != 'bogus.yaml']
+
+        for name, kwargs in sorted(SYNTHETIC_TEMPLATES.items()):
+            path = os.path.join(temp_dir, '{name}.yaml'.format(name=name))
+            with open(path, 'w') as f:
+                f.write(synthetic_template(**kwargs))
+            template_paths.append((name, path))
+
+        print('{name:<44} {jobs_per_second:>14} {ms:>12} {memory:>14}'.format(
+            name='benchmark', jobs_per_second='jobs/s', ms='ms/call', memory='bytes/job',
+        ))
+
+        benchmarks = [
+            template_benchmarks(template_paths),
+            helper_benchmarks(dict(template_paths)['synthetic-10x50']),
+            array_benchmarks(n_jobs),
+            submit_benchmarks(n_jobs, temp_dir),
+        ]
+        results = run_benchmarks((benchmark for group in benchmarks for benchmark in group), min_time, args.filter)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    report = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'benchmarks': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        print()
+        regressions = compare(results, baseline, args.threshold)
+
+        if regressions:
+            print('\n{n} benchmark(s) slower than the baseline: {names}'.format(
+                n=len(regressions),
+                names=', '.join(regressions),
+            ))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
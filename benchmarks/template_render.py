@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Compares rendering a job yaml with the compiled Template against the replace_template loop that
+convert_template_yaml used previously, for the packaged default.yaml and a large synthetic template.
+
+Usage: python benchmarks/template_render.py [--number N]
+"""
+
+import argparse
+import os
+import pkgutil
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from k8s_jobs import klib  # noqa: E402
+from k8s_jobs.template import Template  # noqa: E402
+
+
+template_values = {
+    'JOB_NAME': 'kjob',
+    'CONTAINER_NAME': 'the-ship',
+    'CONTAINER_IMAGE': 'syncing/the-ship',
+    'CMD_ARGS': '["ls", "-la"]',
+    'CMD_ARGS0': '["/bin/sh", "-c", "ls -la"]',
+    'TIME_LIMIT_SECONDS': '2100',
+    'CPU_REQUEST': '15500m',
+    'MEM_REQUEST': '60Gi',
+    'DISK_REQUEST': '100Gi',
+    'CPU_LIMIT': None,
+    'MEM_LIMIT': None,
+    'DISK_LIMIT': None,
+    'PD_NAME': None,
+    'MOUNT_PATH': '/static',
+    'VOLUME_NAME': 'k8s-job-volume',
+    'VOLUME_READ_ONLY': 'true',
+    'RETRY_LIMIT': '3',
+    'ARRAY_INDEX': '17',
+}
+
+
+def synthetic_template(n_containers=10, n_env=50, n_volumes=0):
+    lines = [
+        'apiVersion: batch/v1',
+        'kind: Job',
+        'metadata:',
+        '  generateName: $(JOB_NAME)-',
+        'spec:',
+        '  activeDeadlineSeconds: $(TIME_LIMIT_SECONDS)',
+        '  backoffLimit: $(RETRY_LIMIT)',
+        '  template:',
+        '    spec:',
+        '      restartPolicy: Never',
+        '      containers:',
+    ]
+
+    for i in range(n_containers):
+        lines += [
+            '      - name: $(CONTAINER_NAME)-{i}'.format(i=i),
+            '        image: $(CONTAINER_IMAGE)',
+            '        command: $(CMD_ARGS0)',
+            '        env:',
+        ]
+
+        for j in range(n_env):
+            lines += [
+                '        - name: VARIABLE_{j}'.format(j=j),
+                '          value: value-{j}-$(ARRAY_INDEX)'.format(j=j),
+            ]
+
+        lines += [
+            '        resources:',
+            '          requests:',
+            '            cpu: $(CPU_REQUEST)',
+            '            memory: $(MEM_REQUEST)',
+            '            ephemeral-storage: $(DISK_REQUEST)',
+            '          limits:',
+            '            cpu: $(CPU_LIMIT)',
+            '            memory: $(MEM_LIMIT)',
+            '            ephemeral-storage: $(DISK_LIMIT)',
+        ]
+
+        if n_volumes:
+            lines.append('        volumeMounts:')
+
+        for j in range(n_volumes):
+            lines += [
+                '        - name: volume-{j}'.format(j=j),
+                '          mountPath: /mnt/volume-{j}'.format(j=j),
+            ]
+
+    if n_volumes:
+        lines.append('      volumes:')
+
+    for j in range(n_volumes):
+        lines += [
+            '      - name: volume-{j}'.format(j=j),
+            '        emptyDir: {}',
+        ]
+
+    return '\n'.join(lines)
+
+
+def replace_template_loop(data, values):
+    lines = data.split('\n')
+
+    for key, value in values.items():
+        lines = klib.replace_template(lines, key, value)
+
+    return '\n'.join(lines)
+
+
+def benchmark(name, data, number):
+    template = Template(data)
+
+    assert template.render(template_values) == replace_template_loop(data, template_values)
+
+    loop_time = timeit.timeit(lambda: replace_template_loop(data, template_values), number=number)
+    compile_time = timeit.timeit(lambda: Template(data), number=number)
+    render_time = timeit.timeit(lambda: template.render(template_values), number=number)
+
+    print('{name:<24} {lines:>6} {loop:>14.1f} {compiled:>14.1f} {render:>14.1f} {speedup:>8.1f}x'.format(
+        name=name,
+        lines=len(data.split('\n')),
+        loop=loop_time / number * 1e6,
+        compiled=(compile_time + render_time) / number * 1e6,
+        render=render_time / number * 1e6,
+        speedup=loop_time / render_time,
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000, help='Number of renders to time for each template')
+    args = parser.parse_args()
+
+    print('{name:<24} {lines:>6} {loop:>14} {compiled:>14} {render:>14} {speedup:>9}'.format(
+        name='template',
+        lines='lines',
+        loop='loop (us)',
+        compiled='compile+render',
+        render='render (us)',
+        speedup='speedup',
+    ))
+
+    benchmark('default.yaml', pkgutil.get_data('k8s_jobs.klib', 'default.yaml').decode('utf-8'), args.number)
+    benchmark('synthetic (10x50 env)', synthetic_template(), max(args.number // 20, 1))
+
+
+if __name__ == '__main__':
+    main()
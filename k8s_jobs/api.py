@@ -0,0 +1,480 @@
+import base64
+import http.client
+import json
+import os
+import select
+import ssl
+import subprocess as sp
+import tempfile
+import threading
+import urllib.parse
+
+from k8s_jobs import kubeconfig
+from k8s_jobs.klib import ARRAY_INDEX_LABEL, BATCH_LABEL, NonRetryableError
+
+
+# Responses with these statuses may succeed when the request is sent again
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Responses with these statuses reject a request before the API server acts on it (429 is sent by its rate limiting),
+# so the request can be sent again whatever its method. Other retryable statuses, such as a 504 timeout, may be sent
+# after it created the object
+REJECTED_STATUSES = {429}
+
+# Requests with these methods have the same effect however many times the API server receives them (patches are JSON
+# merge patches), so they can be sent again when it is unknown whether the first one was received
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'PATCH', 'DELETE'}
+
+
+class ApiError(RuntimeError):
+    def __init__(self, status, reason, body, retry_after=None):
+        try:
+            message = json.loads(body).get('message') or reason
+        except (ValueError, AttributeError):
+            message = reason
+
+        super(ApiError, self).__init__('Kubernetes API error {status}: {message}'.format(
+            status=status,
+            message=message,
+        ))
+        self.status = status
+        self.reason = reason
+        self.body = body
+        self.retry_after = retry_after
+
+
+class NonRetryableApiError(ApiError, NonRetryableError):
+    pass
+
+
+class UnknownOutcomeError(NonRetryableError):
+    """A request that isn't idempotent, such as a POST creating a job with a generated name, failed after the API
+        server may have received it, so it was not sent again: it may or may not have taken effect. The error it
+        failed with is kept, with its status if it has one."""
+
+    def __init__(self, method, path, error):
+        super(UnknownOutcomeError, self).__init__('{method} {path} may or may not have taken effect: {error}'.format(
+            method=method,
+            path=path,
+            error=error,
+        ))
+        self.method = method
+        self.path = path
+        self.error = error
+        self.status = getattr(error, 'status', None)
+        self.retry_after = getattr(error, 'retry_after', None)
+
+
+def is_connection_dropped(connection):
+    """Returns whether the server has closed an idle connection: nothing should be readable from it until a request
+        is sent, so a readable socket has been closed (or is out of sync)."""
+    if connection.sock is None:
+        return True
+
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def api_error(status, reason, body, headers):
+    """Returns the ApiError for a failed response, which is a NonRetryableApiError unless sending the same request
+        again could succeed."""
+    retry_after = headers.get('Retry-After')
+    try:
+        retry_after = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        retry_after = None
+
+    error_class = ApiError if status in RETRYABLE_STATUSES else NonRetryableApiError
+
+    return error_class(status, reason, body, retry_after)
+
+
+def write_temp_data(data):
+    """Writes base64-encoded kubeconfig data to a private temporary file, for the ssl functions that only take paths."""
+    fd, path = tempfile.mkstemp(prefix='k8s-jobs-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(base64.b64decode(data))
+
+    return path
+
+
+def run_exec_credential_plugin(exec_config):
+    """Runs a kubeconfig exec credential plugin (such as gke-gcloud-auth-plugin) and returns its credential status."""
+    env = dict(os.environ)
+    for variable in exec_config.get('env') or []:
+        env[variable['name']] = variable['value']
+
+    env['KUBERNETES_EXEC_INFO'] = json.dumps({
+        'apiVersion': exec_config.get('apiVersion', 'client.authentication.k8s.io/v1beta1'),
+        'kind': 'ExecCredential',
+        'spec': {'interactive': False},
+    })
+
+    output = sp.check_output([exec_config['command']] + (exec_config.get('args') or []), env=env)
+
+    return json.loads(output.decode('utf-8')).get('status') or {}
+
+
+class KubernetesClient(object):
+    """A minimal client for the Kubernetes API, which keeps a pool of keep-alive connections to the API server so
+        that many requests can be made without starting kubectl or a new TLS connection for each one."""
+
+    def __init__(self, server, namespace='default', ssl_context=None, headers=None, pool_size=8, timeout=60,
+                 refresh_credentials=None):
+        url = urllib.parse.urlsplit(server)
+
+        self.server = server
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip('/')
+        self.namespace = namespace
+        self.ssl_context = ssl_context
+        self.headers = dict(headers or {})
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.refresh_credentials = refresh_credentials
+
+        self.idle_connections = []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_kubeconfig(cls, config=None, context=None, **kwargs):
+        """Creates a client for a kube context (by default, the current context) from the kubeconfig files."""
+        if config is None:
+            config = kubeconfig.load_kubeconfig()
+
+        context_name = context or config.get('current-context')
+        context_config = kubeconfig.get_named(config, 'contexts', context_name)
+
+        if context_config is None:
+            raise RuntimeError('Context "{context_name}" was not found in the kubeconfig'.format(
+                context_name=context_name,
+            ))
+
+        cluster = kubeconfig.get_named(config, 'clusters', context_config.get('cluster')) or {}
+        user = kubeconfig.get_named(config, 'users', context_config.get('user')) or {}
+
+        if not cluster.get('server'):
+            raise RuntimeError('No API server is configured for context "{context_name}"'.format(
+                context_name=context_name,
+            ))
+
+        ssl_context = None
+        if cluster['server'].startswith('https'):
+            ssl_context = ssl.create_default_context()
+
+            if cluster.get('insecure-skip-tls-verify'):
+                ssl_context.check_hostname = False
+                ssl_context.verify_mode = ssl.CERT_NONE
+            elif cluster.get('certificate-authority-data'):
+                ssl_context.load_verify_locations(
+                    cadata=base64.b64decode(cluster['certificate-authority-data']).decode('utf-8'),
+                )
+            elif cluster.get('certificate-authority'):
+                ssl_context.load_verify_locations(cafile=cluster['certificate-authority'])
+
+        def credential_headers():
+            credentials = user
+            if user.get('exec'):
+                credentials = run_exec_credential_plugin(user['exec'])
+
+            load_client_certificate(ssl_context, credentials)
+
+            auth_provider_config = (user.get('auth-provider') or {}).get('config') or {}
+            token = credentials.get('token') or auth_provider_config.get('access-token') or \
+                auth_provider_config.get('id-token')
+
+            if credentials.get('tokenFile'):
+                with open(credentials['tokenFile']) as f:
+                    token = f.read().strip()
+
+            if token:
+                return {'Authorization': 'Bearer {token}'.format(token=token)}
+
+            if credentials.get('username'):
+                basic_auth = base64.b64encode('{username}:{password}'.format(
+                    username=credentials['username'],
+                    password=credentials.get('password', ''),
+                ).encode('utf-8')).decode('utf-8')
+
+                return {'Authorization': 'Basic {basic_auth}'.format(basic_auth=basic_auth)}
+
+            return {}
+
+        return cls(cluster['server'],
+                   namespace=context_config.get('namespace') or 'default',
+                   ssl_context=ssl_context,
+                   headers=credential_headers(),
+                   refresh_credentials=credential_headers if user.get('exec') else None,
+                   **kwargs)
+
+    def connect(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.ssl_context)
+
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                if not self.idle_connections:
+                    break
+
+                connection = self.idle_connections.pop()
+
+            if not is_connection_dropped(connection):
+                return connection, True
+
+            connection.close()
+
+        return self.connect(), False
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle_connections) < self.pool_size:
+                self.idle_connections.append(connection)
+                return
+
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            connections, self.idle_connections = self.idle_connections, []
+
+        for connection in connections:
+            connection.close()
+
+    def url(self, path, query=None):
+        query = {key: value for key, value in (query or {}).items() if value is not None}
+
+        return '{base_path}{path}{query}'.format(
+            base_path=self.base_path,
+            path=path,
+            query='?' + urllib.parse.urlencode(query) if query else '',
+        )
+
+    def send_request(self, connection, method, url, body):
+        headers = dict(self.headers, Accept='application/json')
+
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            # Patches are JSON merge patches, which only change the fields they contain
+            headers['Content-Type'] = 'application/merge-patch+json' if method == 'PATCH' else 'application/json'
+
+        connection.request(method, url, body=body, headers=headers)
+
+    def send(self, connection, method, url, body):
+        self.send_request(connection, method, url, body)
+
+        return connection.getresponse()
+
+    def request(self, method, path, body=None, query=None):
+        """Sends a request to the API server and returns the decoded JSON response, raising an ApiError if the
+            request fails. A request that isn't idempotent is only sent again if it failed before it was completely
+            sent; once it was, a failure to read its response, or a retryable error status that doesn't mean it was
+            rejected (such as a 504 timeout), is an UnknownOutcomeError."""
+        url = self.url(path, query)
+        refreshed = False
+
+        while True:
+            connection, reused = self.acquire()
+
+            try:
+                self.send_request(connection, method, url, body)
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+
+                # The server may have closed an idle keep-alive connection, which is safe to retry once on a new one
+                if reused:
+                    continue
+
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            try:
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                connection.close()
+
+                # The API server may have received the request and acted on it before the connection failed
+                if method not in IDEMPOTENT_METHODS:
+                    raise UnknownOutcomeError(method, path, e)
+
+                if reused:
+                    continue
+
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(connection)
+
+            if response.status == 401 and self.refresh_credentials and not refreshed:
+                self.headers.update(self.refresh_credentials())
+                refreshed = True
+                continue
+
+            if response.status >= 400:
+                error = api_error(response.status, response.reason, data.decode('utf-8', 'replace'), response.headers)
+
+                may_have_taken_effect = response.status in RETRYABLE_STATUSES - REJECTED_STATUSES
+                if may_have_taken_effect and method not in IDEMPOTENT_METHODS:
+                    raise UnknownOutcomeError(method, path, error)
+
+                raise error
+
+            return json.loads(data.decode('utf-8')) if data else None
+
+    def stream(self, path, query=None):
+        """Sends a GET request with a streamed response of JSON lines, such as a watch, on a connection of its own,
+            and yields each decoded line until the server ends the response."""
+        for line in self.stream_lines(path, query):
+            if line.strip():
+                yield json.loads(line.decode('utf-8'))
+
+    def stream_lines(self, path, query=None):
+        """Sends a GET request with a streamed response, such as logs, on a connection of its own, and yields each
+            line of the response (as bytes) until the server ends it."""
+        connection = self.connect()
+
+        try:
+            response = self.send(connection, 'GET', self.url(path, query), None)
+
+            if response.status == 401 and self.refresh_credentials:
+                response.read()
+                connection.close()
+                self.headers.update(self.refresh_credentials())
+
+                connection = self.connect()
+                response = self.send(connection, 'GET', self.url(path, query), None)
+
+            if response.status >= 400:
+                raise api_error(response.status, response.reason, response.read().decode('utf-8', 'replace'),
+                                response.headers)
+
+            for line in response:
+                yield line
+        finally:
+            connection.close()
+
+    def list_pages(self, path, query=None, limit=500):
+        """Lists a collection in pages of at most limit items, following the continue token of each page, and yields
+            each page. All pages are from the same snapshot, with the resourceVersion of the first page."""
+        query = dict(query or {}, limit=limit)
+
+        while True:
+            page = self.request('GET', path, query=query)
+
+            yield page
+
+            continue_token = (page.get('metadata') or {}).get('continue')
+            if not continue_token:
+                return
+
+            query['continue'] = continue_token
+
+    def iter_items(self, path, query=None, limit=500):
+        """Yields each item of a collection, listing it in pages of at most limit items so that neither the API
+            server nor the client has to hold the whole collection at once."""
+        for page in self.list_pages(path, query, limit):
+            for item in page.get('items') or []:
+                yield item
+
+    def watch(self, path, resource_version=None, query=None, timeout_seconds=None):
+        """Watches a collection for changes after resource_version, yielding each event (a dict with the event
+            type and the changed object) until the server ends the watch, at most timeout_seconds later."""
+        query = dict(query or {}, watch='1', allowWatchBookmarks='true', resourceVersion=resource_version,
+                     timeoutSeconds=timeout_seconds)
+
+        return self.stream(path, query)
+
+    def jobs_path(self, namespace=None):
+        return '/apis/batch/v1/namespaces/{namespace}/jobs'.format(namespace=namespace or self.namespace)
+
+    def pods_path(self, namespace=None):
+        return '/api/v1/namespaces/{namespace}/pods'.format(namespace=namespace or self.namespace)
+
+    def create_job(self, job, namespace=None):
+        """Creates a job from its manifest and returns the created job, including its generated name. If it is unknown
+            whether the job was created, the job is looked up by its name, or by its batch and array index labels: the
+            existing job is returned, or the error that made the outcome unknown is raised so that creating it can be
+            retried. Jobs that can't be looked up raise the UnknownOutcomeError."""
+        namespace = namespace or job.get('metadata', {}).get('namespace') or self.namespace
+
+        try:
+            return self.request('POST', self.jobs_path(namespace), job)
+        except UnknownOutcomeError as e:
+            found, existing = self.find_created_job(job, namespace)
+
+            if not found:
+                raise
+
+            if existing is None:
+                raise e.error
+
+            return existing
+
+    def find_created_job(self, job, namespace):
+        """Looks up a job that may have been created from a manifest, and returns whether it could be looked up and
+            the job (or None if it doesn't exist)."""
+        metadata = job.get('metadata') or {}
+        labels = metadata.get('labels') or {}
+
+        if metadata.get('name'):
+            try:
+                return True, self.request('GET', '{path}/{name}'.format(path=self.jobs_path(namespace),
+                                                                        name=metadata['name']))
+            except NonRetryableApiError as e:
+                if e.status != 404:
+                    raise
+
+                return True, None
+
+        batch_id, index = labels.get(BATCH_LABEL), labels.get(ARRAY_INDEX_LABEL)
+
+        if not batch_id or index is None:
+            return False, None
+
+        label_selector = '{batch_label}={batch_id},{index_label}={index}'.format(
+            batch_label=BATCH_LABEL,
+            batch_id=batch_id,
+            index_label=ARRAY_INDEX_LABEL,
+            index=index,
+        )
+        jobs = self.request('GET', self.jobs_path(namespace), query={'labelSelector': label_selector})
+
+        return True, next(iter(jobs.get('items') or []), None)
+
+
+def load_client_certificate(ssl_context, credentials):
+    if ssl_context is None:
+        return
+
+    temp_paths = []
+    try:
+        if credentials.get('client-certificate-data') or credentials.get('clientCertificateData'):
+            certificate_data = credentials.get('client-certificate-data')
+            if certificate_data is None:
+                certificate_data = base64.b64encode(credentials['clientCertificateData'].encode('utf-8'))
+
+            key_data = credentials.get('client-key-data')
+            if key_data is None:
+                key_data = base64.b64encode(credentials['clientKeyData'].encode('utf-8'))
+
+            temp_paths = [write_temp_data(certificate_data), write_temp_data(key_data)]
+            ssl_context.load_cert_chain(*temp_paths)
+        elif credentials.get('client-certificate'):
+            ssl_context.load_cert_chain(credentials['client-certificate'], credentials.get('client-key'))
+    finally:
+        for path in temp_paths:
+            os.unlink(path)
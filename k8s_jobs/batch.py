@@ -0,0 +1,297 @@
+import functools
+
+from k8s_jobs.klib import (array_template_values, batch_selector, combine_script_and_args, generate_templated_yaml,
+                           load_params_file, new_batch_id, render_array_manifests, render_job, render_job_yaml,
+                           run_with_retries, submit_manifest_file, submit_manifests, submit_manifests_api,
+                           PartialSubmissionError)
+from k8s_jobs.timing import timings
+
+
+def is_array(args):
+    # An --indexed array is submitted as a single job
+    return (args.array is not None or bool(args.params_file)) and not getattr(args, 'indexed', False)
+
+
+def manifest_submitter(backend, client=None, context=None):
+    """Returns a function that submits a list of job manifests with the given backend and returns the job names.
+        The api backend uses the given KubernetesClient, or one for the kube context (by default, the current
+        context), and the kubectl backend creates the jobs in the kube context."""
+    if backend == 'api':
+        if client is None:
+            from k8s_jobs.api import KubernetesClient
+
+            client = KubernetesClient.from_kubeconfig(context=context)
+
+        return functools.partial(submit_manifests_api, client)
+
+    return functools.partial(submit_manifests, context=context) if context else submit_manifests
+
+
+def upload_script(args, clients=None):
+    """With --script-configmap, creates the ConfigMap of the --script (or reuses the one with the same contents) with
+        each of the given KubernetesClients (by default, one for the current context) and sets args.script_hash, so
+        that the jobs mount it instead of each inlining the script in its command."""
+    if not (args.script and getattr(args, 'script_configmap', False)) or getattr(args, 'script_hash', None):
+        return
+
+    from k8s_jobs.scripts import ensure_script_configmap
+
+    if clients is None:
+        from k8s_jobs.api import KubernetesClient
+
+        clients = [KubernetesClient.from_kubeconfig()]
+
+    with open(args.script, 'rb') as f:
+        contents = f.read()
+
+    for client in clients:
+        args.script_hash = run_with_retries(20)(ensure_script_configmap)(client, contents)
+
+
+def render_indexed(args):
+    """Renders the single indexed job for the parsed kbatch arguments, first creating the ConfigMap of the parameters of
+        each index (or reusing the one with the same parameters) for a --params-file."""
+    from k8s_jobs.indexed import ensure_params_configmap, render_indexed_job
+
+    params = load_params_file(args.params_file) if args.params_file else None
+
+    if params and not getattr(args, 'params_hash', None):
+        from k8s_jobs.api import KubernetesClient
+
+        args.params_hash = run_with_retries(20)(ensure_params_configmap)(KubernetesClient.from_kubeconfig(), params)
+
+    return render_indexed_job(args, params)
+
+
+def submit_job(args, submit):
+    """Renders and submits the single job for the parsed kbatch arguments, and returns the names of the created jobs.
+        Only the submission is retried, the job is rendered once."""
+    upload_script(args)
+    combine_script_and_args(args)
+    args.batch_id = getattr(args, 'batch_id', None) or new_batch_id()
+
+    if args.use_temp_file:
+        temp_yaml = generate_templated_yaml(args)
+
+        return run_with_retries(20, show_errors=False)(submit_manifest_file)(temp_yaml.name)
+
+    if getattr(args, 'indexed', False):
+        manifest = render_indexed(args)
+    else:
+        manifest = render_job(args) if args.render_mode == 'object' else render_job_yaml(args)
+
+    return run_with_retries(20, show_errors=False)(submit)([manifest])
+
+
+def spool_jobs(args, spool=None):
+    """Renders the jobs for the parsed kbatch arguments and adds them to the local spool for the current kube context
+        instead of submitting them, and returns their names. kspool drain submits them later."""
+    from k8s_jobs import kubeconfig
+    from k8s_jobs.spool import Spool
+
+    upload_script(args)
+    combine_script_and_args(args)
+    args.batch_id = getattr(args, 'batch_id', None) or new_batch_id()
+
+    if getattr(args, 'indexed', False):
+        manifests = [render_indexed(args)]
+    elif is_array(args):
+        params = load_params_file(args.params_file) if args.params_file else None
+        manifests = render_array_manifests(args, array_template_values(args.array, params), 'object')
+    else:
+        manifests = [render_job(args)]
+
+    spool = spool or Spool()
+
+    return spool.enqueue(kubeconfig.current_context_key() or '', args.batch_id, manifests)
+
+
+def array_chunk_size(args):
+    # Jobs created through the API are sent with one request each, so each job is retried individually
+    return args.chunk_size if args.backend == 'kubectl' else 1
+
+
+def created_job_names(result):
+    """Returns the names of the jobs created by the SubmissionResult of a chunk, including those created before it
+        failed."""
+    if isinstance(result.error, PartialSubmissionError):
+        return result.error.job_names
+
+    return result.value or []
+
+
+def throttled_chunk_size(args):
+    # Chunks are only submitted once there is room for all of their jobs, so with --max-running they are small enough
+    # that a quarter of the running jobs finishing makes room for one
+    return max(1, min(array_chunk_size(args), args.max_running // 4))
+
+
+def submit_job_array(args, submit, on_job_names=None, on_progress=None, client=None):
+    """Renders and submits the array of jobs for the parsed kbatch arguments in concurrent, rate limited chunks, and
+        returns the BatchSummary. on_job_names is called with the names of the jobs created by each chunk.
+
+        With args.max_running, at most that many jobs of the batch are pending or running at once: the batch is
+        watched through the API (with the given KubernetesClient, or one for the current kubectl context), and more
+        jobs are submitted as others finish. on_progress is called with the number of jobs submitted, the number of
+        jobs and the number of them in each state whenever those change."""
+    from k8s_jobs.scheduler import SubmissionScheduler
+
+    upload_script(args)
+    combine_script_and_args(args)
+    args.batch_id = getattr(args, 'batch_id', None) or new_batch_id()
+
+    params = load_params_file(args.params_file) if args.params_file else None
+    manifests = render_array_manifests(args, array_template_values(args.array, params), args.render_mode)
+
+    max_running = getattr(args, 'max_running', None)
+    chunk_size = throttled_chunk_size(args) if max_running else array_chunk_size(args)
+    chunks = [manifests[start:start + chunk_size] for start in range(0, len(manifests), chunk_size)]
+
+    def report_job_names(result):
+        job_names = created_job_names(result)
+
+        if job_names and on_job_names:
+            on_job_names(job_names)
+
+    if max_running:
+        summary = submit_job_array_throttled(args, chunks, submit, report_job_names, on_progress, client)
+    else:
+        scheduler = SubmissionScheduler(submit,
+                                        concurrency=args.concurrency,
+                                        rate=args.rate,
+                                        max_attempts=20,
+                                        on_result=report_job_names)
+
+        summary = scheduler.run(chunks)
+
+    timings.count('retries', summary.retries)
+
+    return summary
+
+
+def submit_job_array_throttled(args, chunks, submit, on_result, on_progress=None, client=None):
+    """Submits the chunks of a job array with at most args.max_running of its jobs pending or running at once,
+        watching the jobs of its batch to submit more as they finish."""
+    from k8s_jobs.throttle import submit_throttled
+    from k8s_jobs.watch import JobWatcher
+
+    if client is None:
+        from k8s_jobs.api import KubernetesClient
+
+        client = KubernetesClient.from_kubeconfig()
+
+    watcher = JobWatcher(client, label_selector=batch_selector(args.batch_id)).start()
+
+    try:
+        return submit_throttled(chunks, submit, watcher, args.max_running, created_job_names,
+                                concurrency=args.concurrency,
+                                rate=args.rate,
+                                on_result=on_result,
+                                on_progress=on_progress)
+    finally:
+        watcher.stop()
+
+
+def submit_job_array_sharded(args, contexts, on_job_names=None):
+    """Renders the array of jobs for the parsed kbatch arguments and splits it between kube contexts, given as a list of
+        (context, weight), and submits the jobs of each context concurrently, each in concurrent, rate limited chunks
+        as submit_job_array does. Returns the Shard of each context, with the BatchSummary of its submission.
+
+        The jobs are split in proportion to the weights, or with args.shard_by of capacity, to how many more of them
+        fit in each cluster. Each context gets a contiguous range of the array indexes. on_job_names is called with
+        the context and the names of the jobs created by each chunk."""
+    from k8s_jobs.api import KubernetesClient
+    from k8s_jobs.contexts import Shard, capacity_weights, map_concurrently, shard_counts
+    from k8s_jobs.scheduler import SubmissionScheduler
+
+    shards = [Shard(context, weight, KubernetesClient.from_kubeconfig(context=context)) for context, weight in contexts]
+    # The version of each cluster is checked for --retry-limit, rather than that of the current context
+    args.kube_contexts = [shard.context for shard in shards]
+
+    upload_script(args, [shard.client for shard in shards])
+    combine_script_and_args(args)
+    args.batch_id = getattr(args, 'batch_id', None) or new_batch_id()
+
+    params = load_params_file(args.params_file) if args.params_file else None
+    manifests = render_array_manifests(args, array_template_values(args.array, params), args.render_mode)
+
+    if getattr(args, 'shard_by', 'weight') == 'capacity' and manifests:
+        weights = capacity_weights(shards, manifests[0])
+    else:
+        weights = [shard.weight for shard in shards]
+
+    first_index = 0
+    for shard, count in zip(shards, shard_counts(len(manifests), weights)):
+        shard.first_index = first_index
+        shard.manifests = manifests[first_index:first_index + count]
+        first_index += count
+
+    chunk_size = array_chunk_size(args)
+
+    def submit_shard(shard):
+        def report_job_names(result):
+            job_names = created_job_names(result)
+            shard.job_names.extend(job_names)
+
+            if job_names and on_job_names:
+                on_job_names(shard.context, job_names)
+
+        scheduler = SubmissionScheduler(manifest_submitter(args.backend, shard.client, shard.context),
+                                        concurrency=args.concurrency,
+                                        rate=args.rate,
+                                        max_attempts=20,
+                                        on_result=report_job_names)
+
+        shard.summary = scheduler.run([shard.manifests[start:start + chunk_size]
+                                       for start in range(0, len(shard.manifests), chunk_size)])
+        timings.count('retries', shard.summary.retries)
+
+    map_concurrently(submit_shard, shards)
+
+    return shards
+
+
+def sharded_array_report(args, shards, manifest_path):
+    """Describes the submission of a job array split between kube contexts, with the array indexes of each chunk that
+        failed in each context, and the manifest file of the batch."""
+    chunk_size = array_chunk_size(args)
+    lines = []
+
+    for shard in shards:
+        def describe_chunk(result, shard=shard):
+            first_index = shard.first_index + result.index * chunk_size
+
+            return 'array indexes {first_index}-{last_index}'.format(
+                first_index=first_index,
+                last_index=first_index + len(result.item) - 1,
+            )
+
+        lines.append('{context}{capacity}: {report}'.format(
+            context=shard.context,
+            capacity=' (capacity {n})'.format(n=shard.capacity) if shard.capacity is not None else '',
+            report=shard.summary.report(unit='jobs', size=len, describe=describe_chunk),
+        ))
+
+    lines.append('Batch {batch_id} in {n} contexts written to {path} (status: kstatus --manifest {path}, cancel with: '
+                 'kcancel --manifest {path})'.format(batch_id=args.batch_id, n=len(shards), path=manifest_path))
+
+    return '\n'.join(lines)
+
+
+def array_report(args, summary):
+    """Describes the submission of a job array, with the array indexes of each chunk that failed and the id of the
+        batch the jobs are labeled with."""
+    chunk_size = throttled_chunk_size(args) if getattr(args, 'max_running', None) else array_chunk_size(args)
+
+    def describe_chunk(result):
+        first_index = result.index * chunk_size
+
+        return 'array indexes {first_index}-{last_index}'.format(
+            first_index=first_index,
+            last_index=first_index + len(result.item) - 1,
+        )
+
+    return '{report}\nBatch {batch_id} (cancel with: kcancel --batch {batch_id})'.format(
+        report=summary.report(unit='jobs', size=len, describe=describe_chunk),
+        batch_id=args.batch_id,
+    )
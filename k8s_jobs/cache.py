@@ -0,0 +1,171 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from k8s_jobs import __version__
+
+
+# How long cached information about a cluster (such as its version) is used before asking the cluster again
+CLUSTER_CACHE_TTL_SECONDS = 3600
+
+# How many parsed templates are kept in memory, and on disk
+TEMPLATE_CACHE_SIZE = 64
+TEMPLATE_DISK_CACHE_SIZE = 256
+
+# Parsed templates by digest, as JSON, in least recently used order
+template_cache = collections.OrderedDict()
+template_cache_lock = threading.Lock()
+
+
+def cache_dir():
+    """Returns the directory for k8s-jobs caches: $K8S_JOBS_CACHE_DIR, or k8s-jobs under $XDG_CACHE_HOME (~/.cache)."""
+    if os.environ.get('K8S_JOBS_CACHE_DIR'):
+        return os.environ['K8S_JOBS_CACHE_DIR']
+
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(xdg_cache_home, 'k8s-jobs')
+
+
+def cluster_cache_ttl():
+    return float(os.environ.get('K8S_JOBS_CLUSTER_CACHE_TTL', CLUSTER_CACHE_TTL_SECONDS))
+
+
+def read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def write_file(path, data):
+    """Atomically replaces the file at path with data, so concurrent readers never see a partial write."""
+    import tempfile
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+def write_json(path, value):
+    write_file(path, json.dumps(value))
+
+
+def cluster_cache_path():
+    return os.path.join(cache_dir(), 'clusters.json')
+
+
+def read_cluster_capabilities(context_key, ttl=None):
+    """Returns the cached capabilities of the cluster for a kube context, or None if they are not cached or are
+        older than the TTL."""
+    if ttl is None:
+        ttl = cluster_cache_ttl()
+
+    entry = read_json(cluster_cache_path(), {}).get(context_key)
+
+    if not entry or time.time() - entry.get('fetched_at', 0) > ttl:
+        return None
+
+    return entry['capabilities']
+
+
+def write_cluster_capabilities(context_key, capabilities):
+    path = cluster_cache_path()
+    clusters = read_json(path, {})
+
+    clusters[context_key] = {
+        'fetched_at': time.time(),
+        'capabilities': capabilities,
+    }
+
+    try:
+        write_json(path, clusters)
+    except (IOError, OSError):
+        # The cache is only an optimization, so e.g. a read-only home directory should not fail the job
+        pass
+
+
+def template_digest(data):
+    """Returns the key for a template in the template cache, from its contents and the version of k8s-jobs."""
+    import hashlib
+
+    return hashlib.sha256('{version}\n{data}'.format(version=__version__, data=data).encode('utf-8')).hexdigest()
+
+
+def template_disk_cache_enabled():
+    return os.environ.get('K8S_JOBS_TEMPLATE_CACHE', '1') != '0'
+
+
+def template_cache_path(digest):
+    return os.path.join(cache_dir(), 'templates', '{digest}.json'.format(digest=digest))
+
+
+def remember_template(digest, serialized):
+    with template_cache_lock:
+        template_cache[digest] = serialized
+        template_cache.move_to_end(digest)
+
+        while len(template_cache) > TEMPLATE_CACHE_SIZE:
+            template_cache.popitem(last=False)
+
+
+def read_template(digest):
+    """Returns a parsed template serialized as JSON from the in-memory or on-disk cache, or None if it is not cached."""
+    with template_cache_lock:
+        if digest in template_cache:
+            template_cache.move_to_end(digest)
+            return template_cache[digest]
+
+    if not template_disk_cache_enabled():
+        return None
+
+    try:
+        with open(template_cache_path(digest)) as f:
+            serialized = f.read()
+    except (IOError, OSError):
+        return None
+
+    remember_template(digest, serialized)
+
+    return serialized
+
+
+def write_template(digest, serialized):
+    remember_template(digest, serialized)
+
+    if not template_disk_cache_enabled():
+        return
+
+    path = template_cache_path(digest)
+
+    try:
+        write_file(path, serialized)
+        prune_directory(os.path.dirname(path), TEMPLATE_DISK_CACHE_SIZE)
+    except (IOError, OSError):
+        pass
+
+
+def prune_directory(directory, max_files):
+    """Removes the least recently modified files in a directory until there are at most max_files left."""
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if not name.startswith('.')]
+
+    if len(paths) <= max_files:
+        return
+
+    for path in sorted(paths, key=os.path.getmtime)[:len(paths) - max_files]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
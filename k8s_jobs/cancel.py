@@ -0,0 +1,82 @@
+import sys
+import time
+
+from k8s_jobs.api import NonRetryableApiError
+
+
+# Deleting a job with background propagation returns immediately, and the garbage collector deletes its pods, so
+# that no pods are left running without their job
+DELETE_OPTIONS = {'kind': 'DeleteOptions', 'apiVersion': 'v1', 'propagationPolicy': 'Background'}
+
+
+def delete_job(client, name, namespace=None):
+    """Deletes a job and (in the background) its pods, returning whether it existed."""
+    try:
+        client.request('DELETE', '{jobs_path}/{name}'.format(jobs_path=client.jobs_path(namespace), name=name),
+                       DELETE_OPTIONS)
+    except NonRetryableApiError as e:
+        if e.status == 404:
+            return False
+
+        raise
+
+    return True
+
+
+def delete_jobs_matching(client, label_selector, namespace=None):
+    """Deletes all of the jobs matching a label selector with a single request, returning the names of the deleted
+        jobs."""
+    if not label_selector:
+        raise ValueError('A label selector is required to delete a collection of jobs')
+
+    deleted = client.request('DELETE', client.jobs_path(namespace), DELETE_OPTIONS, {'labelSelector': label_selector})
+
+    return [job['metadata']['name'] for job in (deleted or {}).get('items') or []]
+
+
+def job_names_with_prefix(client, prefix, namespace=None, label_selector=None):
+    """Returns the names of the jobs starting with a prefix, which Kubernetes can't select jobs by, so every job is
+        listed a page at a time."""
+    jobs = client.iter_items(client.jobs_path(namespace), {'labelSelector': label_selector})
+
+    return [job['metadata']['name'] for job in jobs if job['metadata']['name'].startswith(prefix)]
+
+
+class ProgressReporter(object):
+    """Writes how many of the jobs have been deleted, and how fast, at most every interval seconds."""
+
+    def __init__(self, total, interval=1.0, file=sys.stderr, clock=time.monotonic):
+        self.total = total
+        self.interval = interval
+        self.file = file
+        self.clock = clock
+        self.started = clock()
+        self.last_report = self.started
+        self.done = 0
+
+    def __call__(self, result):
+        self.done += 1
+        now = self.clock()
+
+        if now - self.last_report >= self.interval or self.done == self.total:
+            self.last_report = now
+            elapsed = now - self.started
+
+            print('Deleted {done}/{total} jobs ({rate:.1f}/s)'.format(
+                done=self.done,
+                total=self.total,
+                rate=self.done / elapsed if elapsed > 0 else 0.0,
+            ), file=self.file)
+
+
+def delete_jobs(client, names, namespace=None, concurrency=16, rate=None, on_result=None):
+    """Deletes jobs by name with at most concurrency requests at once (and at most rate started per second), retrying
+        failed requests, and returns the BatchSummary. The value of each result is whether the job existed."""
+    from k8s_jobs.scheduler import SubmissionScheduler
+
+    scheduler = SubmissionScheduler(lambda name: delete_job(client, name, namespace),
+                                    concurrency=concurrency,
+                                    rate=rate,
+                                    on_result=on_result)
+
+    return scheduler.run(names)
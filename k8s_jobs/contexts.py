@@ -0,0 +1,170 @@
+import concurrent.futures
+import json
+
+from k8s_jobs.klib import get_path
+
+
+# How the jobs of an array are split between kube contexts: in proportion to the weight given to each, or to how many
+# more of them currently fit on the nodes of each cluster
+SHARD_BY = ['weight', 'capacity']
+
+
+def parse_contexts(value):
+    """Parses --contexts, a comma-separated list of kube contexts each optionally with a weight (1 by default), e.g.
+        "a=2,b,c", into a list of (context, weight)."""
+    contexts = []
+
+    for entry in value.split(','):
+        name, _, weight = entry.strip().partition('=')
+
+        if not name:
+            raise ValueError('--contexts: "{value}" has an empty context name'.format(value=value))
+
+        if name in [context for context, _ in contexts]:
+            raise ValueError('--contexts: context "{name}" is given more than once'.format(name=name))
+
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError('--contexts: the weight of context "{name}" must be a number'.format(name=name))
+
+        if weight < 0:
+            raise ValueError('--contexts: the weight of context "{name}" must not be negative'.format(name=name))
+
+        contexts.append((name, weight))
+
+    if not any(weight for _, weight in contexts):
+        raise ValueError('--contexts: at least one context must have a weight above 0')
+
+    return contexts
+
+
+def shard_counts(n, weights):
+    """Splits n jobs between shards in proportion to their weights with the largest remainder method, so that the
+        counts add up to n. Without any weight, the jobs are split equally."""
+    if not any(weights):
+        weights = [1] * len(weights)
+
+    total = float(sum(weights))
+    quotas = [n * weight / total for weight in weights]
+    counts = [int(quota) for quota in quotas]
+
+    by_remainder = sorted(range(len(weights)), key=lambda i: (counts[i] - quotas[i], i))
+    for i in by_remainder[:n - sum(counts)]:
+        counts[i] += 1
+
+    return counts
+
+
+class Shard(object):
+    """The jobs of an array submitted to one kube context: the array indexes from first_index on, their manifests,
+        the names of the jobs created so far and the BatchSummary of their submission."""
+
+    def __init__(self, context, weight, client):
+        self.context = context
+        self.weight = weight
+        self.client = client
+        self.capacity = None
+        self.first_index = 0
+        self.manifests = []
+        self.job_names = []
+        self.summary = None
+
+
+def map_concurrently(function, items):
+    """Calls function with each item in its own thread, e.g. to make requests to several clusters at once, and returns
+        the results in the same order as the items."""
+    items = list(items)
+
+    if not items:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(items)) as executor:
+        return list(executor.map(function, items))
+
+
+def job_requests(manifest):
+    """Returns the resource requests of the pods of a job manifest (a yaml string or job object), in millicpus and
+        bytes, and the label selector of its node selector."""
+    import yaml
+    from k8s_jobs.nodes import pod_requests
+    from k8s_jobs.template import yaml_loader
+
+    if isinstance(manifest, str):
+        manifest = yaml.load(manifest, Loader=yaml_loader)
+
+    pod_spec = get_path(manifest, 'spec.template.spec', {})
+    label_selector = ','.join('{key}={value}'.format(key=key, value=value)
+                              for key, value in sorted((pod_spec.get('nodeSelector') or {}).items()))
+
+    return pod_requests({'spec': pod_spec}), label_selector
+
+
+def capacity_weights(shards, manifest):
+    """Sets the capacity of each shard to how many more of the jobs fit in its cluster (see nodes.free_slots) and
+        returns those as the weights of the shards, or returns the weights the shards were given if none of the jobs
+        fit in any cluster."""
+    from k8s_jobs.nodes import free_slots
+
+    requests, label_selector = job_requests(manifest)
+    capacities = map_concurrently(lambda shard: free_slots(shard.client, requests, label_selector), shards)
+
+    for shard, capacity in zip(shards, capacities):
+        shard.capacity = capacity
+
+    return capacities if any(capacities) else [shard.weight for shard in shards]
+
+
+def write_manifest(path, batch_id, shards, chunk_size):
+    """Writes the contexts the jobs of a batch were submitted to, with the namespace, array indexes and names of the
+        jobs in each, and the array indexes that failed to be submitted, as JSON for kstatus and kcancel --manifest."""
+    entries = []
+
+    for shard in shards:
+        failed_indexes = []
+        for result in shard.summary.failed if shard.summary else []:
+            first_index = shard.first_index + result.index * chunk_size
+            failed_indexes.extend(range(first_index, first_index + len(result.item)))
+
+        entries.append({
+            'context': shard.context,
+            'namespace': shard.client.namespace,
+            'weight': shard.weight,
+            'capacity': shard.capacity,
+            'first_index': shard.first_index,
+            'n_jobs': len(shard.manifests),
+            'jobs': shard.job_names,
+            'failed_indexes': failed_indexes,
+        })
+
+    with open(path, 'w') as f:
+        json.dump({'batch_id': batch_id, 'contexts': entries}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def read_manifest(path):
+    """Reads a manifest written by write_manifest, raising a ValueError if it is not one."""
+    with open(path) as f:
+        try:
+            manifest = json.load(f)
+        except ValueError as e:
+            raise ValueError('{path} is not a kbatch manifest: {error}'.format(path=path, error=e))
+
+    if not isinstance(manifest, dict) or not manifest.get('batch_id') or not isinstance(manifest.get('contexts'), list):
+        raise ValueError('{path} is not a kbatch manifest: it has no batch_id or contexts'.format(path=path))
+
+    return manifest
+
+
+def map_manifest(manifest, function, namespace=None):
+    """Calls function(client, namespace, entry) concurrently for each context of a manifest, with a KubernetesClient
+        for the context and the namespace the jobs were submitted to (or the given one), and returns the results in
+        the order of the contexts."""
+    from k8s_jobs.api import KubernetesClient
+
+    def call(entry):
+        client = KubernetesClient.from_kubeconfig(context=entry['context'])
+
+        return function(client, namespace or entry.get('namespace'), entry)
+
+    return map_concurrently(call, manifest['contexts'])
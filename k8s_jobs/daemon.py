@@ -0,0 +1,216 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from k8s_jobs import __version__, cache
+
+
+# Arguments that are paths to files, which the daemon reads relative to its own working directory
+PATH_ARGUMENTS = ['file', 'script', 'params_file']
+
+
+class DaemonUnavailable(RuntimeError):
+    """kbatchd is not running, or can't handle a request, so the request should be handled without it."""
+
+
+def socket_path():
+    """Returns the path of the kbatchd socket: $KBATCHD_SOCKET, or kbatchd.sock in the k8s-jobs cache directory."""
+    return os.environ.get('KBATCHD_SOCKET') or os.path.join(cache.cache_dir(), 'kbatchd.sock')
+
+
+def submit_request(args):
+    """Returns the request to submit the jobs for the parsed kbatch arguments through kbatchd."""
+    args = dict(vars(args))
+    args.pop('no_daemon', None)
+
+    for name in PATH_ARGUMENTS:
+        if args.get(name):
+            args[name] = os.path.abspath(args[name])
+
+    return {
+        'op': 'submit',
+        'version': __version__,
+        'kubeconfig': os.environ.get('KUBECONFIG'),
+        'args': args,
+    }
+
+
+def connect(path=None, timeout=None):
+    """Connects to kbatchd, raising DaemonUnavailable if it is not running."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+
+    try:
+        sock.connect(path or socket_path())
+    except (OSError, ValueError) as e:
+        sock.close()
+        raise DaemonUnavailable('kbatchd is not running: {e}'.format(e=e))
+
+    return sock
+
+
+def send_request(sock, request):
+    """Sends a request to kbatchd and yields its responses, the last of which has 'done' set. A response with
+        'fallback' set means the daemon can't handle the request and nothing was submitted."""
+    with sock, sock.makefile('rwb') as f:
+        f.write(json.dumps(request).encode('utf-8') + b'\n')
+        f.flush()
+
+        for line in f:
+            response = json.loads(line.decode('utf-8'))
+
+            yield response
+
+            if response.get('done'):
+                return
+
+    raise RuntimeError('kbatchd closed the connection before finishing the request, some jobs may have been submitted')
+
+
+class KbatchDaemon(object):
+    """Handles kbatchd requests, keeping what is expensive to set up for each submission between requests: parsed
+        templates (in the in-memory template cache), imported modules and Kubernetes API connections.
+
+        Requests are JSON objects with an 'op' of 'ping' or 'submit'. Submit requests have the parsed kbatch
+        arguments as 'args' and are only handled by a daemon of the same version and $KUBECONFIG, so that submitting
+        through the daemon gives the same jobs as submitting without it.
+    """
+
+    def __init__(self, submitter=None):
+        from k8s_jobs import batch
+
+        self.batch = batch
+        self.submitter = submitter or self.default_submitter
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def api_client(self):
+        from k8s_jobs import kubeconfig
+        from k8s_jobs.api import KubernetesClient
+
+        # The client is kept open between requests, but a new one is needed when the current context changes
+        config = kubeconfig.load_kubeconfig()
+        context_key = kubeconfig.current_context_key(config)
+
+        with self.lock:
+            if context_key not in self.clients:
+                self.clients[context_key] = KubernetesClient.from_kubeconfig(config)
+
+            return self.clients[context_key]
+
+    def default_submitter(self, backend):
+        return self.batch.manifest_submitter(backend, self.api_client() if backend == 'api' else None)
+
+    def handle(self, request, send):
+        """Handles a request, calling send with each response."""
+        op = request.get('op')
+
+        if op == 'ping':
+            send({'done': True, 'version': __version__, 'pid': os.getpid()})
+            return
+
+        if op != 'submit':
+            send({'done': True, 'error': 'Unknown request: {op}'.format(op=op)})
+            return
+
+        if request.get('version') != __version__ or request.get('kubeconfig') != os.environ.get('KUBECONFIG'):
+            send({'done': True, 'fallback': True,
+                  'error': 'kbatchd {version} is running with a different version or $KUBECONFIG'.format(
+                      version=__version__)})
+            return
+
+        try:
+            args = argparse_namespace(request['args'])
+            submit = self.submitter(args.backend)
+
+            if self.batch.is_array(args):
+                summary = self.batch.submit_job_array(args, submit, lambda job_names: send({'job_names': job_names}))
+                send({'done': True, 'report': self.batch.array_report(args, summary), 'failed': len(summary.failed)})
+            else:
+                send({'job_names': self.batch.submit_job(args, submit)})
+                send({'done': True})
+        except Exception as e:
+            send({'done': True, 'error': '{name}: {e}'.format(name=type(e).__name__, e=e)})
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+
+def argparse_namespace(values):
+    import argparse
+
+    return argparse.Namespace(**values)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Reads requests from a connection, one JSON object per line, and writes the responses of each request as JSON
+        lines."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                self.send({'done': True, 'error': 'Requests must be JSON objects, one per line'})
+                continue
+
+            self.server.kbatch_daemon.handle(request, self.send)
+
+    def send(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, kbatch_daemon):
+        self.kbatch_daemon = kbatch_daemon
+
+        # The socket is only accessible to the current user, who is the one submitting jobs
+        old_umask = os.umask(0o177)
+        try:
+            super(DaemonServer, self).__init__(path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+
+def make_server(path=None, kbatch_daemon=None):
+    """Creates the kbatchd server on a Unix socket, replacing the socket of a daemon that is no longer running."""
+    path = path or socket_path()
+
+    try:
+        connect(path).close()
+    except DaemonUnavailable:
+        pass
+    else:
+        raise RuntimeError('kbatchd is already running on {path}'.format(path=path))
+
+    if os.path.exists(path):
+        os.unlink(path)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    return DaemonServer(path, kbatch_daemon or KbatchDaemon())
+
+
+def serve(path=None):
+    """Runs kbatchd until it is interrupted, then removes its socket."""
+    server = make_server(path)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.kbatch_daemon.close()
+
+        try:
+            os.unlink(server.server_address)
+        except OSError:
+            pass
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import time
+
+from k8s_jobs.klib import (ARRAY_INDEX_TEMPLATE, PARAMS_HASH_LABEL, get_path, insert_or_append_path, prepare_template,
+                           read_template_data)
+from k8s_jobs.scripts import MAX_SCRIPT_BYTES, ensure_configmap, last_used_annotation
+from k8s_jobs.validate import ValidationError
+from k8s_jobs.watch import COMPLETE, FAILED, PENDING, RUNNING, job_state
+
+
+# The environment variable and the annotation (and, since Kubernetes 1.28, label) the job controller sets on each pod of
+# an indexed job to its completion index
+INDEX_ENV = 'JOB_COMPLETION_INDEX'
+INDEX_ANNOTATION = 'batch.kubernetes.io/job-completion-index'
+
+# Kubernetes limits the completions (and parallelism) of indexed jobs
+MAX_COMPLETIONS = 100000
+
+PARAMS_HASH_LENGTH = 16
+PARAMS_VOLUME_NAME = 'kbatch-params'
+PARAMS_MOUNT_PATH = '/etc/kbatch-params'
+
+# Sets the parameters of the index of the pod as shell variables, before the command of the job
+PARAMS_PRELUDE = '. {mount_path}/${{{env}}}.env && '.format(mount_path=PARAMS_MOUNT_PATH, env=INDEX_ENV)
+
+
+def params_hash(params):
+    data = json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:PARAMS_HASH_LENGTH]
+
+
+def params_configmap_name(digest):
+    return 'kbatch-params-{digest}'.format(digest=digest)
+
+
+def shell_quote(value):
+    return "'{value}'".format(value=value.replace("'", "'\"'\"'"))
+
+
+def params_env(values):
+    """Returns the shell script setting the parameters of one index, with each value quoted so that it is used
+        verbatim."""
+    return ''.join('export {name}={value}\n'.format(name=name, value=shell_quote(value))
+                   for name, value in sorted(values.items()))
+
+
+def params_configmap(params, digest, now):
+    """Returns the ConfigMap of the parameters of an indexed job, with the script setting those of each index as the
+        key <index>.env."""
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {
+            'name': params_configmap_name(digest),
+            'labels': {PARAMS_HASH_LABEL: digest},
+            'annotations': last_used_annotation(now),
+        },
+        'data': {'{index}.env'.format(index=index): params_env(values) for index, values in enumerate(params)},
+    }
+
+
+def ensure_params_configmap(client, params, namespace=None, now=None):
+    """Creates the ConfigMap of the parameters of an indexed job, named after their hash, or marks the existing one as
+        used, and returns the hash."""
+    now = now if now is not None else time.time()
+    digest = params_hash(params)
+    configmap = params_configmap(params, digest, now)
+
+    size = sum(len(key) + len(value.encode('utf-8')) for key, value in configmap['data'].items())
+    if size > MAX_SCRIPT_BYTES:
+        raise ValidationError(['--params-file: the parameters are {size} bytes, larger than a ConfigMap can hold '
+                               '({limit} bytes), submit an array of jobs instead'.format(size=size,
+                                                                                         limit=MAX_SCRIPT_BYTES)])
+
+    ensure_configmap(client, configmap, namespace, now)
+
+    return digest
+
+
+def index_values(params=None):
+    """Returns the values of the placeholders that differ between the indexes of an indexed job: $(ARRAY_INDEX) is its
+        completion index, which Kubernetes substitutes into the command and args, and each column of the parameters is
+        the shell variable that PARAMS_PRELUDE sets."""
+    values = {ARRAY_INDEX_TEMPLATE: '$({env})'.format(env=INDEX_ENV)}
+
+    for name in (params[0] if params else {}):
+        values[name] = '${{{name}}}'.format(name=name)
+
+    return values
+
+
+def iter_strings(value, path=''):
+    """Yields the path (e.g. spec.template.spec.containers.0.args.1) and value of each string in a job."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from iter_strings(item, '{path}.{key}'.format(path=path, key=key) if path else str(key))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from iter_strings(item, '{path}.{i}'.format(path=path, i=i))
+    elif isinstance(value, str):
+        yield path, value
+
+
+def add_params_prelude(job, digest, names=()):
+    """Mounts the ConfigMap of the parameters into every container of an indexed job, and sets the parameters of its
+        index before the command of each container that is run with /bin/sh -c. The parameters (named by names) are
+        only set in those commands, so using them anywhere else in the job is a ValidationError."""
+    insert_or_append_path(job, 'spec.template.spec.volumes', {
+        'name': PARAMS_VOLUME_NAME,
+        'configMap': {'name': params_configmap_name(digest)},
+    })
+
+    shell_command_paths = set()
+
+    for i, container in enumerate(get_path(job, 'spec.template.spec.containers', [])):
+        insert_or_append_path(job, 'spec.template.spec.containers.{}.volumeMounts'.format(i), {
+            'name': PARAMS_VOLUME_NAME,
+            'mountPath': PARAMS_MOUNT_PATH,
+            'readOnly': True,
+        })
+
+        command = container.get('command') or []
+
+        for j in range(len(command) - 2):
+            if command[j].startswith('/bin/sh') and command[j + 1] == '-c':
+                command[j + 2] = PARAMS_PRELUDE + command[j + 2]
+                shell_command_paths.add('spec.template.spec.containers.{i}.command.{j}'.format(i=i, j=j + 2))
+                break
+
+    if not shell_command_paths:
+        raise ValidationError(['--params-file: the command of an indexed job must be run with /bin/sh -c, which sets '
+                               'the parameters of each index'])
+
+    problems = []
+
+    for path, value in iter_strings(job):
+        for name in sorted(names):
+            if path not in shell_command_paths and '${{{name}}}'.format(name=name) in value:
+                problems.append('--params-file: $({name}) is used in {path}, but the parameters of an indexed job are '
+                                'only set in the /bin/sh -c command of its containers'.format(name=name, path=path))
+
+    if problems:
+        raise ValidationError(problems)
+
+
+def render_indexed_job(args, params=None):
+    """Renders a single indexed job for an array of --array N jobs or one per row of the parameters, with a completion
+        for each, at most args.max_running (by default, all of them) of which run at once. $(ARRAY_INDEX) is replaced
+        with the completion index of each pod, and the parameters of each row are read from their ConfigMap (uploaded
+        with ensure_params_configmap, which sets args.params_hash)."""
+    from k8s_jobs.template import ObjectTemplate
+
+    completions = len(params) if params is not None else args.array
+
+    if not 1 <= completions <= MAX_COMPLETIONS:
+        raise ValidationError(['--indexed: the number of jobs ({n}) must be from 1 to {max}'.format(
+            n=completions,
+            max=MAX_COMPLETIONS,
+        )])
+
+    config_template, template_values = prepare_template(read_template_data(args), args)
+    values = index_values(params)
+    job = ObjectTemplate(config_template).render(dict(template_values, **values), inner_values=values)
+
+    job['spec']['completionMode'] = 'Indexed'
+    job['spec']['completions'] = completions
+    job['spec']['parallelism'] = min(getattr(args, 'max_running', None) or completions, completions)
+
+    if params:
+        add_params_prelude(job, args.params_hash, list(params[0]))
+
+    return job
+
+
+def parse_indexes(value):
+    """Parses a set of indexes in the format of the status of indexed jobs, e.g. "1,3-5,7"."""
+    indexes = set()
+
+    for interval in (value or '').split(','):
+        if not interval:
+            continue
+
+        first, _, last = interval.partition('-')
+        indexes.update(range(int(first), int(last or first) + 1))
+
+    return indexes
+
+
+def format_indexes(indexes):
+    """Formats indexes as intervals, in the same format as the status of indexed jobs."""
+    intervals = []
+
+    for index in sorted(indexes):
+        if intervals and intervals[-1][1] == index - 1:
+            intervals[-1][1] = index
+        else:
+            intervals.append([index, index])
+
+    return ','.join(str(first) if first == last else '{first}-{last}'.format(first=first, last=last)
+                    for first, last in intervals)
+
+
+def is_indexed(job):
+    return (job.get('spec') or {}).get('completionMode') == 'Indexed'
+
+
+def completion_index(pod):
+    """Returns the completion index of a pod of an indexed job, or None for pods of other jobs."""
+    metadata = pod.get('metadata') or {}
+    labels = metadata.get('labels') or {}
+    value = (metadata.get('annotations') or {}).get(INDEX_ANNOTATION, labels.get(INDEX_ANNOTATION))
+
+    return int(value) if value is not None and str(value).isdigit() else None
+
+
+def index_states(job, pods):
+    """Returns the state of each index of an indexed job, with how many pods ran it and the name of the latest. Indexes
+        are complete or failed from the status of the job, and pending or running from their latest pod. Indexes of a
+        job that failed as a whole, which won't be run again, are failed."""
+    status = job.get('status') or {}
+    completed = parse_indexes(status.get('completedIndexes'))
+    failed = parse_indexes(status.get('failedIndexes'))
+    job_failed = job_state(job) == FAILED
+
+    pods_by_index = {}
+    for pod in sorted(pods, key=lambda pod: pod['metadata'].get('creationTimestamp') or ''):
+        index = completion_index(pod)
+
+        if index is not None:
+            pods_by_index.setdefault(index, []).append(pod)
+
+    states = []
+    for index in range(job['spec'].get('completions') or 0):
+        index_pods = pods_by_index.get(index, [])
+        phase = (index_pods[-1].get('status') or {}).get('phase') if index_pods else None
+
+        if index in completed:
+            state = COMPLETE
+        elif index in failed or job_failed:
+            state = FAILED
+        elif phase == 'Running':
+            state = RUNNING
+        else:
+            state = PENDING
+
+        states.append({
+            'index': index,
+            'state': state,
+            'attempts': len(index_pods),
+            'pod': index_pods[-1]['metadata']['name'] if index_pods else None,
+        })
+
+    return states
+
+
+def format_index_summary(states):
+    """Returns how many indexes are in each state, listing those that failed."""
+    counts = {state: 0 for state in [PENDING, RUNNING, COMPLETE, FAILED]}
+    for index_state in states:
+        counts[index_state['state']] += 1
+
+    failed = [index_state['index'] for index_state in states if index_state['state'] == FAILED]
+
+    return '{complete} complete, {failed} failed{failed_indexes}, {running} running, {pending} pending'.format(
+        complete=counts[COMPLETE],
+        failed=counts[FAILED],
+        failed_indexes=' ({indexes})'.format(indexes=format_indexes(failed)) if failed else '',
+        running=counts[RUNNING],
+        pending=counts[PENDING],
+    )
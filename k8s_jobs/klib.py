@@ -1,17 +1,17 @@
-import base64
 import json
 import os
 import sys
-import random
 import re
+import shlex
 import string
 import subprocess as sp
-import tempfile
-import pkgutil
 import time
 
-from semantic_version import Version
-import yaml
+from k8s_jobs import __version__, cache, kubeconfig
+from k8s_jobs.timing import timings
+
+# yaml, semantic_version, the templates and other modules only needed by some commands are imported in the functions
+# that use them, so that scripts such as `kbatch --version` start quickly
 
 
 arg_templates = {
@@ -64,25 +64,58 @@ yaml_disk_mount_spec = {
 }
 
 
-millicpu_request_matcher = re.compile('(?P<millicpus>[0-9]+)m')
 kubernetes_version_matcher = re.compile('v(?P<version>[0-9]+\.[0-9]+\.[0-9]+)')
+template_name_matcher = re.compile('^[A-Za-z_][A-Za-z0-9_]*$')
+# Newer versions of kubectl print `job.batch/name created`, older ones print `job.batch "name" created`
+created_job_matcher = re.compile(r'^job(?:\.batch)?[/ ]"?(?P<name>[^"\s]+)"? created$')
+# Errors of kubectl create for manifests that the cluster (or kubectl) rejected, which fail the same way if retried
+rejected_manifest_matcher = re.compile(r'is invalid|error validating|error parsing|error converting YAML|unknown field|'
+                                       r'cannot unmarshal|BadRequest|admission webhook .* denied')
+
+# Substitution variable set to the index of each job when submitting an array of jobs
+ARRAY_INDEX_TEMPLATE = 'ARRAY_INDEX'
+
+# Labels set on every job kbatch submits, and on its pods, so that the jobs of a batch (the jobs submitted by one call
+# of kbatch), of a user or of a template can be found with a label selector instead of listing every job
+BATCH_LABEL = 'k8s-jobs/batch'
+SUBMITTER_LABEL = 'k8s-jobs/submitter'
+TEMPLATE_HASH_LABEL = 'k8s-jobs/template-hash'
+ARRAY_INDEX_LABEL = 'k8s-jobs/array-index'
+# Set on the jobs running a --script from a ConfigMap, and on the ConfigMap, to the hash of the script
+SCRIPT_HASH_LABEL = 'k8s-jobs/script-hash'
+# Set on indexed jobs with a --params-file, and on the ConfigMap of their parameters, to the hash of the parameters
+PARAMS_HASH_LABEL = 'k8s-jobs/params-hash'
+TEMPLATE_HASH_LENGTH = 16
+
+VERSION_ANNOTATION = 'k8s-jobs/version'
+TEMPLATE_ANNOTATION = 'k8s-jobs/template'
+
+label_key_matcher = re.compile(r'^([a-z0-9]([-a-z0-9.]{0,251}[a-z0-9])?/)?'
+                               r'[A-Za-z0-9]([-A-Za-z0-9_.]{0,61}[A-Za-z0-9])?$')
+label_value_matcher = re.compile(r'^([A-Za-z0-9][-A-Za-z0-9_.]{0,61})?[A-Za-z0-9]$')
+batch_id_matcher = label_value_matcher
 
 
 LABEL_ARGUMENTS = ['partition']
 
+# CPU reserved on each node for the system and Kubernetes, which adjust_cpu_request lowers CPU requests by
+CPU_REQUEST_OVERHEAD_MILLICPUS = 500
+
+
 
 def adjust_cpu_request(args):
-    if not args.cpu:
+    """Lowers the CPU request by the CPU reserved on each node for the system, so that e.g. a job requesting 16 CPUs
+        fits on a node with 16 CPUs. Requests are lowered by at most half, so that small requests are not lowered to
+        zero or less. The request keeps its unit, e.g. 16 becomes 15.5 and 16000m becomes 15500m."""
+    if not args.cpu or '$(' in args.cpu:
         return
 
-    millicpu_request = millicpu_request_matcher.match(args.cpu)
+    from k8s_jobs.quantity import format_cpu, to_millicpus
 
-    if millicpu_request:
-        millicpu_request = millicpu_request.group('millicpus')
+    millicpus = to_millicpus(args.cpu)
+    adjusted_millicpus = max(millicpus - CPU_REQUEST_OVERHEAD_MILLICPUS, (millicpus + 1) // 2)
 
-        args.cpu = '{millicpus}m'.format(millicpus=int(millicpu_request) - 500)
-    else:
-        args.cpu = str(float(args.cpu) - 0.5)
+    args.cpu = format_cpu(adjusted_millicpus, milli=args.cpu.endswith('m'))
 
 
 def adjust_time(args):
@@ -92,7 +125,9 @@ def adjust_time(args):
     args.time = str(int(args.time) * 60)
 
 
-def add_node_selectors(args, config_template):
+def node_selector_labels(args):
+    """Returns the node selector of the arguments, from --labels and the arguments that are node labels such as
+        --partition."""
     labels = {
         label_name: value for label_name, value in [
             tuple(label_arg.split('=')) for label_arg in args.labels
@@ -111,21 +146,169 @@ def add_node_selectors(args, config_template):
 
     labels.update(labels_from_args)
 
+    return labels
+
+
+def add_node_selectors(args, config_template):
+    labels = node_selector_labels(args)
+
     if labels:
         set_path(config_template, 'spec.template.spec.nodeSelector', labels)
 
 
-def verify_retry_limit_supported(num_retries):
-    """Due to a k8s bug: https://github.com/kubernetes/kubernetes/issues/62382,
-        only certain version of Kubernetes support a backoffLimit on jobs."""
-    if int(num_retries) < 1:
-        return
+def batch_selector(batch_id):
+    return '{label}={batch_id}'.format(label=BATCH_LABEL, batch_id=batch_id)
+
+
+def label_value(value):
+    """Returns a valid label value made from any string, or None if there is nothing left of it."""
+    return re.sub('[^A-Za-z0-9_.-]', '-', value)[:63].strip('-_.') or None
+
+
+def current_user():
+    import getpass
+
+    try:
+        return getpass.getuser()
+    except (KeyError, OSError):
+        return None
+
+
+def parse_key_values(key_values, option):
+    """Parses a list of KEY=VALUE arguments to a dict."""
+    parsed = {}
+
+    for key_value in key_values or []:
+        key, separator, value = key_value.partition('=')
+
+        if not key or not separator:
+            raise ValueError('Invalid {option} "{key_value}", expected KEY=VALUE'.format(
+                option=option,
+                key_value=key_value,
+            ))
+
+        parsed[key] = value
+
+    return parsed
+
+
+def user_job_labels(args):
+    """Returns the labels given with --job-labels, checking that they are valid Kubernetes labels. Values with
+        $(NAME) placeholders are checked once they are substituted, by the API server."""
+    labels = parse_key_values(getattr(args, 'job_labels', None), '--job-labels')
+
+    for key, value in labels.items():
+        if not label_key_matcher.match(key):
+            raise ValueError('Invalid label name "{key}" in --job-labels'.format(key=key))
+
+        if value and '$(' not in value and not label_value_matcher.match(value):
+            raise ValueError('Invalid value "{value}" of label "{key}" in --job-labels, values must be at most 63 '
+                             'letters, digits, "-", "_" or ".", starting and ending with a letter or digit'.format(
+                                 key=key,
+                                 value=value,
+                             ))
+
+    return labels
+
+
+def job_labels(args, data, array=False):
+    """Returns the labels of the jobs rendered from a template: the batch id, the user submitting them, the hash of
+        the template and (for an array) the index of each job, and the labels given with --job-labels. A label given
+        an empty value is not set."""
+    import hashlib
+
+    labels = {
+        BATCH_LABEL: getattr(args, 'batch_id', None),
+        SUBMITTER_LABEL: label_value(current_user() or ''),
+        TEMPLATE_HASH_LABEL: hashlib.sha256(data.encode('utf-8')).hexdigest()[:TEMPLATE_HASH_LENGTH],
+        SCRIPT_HASH_LABEL: getattr(args, 'script_hash', None),
+        PARAMS_HASH_LABEL: getattr(args, 'params_hash', None),
+    }
+
+    if array:
+        labels[ARRAY_INDEX_LABEL] = '$({name})'.format(name=ARRAY_INDEX_TEMPLATE)
+
+    labels.update(user_job_labels(args))
+
+    return {key: value for key, value in labels.items() if value}
+
+
+def job_annotations(args):
+    """Returns the annotations of the jobs: the version of k8s-jobs and the template they were rendered from, and the
+        annotations given with --annotations. An annotation given an empty value is not set."""
+    annotations = {
+        VERSION_ANNOTATION: __version__,
+        TEMPLATE_ANNOTATION: getattr(args, 'file', None) or 'default',
+    }
+
+    annotations.update(parse_key_values(getattr(args, 'annotations', None), '--annotations'))
+
+    return {key: value for key, value in annotations.items() if value}
 
-    kubernetes_version_response, _ = sp.Popen('kubectl version -o json', shell=True, stdout=sp.PIPE).communicate()
+
+def add_job_metadata(args, config_template, data, array=False):
+    """Adds the job labels and annotations to the metadata of the job and of its pod template, so that both the jobs
+        and their pods can be selected by them."""
+    from k8s_jobs.template import QuotedString
+
+    # Values are always written to yaml as strings, even if e.g. a batch id or $(ARRAY_INDEX) is rendered to a number
+    labels = {key: QuotedString(value) for key, value in job_labels(args, data, array).items()}
+    annotations = {key: QuotedString(value) for key, value in job_annotations(args).items()}
+
+    parents = [config_template]
+    if isinstance(get_path(config_template, 'spec.template'), dict):
+        parents.append(config_template['spec']['template'])
+
+    for parent in parents:
+        if not parent.get('metadata'):
+            parent['metadata'] = {}
+
+        metadata = parent['metadata']
+        metadata['labels'] = dict(metadata.get('labels') or {}, **labels)
+        metadata['annotations'] = dict(metadata.get('annotations') or {}, **annotations)
+
+
+def new_batch_id():
+    """Returns an id for a new batch of jobs, from the time it was submitted and a random suffix."""
+    return '{time}-{suffix}'.format(time=time.strftime('%Y%m%d-%H%M%S'), suffix=random_string(6))
+
+
+def get_kubernetes_version(context=None):
+    """Returns the server version of a kube context (by default the current one), only asking the cluster through
+        kubectl when the version is not already cached for that context."""
+    context_key = kubeconfig.context_key(context)
+    capabilities = cache.read_cluster_capabilities(context_key) if context_key else None
+
+    if capabilities and capabilities.get('server_version'):
+        return capabilities['server_version']
+
+    command = 'kubectl version -o json'
+    if context:
+        command += ' --context {context}'.format(context=shlex.quote(context))
+
+    kubernetes_version_response, _ = sp.Popen(command, shell=True, stdout=sp.PIPE).communicate()
     kubernetes_version_json = json.loads(kubernetes_version_response.decode('utf-8'))
     kubernetes_version = kubernetes_version_matcher.match(
         kubernetes_version_json['serverVersion']['gitVersion'],
     ).group('version')
+
+    if context_key:
+        cache.write_cluster_capabilities(context_key, dict(capabilities or {}, server_version=kubernetes_version))
+
+    return kubernetes_version
+
+
+def verify_retry_limit_supported(num_retries, context=None):
+    """Due to a k8s bug: https://github.com/kubernetes/kubernetes/issues/62382,
+        only certain version of Kubernetes support a backoffLimit on jobs."""
+    if int(num_retries) < 1:
+        return
+
+    from semantic_version import Version
+
+    with timings.phase('version_check'):
+        kubernetes_version = get_kubernetes_version(context)
+
     min_k8s_version = '1.10.5'
 
     if Version.coerce(kubernetes_version) < Version(min_k8s_version):
@@ -138,12 +321,21 @@ def verify_retry_limit_supported(num_retries):
 
 
 def combine_script_and_args(args):
+    """Adds the command running the --script before the command args. The script is inlined into the command, or run
+        from its ConfigMap if it was uploaded with --script-configmap (which sets args.script_hash)."""
     if args.script:
-        with open(args.script, 'r+b') as script_file:
-            script_contents = script_file.read()
+        if getattr(args, 'script_hash', None):
+            from k8s_jobs.scripts import script_command
+
+            script_cmd = script_command()
+        else:
+            import base64
+
+            with open(args.script, 'r+b') as script_file:
+                script_contents = script_file.read()
 
-        script_encoded = base64.b64encode(script_contents).decode('utf-8')
-        script_cmd = 'echo {script_encoded} | base64 --decode | bash'.format(script_encoded=script_encoded)
+            script_encoded = base64.b64encode(script_contents).decode('utf-8')
+            script_cmd = 'echo {script_encoded} | base64 --decode | bash'.format(script_encoded=script_encoded)
 
         if args.cmd_args:
             args.cmd_args.insert(0, script_cmd)
@@ -160,15 +352,73 @@ def replace_template(lines, key, value):
         return [l.replace('$({key})'.format(key=key), value) for l in lines]
 
 
-def convert_template_yaml(data, args):
-    adjust_cpu_request(args)
+def load_template(data):
+    """Parses a job yaml template. Parsed templates are cached by the hash of their contents, in memory and on disk,
+        so rendering the same template again does not parse it again. Each call returns a new copy of the template
+        that is safe to modify."""
+    from k8s_jobs.template import mark_quoted, quoted_paths
+
+    digest = cache.template_digest(data)
+    serialized = cache.read_template(digest)
+
+    if serialized is not None:
+        try:
+            cached = json.loads(serialized)
+        except ValueError:
+            cached = None
+
+        # The strings the template quotes are stored separately, since JSON has no type for them
+        if isinstance(cached, dict) and 'template' in cached and 'quoted' in cached:
+            timings.count('template_cache_hits')
+
+            return mark_quoted(cached['template'], cached['quoted'])
+
+    import yaml
+    from k8s_jobs.template import template_loader
+
+    with timings.phase('parse'):
+        config_template = yaml.load(data, Loader=template_loader)
+
+    try:
+        serialized = json.dumps({'template': config_template, 'quoted': list(quoted_paths(config_template))})
+    except (TypeError, ValueError):
+        # Templates with values that can't be stored as JSON (such as dates) are not cached
+        return config_template
+
+    cache.write_template(digest, serialized)
+    cached = json.loads(serialized)
+
+    return mark_quoted(cached['template'], cached['quoted'])
+
+
+def prepare_template(data, args, array=False):
+    """Parses a job yaml template and adds the sections required by the arguments, returning the template and the
+        values for its placeholders. The command of each container is replaced by a $(CMD_ARGS{i}) placeholder with
+        the full command as a list for its value. Templates for an array of jobs also label each job with its
+        $(ARRAY_INDEX)."""
+    validate = not getattr(args, 'skip_validation', False)
+
+    if validate:
+        from k8s_jobs.validate import validate_arguments
+
+        validate_arguments(args)
+
+    if getattr(args, 'pods_per_node', None):
+        from k8s_jobs.nodes import pack_requests
+
+        # Packed requests are shares of what the nodes can allocate, which already excludes the system's reservation
+        pack_requests(args)
+    else:
+        adjust_cpu_request(args)
     adjust_time(args)
 
     template_values = {template: getattr(args, attr) for attr, template in arg_templates.items()}
 
-    config_template = yaml.load(data)
+    config_template = load_template(data)
+    mutate_started = time.perf_counter()
 
     add_node_selectors(args, config_template)
+    add_job_metadata(args, config_template, data, array)
 
     # Ensure that the command and args are in the format ["command", "arg1", "arg2", ...]
     cmd_args = template_values['CMD_ARGS']
@@ -194,9 +444,7 @@ def convert_template_yaml(data, args):
                 config_template['spec']['template']['spec']['containers'][i]['command'] = '$({cmd_args_name})'.format(
                     cmd_args_name=cmd_args_name,
                 )
-                template_values[cmd_args_name] = json.dumps(new_command)
-
-        template_values['CMD_ARGS'] = json.dumps(cmd_args)
+                template_values[cmd_args_name] = new_command
 
     if template_values['ALLOW_PREEMPTIBLE']:
         spec_config = get_path(config_template, 'spec.template.spec')
@@ -224,8 +472,10 @@ def convert_template_yaml(data, args):
                                   'spec.template.spec.containers.{}.volumeMounts'.format(i),
                                   yaml_disk_mount_containers)
 
-    data = yaml.dump(config_template, default_flow_style=False)
-    lines = data.split('\n')
+    if getattr(args, 'script_hash', None):
+        from k8s_jobs.scripts import add_script_volume
+
+        add_script_volume(config_template, args.script_hash)
 
     template_values['VOLUME_READ_ONLY'] = 'true' if not template_values['VOLUME_READ_WRITE'] else None
 
@@ -235,9 +485,6 @@ def convert_template_yaml(data, args):
     if not template_values['JOB_NAME']:
         template_values['JOB_NAME'] = 'kjob'
 
-    if template_values['RETRY_LIMIT']:
-        verify_retry_limit_supported(template_values['RETRY_LIMIT'])
-
     if not template_values['MOUNT_PATH']:
         template_values['MOUNT_PATH'] = '/static'
 
@@ -259,36 +506,286 @@ def convert_template_yaml(data, args):
         else:
             template_values['CONTAINER_NAME'] = 'container-job'
 
-    for template, value in template_values.items():
-        lines = replace_template(lines, template, value)
+    timings.record('mutate', time.perf_counter() - mutate_started)
 
-    return '\n'.join(lines)
+    if validate:
+        from k8s_jobs.validate import validate_render
 
+        # Jobs Kubernetes would reject are not submitted, rather than failing every retry of kubectl create
+        with timings.phase('validate'):
+            if validate_render(config_template, template_values):
+                timings.count('validation_cache_hits')
 
-def generate_templated_yaml(args):
+    # Spooled jobs are checked by kspool drain instead, so that spooling them doesn't need the cluster
+    if template_values['RETRY_LIMIT'] and not getattr(args, 'spool', False):
+        # Arrays split between kube contexts (kbatch --contexts) are submitted to each of their clusters instead
+        for context in getattr(args, 'kube_contexts', None) or [None]:
+            verify_retry_limit_supported(template_values['RETRY_LIMIT'], context)
+
+    return config_template, template_values
+
+
+def convert_template_yaml(data, args, array=False):
+    config_template, template_values = prepare_template(data, args, array)
+
+    return dump_template_yaml(config_template, template_values)
+
+
+def dump_template_yaml(config_template, template_values):
+    """Writes a template prepared by prepare_template as yaml and substitutes the values of its placeholders."""
+    import yaml
+    from k8s_jobs.template import Template, yaml_dumper
+
+    with timings.phase('dump'):
+        data = yaml.dump(config_template, Dumper=yaml_dumper, default_flow_style=False)
+
+    # Lists such as commands are written in the yaml as JSON, which yaml parses as a list
+    text_values = {
+        template: json.dumps(value) if isinstance(value, list) and value else value
+        for template, value in template_values.items()
+    }
+
+    with timings.phase('substitute'):
+        return Template(data).render(text_values)
+
+
+def convert_template_object(data, args):
+    """Renders a job template to a job object by substituting the values of its placeholders directly into the parsed
+        template, which gives the same job as parsing the output of convert_template_yaml."""
+    from k8s_jobs.template import ObjectTemplate
+
+    config_template, template_values = prepare_template(data, args)
+
+    with timings.phase('substitute'):
+        return ObjectTemplate(config_template).render(template_values)
+
+
+def read_template_data(args):
     if args.file:
         with open(args.file) as f:
-            data = f.read()
+            return f.read()
 
-    else:
-        if not args.image:
-            raise RuntimeError('A pre-defined yaml file or docker image must be specified!')
+    if not args.image:
+        raise RuntimeError('A pre-defined yaml file or docker image must be specified!')
 
-        data = pkgutil.get_data('k8s_jobs.klib', 'default.yaml').decode('utf-8')
+    import pkgutil
 
-    data = convert_template_yaml(data, args)
+    return pkgutil.get_data('k8s_jobs.klib', 'default.yaml').decode('utf-8')
 
-    temp_yaml = tempfile.NamedTemporaryFile()
 
-    # Write the templated yaml to disk in a temporary file
-    temp_yaml.write(data.encode('utf-8'))
-    temp_yaml.flush()
-    os.fsync(temp_yaml.fileno())
+def render_job_yaml(args):
+    """Renders the job yaml for the given arguments and returns it as a string, without writing it to disk."""
+    return convert_template_yaml(read_template_data(args), args)
+
+
+def render_job(args):
+    """Renders the job for the given arguments and returns it as a dict, e.g. for KubernetesClient.create_job."""
+    return convert_template_object(read_template_data(args), args)
+
+
+def generate_templated_yaml(args):
+    import tempfile
+
+    data = render_job_yaml(args)
+
+    with timings.phase('write'):
+        temp_yaml = tempfile.NamedTemporaryFile()
+
+        # Write the templated yaml to disk in a temporary file
+        temp_yaml.write(data.encode('utf-8'))
+        temp_yaml.flush()
+        os.fsync(temp_yaml.fileno())
 
     return temp_yaml
 
 
+def load_params_file(path):
+    """Reads a tab-separated parameters file with a header row of substitution variable names,
+        returning one dict of values per row."""
+    with open(path) as f:
+        lines = [line.rstrip('\r\n') for line in f]
+
+    rows = [line.split('\t') for line in lines if line.strip()]
+
+    if not rows:
+        raise ValueError('Parameters file "{path}" is empty, expected a header row'.format(path=path))
+
+    header = rows[0]
+
+    for name in header:
+        if not template_name_matcher.match(name):
+            raise ValueError('Invalid column name "{name}" in "{path}", column names must be usable as $(NAME) '
+                             'substitution variables'.format(name=name, path=path))
+
+        if name in arg_templates.values() or name == ARRAY_INDEX_TEMPLATE:
+            raise ValueError('Column "{name}" in "{path}" is reserved for kbatch arguments'.format(
+                name=name,
+                path=path,
+            ))
+
+    params = []
+    for line_number, row in enumerate(rows[1:], start=2):
+        if len(row) != len(header):
+            raise ValueError('Line {line_number} of "{path}" has {n_values} values, expected {n_columns}'.format(
+                line_number=line_number,
+                path=path,
+                n_values=len(row),
+                n_columns=len(header),
+            ))
+
+        params.append(dict(zip(header, row)))
+
+    return params
+
+
+def array_template_values(array_size=None, params=None):
+    """Returns the per-job substitution variables for an array of jobs, either N jobs or one job per
+        parameter row, each with its $(ARRAY_INDEX)."""
+    if params is None:
+        params = [{} for _ in range(array_size or 0)]
+
+    return [dict(values, **{ARRAY_INDEX_TEMPLATE: str(i)}) for i, values in enumerate(params)]
+
+
+def render_array_manifests(args, index_values, render_mode='text'):
+    """Renders the job template once for the shared arguments, then substitutes each job's array variables
+        into the result. Manifests are yaml strings when render_mode is 'text', with each value escaped for where it
+        is in the yaml, or job objects when it is 'object'."""
+    from k8s_jobs.template import ObjectTemplate, Template
+
+    config_template, template_values = prepare_template(read_template_data(args), args, array=True)
+
+    if render_mode == 'object':
+        with timings.phase('substitute'):
+            template = ObjectTemplate(config_template)
+
+            return [template.render(dict(template_values, **values), inner_values=values) for values in index_values]
+
+    data = dump_template_yaml(config_template, template_values)
+    object_template = None
+    manifests = []
+
+    with timings.phase('substitute'):
+        template = Template(data)
+
+        for values in index_values:
+            manifest = template.render_escaped(values)
+
+            if manifest is None:
+                # A value that can't be escaped for where it is in the yaml (e.g. one with ": " in part of an unquoted
+                # string) is substituted into the job object instead, which is then written as JSON
+                if object_template is None:
+                    object_template = ObjectTemplate(config_template)
+
+                manifest = json.dumps(object_template.render(dict(template_values, **values), inner_values=values))
+
+            manifests.append(manifest)
+
+    return manifests
+
+
+def parse_created_job_names(output):
+    job_names = []
+    for line in output.splitlines():
+        created_job = created_job_matcher.match(line.strip())
+
+        if created_job:
+            job_names.append(created_job.group('name'))
+
+    return job_names
+
+
+def run_kubectl_create(kubectl_args, n_manifests, input_data=None):
+    with timings.phase('submit'):
+        process = sp.Popen(['kubectl', 'create'] + kubectl_args, stdin=sp.PIPE if input_data else None,
+                           stdout=sp.PIPE, stderr=sp.PIPE)
+        output, errors = process.communicate(input_data)
+    job_names = parse_created_job_names(output.decode('utf-8'))
+    errors = (errors or b'').decode('utf-8', 'replace')
+
+    if errors:
+        sys.stderr.write(errors)
+
+    if process.returncode:
+        if job_names:
+            # Retrying would submit the jobs that were already created a second time
+            raise PartialSubmissionError(job_names, n_manifests)
+
+        if rejected_manifest_matcher.search(errors):
+            raise RejectedManifestError(errors)
+
+        raise sp.CalledProcessError(process.returncode, ' '.join(['kubectl', 'create'] + kubectl_args))
+
+    return job_names
+
+
+def submit_manifests(manifests, context=None):
+    """Creates all of the given job manifests (yaml strings or job objects) with a single `kubectl create` call,
+        passing them as one multi-document stream on stdin, and returns the names of the created jobs. The jobs are
+        created in the given kube context, or by default the current one."""
+    documents = [manifest if isinstance(manifest, str) else json.dumps(manifest) + '\n' for manifest in manifests]
+    context_args = ['--context', context] if context else []
+
+    return run_kubectl_create(context_args + ['-f', '-'], len(manifests), '---\n'.join(documents).encode('utf-8'))
+
+
+def submit_manifest_file(path):
+    """Creates the job(s) in a yaml file with `kubectl create` and returns the names of the created jobs."""
+    return run_kubectl_create(['-f', path], 1)
+
+
+def submit_manifests_api(client, manifests):
+    """Creates the given job manifests (yaml strings or job objects) through the Kubernetes API with a
+        KubernetesClient and returns the names of the created jobs."""
+    import yaml
+    from k8s_jobs.template import yaml_loader
+
+    job_names = []
+    for manifest in manifests:
+        try:
+            if isinstance(manifest, str):
+                with timings.phase('parse'):
+                    manifest = yaml.load(manifest, Loader=yaml_loader)
+
+            with timings.phase('submit'):
+                job = client.create_job(manifest)
+        except Exception as e:
+            if job_names:
+                raise PartialSubmissionError(job_names, len(manifests)) from e
+
+            raise
+
+        job_names.append(job['metadata']['name'])
+
+    return job_names
+
+
+class NonRetryableError(RuntimeError):
+    """An error that would not be fixed by trying again, which run_with_retries raises immediately."""
+
+
+class PartialSubmissionError(NonRetryableError):
+    def __init__(self, job_names, n_manifests):
+        super(PartialSubmissionError, self).__init__(
+            'Only {n_created} of {n_manifests} jobs were created: {job_names}'.format(
+                n_created=len(job_names),
+                n_manifests=n_manifests,
+                job_names=', '.join(job_names),
+            ))
+        self.job_names = job_names
+
+
+class RejectedManifestError(NonRetryableError):
+    def __init__(self, errors):
+        super(RejectedManifestError, self).__init__('kubectl create rejected the jobs: {error}'.format(
+            error=errors.strip().splitlines()[0] if errors.strip() else 'unknown error',
+        ))
+        self.errors = errors
+
+
 def random_string(size):
+    import random
+
     return ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(size))
 
 
@@ -363,9 +860,12 @@ def run_with_retries(n_tries, show_errors=True):
             for retry in range(n_tries):
                 try:
                     return func(*args, **kwargs)
+                except NonRetryableError:
+                    raise
                 except Exception as e:
                     if show_errors:
                         print('Caught exception and retrying: {}'.format(e), file=sys.stderr)
+                    timings.count('retries')
                     err = e
                     time.sleep(1 + 2 * retry)
 
@@ -0,0 +1,67 @@
+import os
+
+
+def kubeconfig_paths():
+    """Returns the kubeconfig files kubectl would use, from $KUBECONFIG or the default of ~/.kube/config."""
+    if os.environ.get('KUBECONFIG'):
+        return [path for path in os.environ['KUBECONFIG'].split(os.pathsep) if path]
+
+    return [os.path.join(os.path.expanduser('~'), '.kube', 'config')]
+
+
+def load_kubeconfig(paths=None):
+    """Loads and merges kubeconfig files the same way kubectl does: the first file to set a value or define a named
+        cluster, context or user wins. Missing files are skipped."""
+    import yaml
+
+    config = {'clusters': [], 'contexts': [], 'users': [], 'current-context': None}
+    seen_names = {'clusters': set(), 'contexts': set(), 'users': set()}
+
+    for path in paths if paths is not None else kubeconfig_paths():
+        if not os.path.exists(path):
+            continue
+
+        with open(path) as f:
+            file_config = yaml.load(f.read(), Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)) or {}
+
+        if not config['current-context']:
+            config['current-context'] = file_config.get('current-context')
+
+        for section, names in seen_names.items():
+            for entry in file_config.get(section) or []:
+                if entry.get('name') not in names:
+                    names.add(entry.get('name'))
+                    config[section].append(entry)
+
+    return config
+
+
+def get_named(config, section, name):
+    for entry in config.get(section) or []:
+        if entry.get('name') == name:
+            return entry.get(section[:-1]) or {}
+
+    return None
+
+
+def current_context_key(config=None):
+    """Returns a key identifying the current context and the API server it points to, or None if there is no
+        current context."""
+    return context_key(None, config)
+
+
+def context_key(context_name, config=None):
+    """Returns a key identifying a context (by default the current one) and the API server it points to, or None if
+        there is no such context."""
+    if config is None:
+        config = load_kubeconfig()
+
+    context_name = context_name or config.get('current-context')
+
+    if not context_name:
+        return None
+
+    context = get_named(config, 'contexts', context_name) or {}
+    cluster = get_named(config, 'clusters', context.get('cluster')) or {}
+
+    return '{context_name}@{server}'.format(context_name=context_name, server=cluster.get('server', ''))
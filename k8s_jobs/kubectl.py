@@ -0,0 +1,44 @@
+import argparse
+import os
+import sys
+
+
+class KubectlArguments(Exception):
+    """The arguments of a script are not ones it handles, so they are for the kubectl command it wraps."""
+
+
+class KubectlArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise KubectlArguments(message)
+
+
+def run_kubectl(kubectl_args):
+    """Replaces the process with kubectl, so that its output and exit status are the script's."""
+    try:
+        os.execvp('kubectl', ['kubectl'] + kubectl_args)
+    except OSError as e:
+        print('Could not run kubectl {args}: {error}'.format(args=' '.join(kubectl_args), error=e), file=sys.stderr)
+        sys.exit(1)
+
+
+def parse_args_or_run_kubectl(argument_parser, kubectl_command, is_kubectl_args=None, argv=None):
+    """Parses the arguments of a script that used to be a wrapper of a kubectl command (e.g. ['get', 'pods']), and
+        returns its parser and parsed arguments. Arguments the script doesn't handle, or that is_kubectl_args returns
+        True for once parsed (e.g. without any job names), are passed to the kubectl command instead, as before.
+
+        argument_parser is called with the class of the parser to build, so that the same arguments can be parsed
+        without exiting on errors first."""
+    argv = sys.argv[1:] if argv is None else argv
+
+    try:
+        args, unknown_args = argument_parser(KubectlArgumentParser).parse_known_args(argv)
+        for_kubectl = bool(unknown_args) or bool(is_kubectl_args and is_kubectl_args(args))
+    except KubectlArguments:
+        for_kubectl = True
+
+    if for_kubectl:
+        run_kubectl(kubectl_command + argv)
+
+    parser = argument_parser(argparse.ArgumentParser)
+
+    return parser, parser.parse_args(argv)
@@ -0,0 +1,225 @@
+import calendar
+import itertools
+import json
+import time
+
+
+JOB_COLUMNS = ['NAME', 'STATE', 'COMPLETIONS', 'AGE']
+POD_COLUMNS = ['NAME', 'STATUS', 'RESTARTS', 'NODE', 'AGE']
+
+OUTPUT_FORMATS = ['table', 'tsv', 'jsonl', 'name']
+
+# The states of k8s_jobs.watch, which imports the API client so isn't imported until jobs are listed
+JOB_STATES = ['Pending', 'Running', 'Complete', 'Failed']
+POD_PHASES = ['Pending', 'Running', 'Succeeded', 'Failed', 'Unknown']
+
+# How many rows of a table are used to choose the width of its columns, the rest are printed as they are listed
+TABLE_WIDTH_ROWS = 100
+
+
+def collection_path(client, kind, namespace=None, all_namespaces=False):
+    """Returns the API path of the jobs or pods in a namespace (by default the client's namespace), or in all
+        namespaces."""
+    api_path = '/apis/batch/v1' if kind == 'jobs' else '/api/v1'
+
+    if all_namespaces:
+        return '{api_path}/{kind}'.format(api_path=api_path, kind=kind)
+
+    return '{api_path}/namespaces/{namespace}/{kind}'.format(
+        api_path=api_path,
+        namespace=namespace or client.namespace,
+        kind=kind,
+    )
+
+
+def parse_timestamp(value):
+    return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%SZ'))
+
+
+def age_seconds(obj, now=None):
+    created = obj['metadata'].get('creationTimestamp')
+
+    if not created:
+        return None
+
+    return (now if now is not None else time.time()) - parse_timestamp(created)
+
+
+def format_age(seconds):
+    if seconds is None:
+        return '<unknown>'
+
+    for unit, unit_seconds in [('d', 86400), ('h', 3600), ('m', 60)]:
+        if seconds >= 2 * unit_seconds:
+            return '{n}{unit}'.format(n=int(seconds // unit_seconds), unit=unit)
+
+    return '{n}s'.format(n=max(int(seconds), 0))
+
+
+def join_selectors(*selectors):
+    return ','.join(selector for selector in selectors if selector) or None
+
+
+def filter_age(items, older_than=None, newer_than=None, now=None):
+    """Yields the items created more than older_than and less than newer_than seconds ago."""
+    for item in items:
+        age = age_seconds(item, now)
+
+        if older_than is not None and (age is None or age < older_than):
+            continue
+
+        if newer_than is not None and (age is None or age > newer_than):
+            continue
+
+        yield item
+
+
+def iter_jobs(client, namespace=None, all_namespaces=False, label_selector=None, field_selector=None, state=None,
+              older_than=None, newer_than=None, limit=500, now=None):
+    """Yields the jobs matching the filters, listing them a page at a time. Selectors are applied by the API server,
+        the state (which Kubernetes can't select jobs by) and age are filtered as each page arrives."""
+    from k8s_jobs.watch import job_state
+
+    path = collection_path(client, 'jobs', namespace, all_namespaces)
+    jobs = client.iter_items(path, {'labelSelector': label_selector, 'fieldSelector': field_selector}, limit)
+
+    if state:
+        jobs = (job for job in jobs if job_state(job) == state)
+
+    return filter_age(jobs, older_than, newer_than, now)
+
+
+def iter_pods(client, namespace=None, all_namespaces=False, label_selector=None, field_selector=None, state=None,
+              older_than=None, newer_than=None, limit=500, now=None):
+    """Yields the pods matching the filters, listing them a page at a time. Selectors and the state (the phase of the
+        pod) are applied by the API server, the age is filtered as each page arrives."""
+    path = collection_path(client, 'pods', namespace, all_namespaces)
+    field_selector = join_selectors(field_selector, 'status.phase={state}'.format(state=state) if state else None)
+    pods = client.iter_items(path, {'labelSelector': label_selector, 'fieldSelector': field_selector}, limit)
+
+    return filter_age(pods, older_than, newer_than, now)
+
+
+def job_row(job, now=None):
+    from k8s_jobs.watch import job_state
+
+    status = job.get('status') or {}
+
+    return [
+        job['metadata']['name'],
+        job_state(job),
+        '{succeeded}/{completions}'.format(succeeded=status.get('succeeded') or 0,
+                                           completions=(job.get('spec') or {}).get('completions') or 1),
+        format_age(age_seconds(job, now)),
+    ]
+
+
+def pod_status(pod):
+    """Returns the phase of a pod, or why its containers are waiting (such as ContainerCreating or CrashLoopBackOff)."""
+    status = pod.get('status') or {}
+
+    for container_status in status.get('containerStatuses') or []:
+        waiting = (container_status.get('state') or {}).get('waiting')
+
+        if waiting and waiting.get('reason'):
+            return waiting['reason']
+
+    return status.get('phase') or 'Unknown'
+
+
+def pod_row(pod, now=None):
+    status = pod.get('status') or {}
+
+    return [
+        pod['metadata']['name'],
+        pod_status(pod),
+        str(sum(container_status.get('restartCount') or 0
+                for container_status in status.get('containerStatuses') or [])),
+        (pod.get('spec') or {}).get('nodeName') or '<none>',
+        format_age(age_seconds(pod, now)),
+    ]
+
+
+def write_items(items, row, columns, write, output='table', headers=True, namespace_column=False):
+    """Writes each item as it is listed, as a row of columns (a table or tab-separated), a JSON line or its name."""
+    if output == 'jsonl':
+        for item in items:
+            write(json.dumps(item, separators=(',', ':')))
+        return
+
+    if output == 'name':
+        for item in items:
+            write(item['metadata']['name'])
+        return
+
+    def item_row(item):
+        values = row(item)
+        return [item['metadata'].get('namespace') or ''] + values if namespace_column else values
+
+    columns = ['NAMESPACE'] + columns if namespace_column else columns
+    rows = (item_row(item) for item in items)
+
+    if output == 'tsv':
+        for values in itertools.chain([columns] if headers else [], rows):
+            write('\t'.join(values))
+        return
+
+    # The column widths of a table are chosen from its first rows, so the rest can be printed without waiting for them
+    first_rows = list(itertools.islice(rows, TABLE_WIDTH_ROWS))
+    widths = [max(len(values[i]) for values in [columns] + first_rows) for i in range(len(columns))]
+
+    for values in itertools.chain([columns] if headers else [], first_rows, rows):
+        write('   '.join(value.ljust(width) for value, width in zip(values, widths)).rstrip())
+
+
+def add_arguments(parser, states):
+    """Adds the arguments shared by klist and kpods to their argument parser."""
+    parser.add_argument('--selector', '-l', help='Only list those matching this label selector, e.g. "app=align"')
+    parser.add_argument('--field-selector', help='Only list those matching this field selector, e.g. '
+                                                 '"metadata.name=kjob-abcde"')
+    parser.add_argument('--state', choices=states, help='Only list those in this state')
+    parser.add_argument('--older-than', help='Only list those created longer ago than a duration, e.g. 30m or 2h')
+    parser.add_argument('--newer-than', help='Only list those created less than a duration ago, e.g. 30m or 2h')
+    parser.add_argument('--namespace', help='Namespace to list (default is the namespace of the current context)')
+    parser.add_argument('--all-namespaces', '-A', action='store_true', help='List all namespaces')
+    parser.add_argument('--output', '-o', choices=OUTPUT_FORMATS, default='table',
+                        help='Output as an aligned table, tab-separated rows, one JSON object per line or only names '
+                             '(default is table)')
+    parser.add_argument('--no-headers', action='store_true', help='Do not print a header row for table and tsv output')
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='Maximum number of items to list per request to the API server (default is 500)')
+
+
+def run(parser, args, kind):
+    """Lists the jobs or pods for the parsed arguments of klist or kpods, printing them as they are listed."""
+    from k8s_jobs.api import KubernetesClient
+    from k8s_jobs.logs import parse_duration
+
+    try:
+        older_than = parse_duration(args.older_than) if args.older_than else None
+        newer_than = parse_duration(args.newer_than) if args.newer_than else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1')
+
+    if kind == 'jobs':
+        list_items, row, columns = iter_jobs, job_row, JOB_COLUMNS
+    else:
+        list_items, row, columns = iter_pods, pod_row, POD_COLUMNS
+    now = time.time()
+
+    items = list_items(KubernetesClient.from_kubeconfig(),
+                       namespace=args.namespace,
+                       all_namespaces=args.all_namespaces,
+                       label_selector=args.selector,
+                       field_selector=args.field_selector,
+                       state=args.state,
+                       older_than=older_than,
+                       newer_than=newer_than,
+                       limit=args.chunk_size,
+                       now=now)
+
+    write_items(items, lambda item: row(item, now), columns, print, output=args.output,
+                headers=not args.no_headers, namespace_column=args.all_namespaces)
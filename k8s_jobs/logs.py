@@ -0,0 +1,143 @@
+import queue
+import re
+import threading
+
+
+duration_matcher = re.compile(r'^(?:(?P<hours>[0-9]+)h)?(?:(?P<minutes>[0-9]+)m)?(?:(?P<seconds>[0-9]+)s)?$')
+
+# How many log lines are buffered between the streams and the output, which bounds memory use when the output is
+# slower than the pods are logging
+LOG_QUEUE_SIZE = 1000
+
+# How many pods logs are streamed from at once
+MAX_CONCURRENT_STREAMS = 32
+
+
+def parse_duration(value):
+    """Parses a duration such as 30s, 5m or 1h30m (as used by kubectl) to a number of seconds."""
+    match = duration_matcher.match(value or '')
+
+    if not value or not match:
+        raise ValueError('Invalid duration "{value}", expected e.g. 30s, 5m or 1h30m'.format(value=value))
+
+    hours, minutes, seconds = (int(match.group(unit) or 0) for unit in ('hours', 'minutes', 'seconds'))
+
+    return 3600 * hours + 60 * minutes + seconds
+
+
+def job_selector(job_names):
+    """Returns the label selector for the pods of the given jobs, which Kubernetes labels with their job-name."""
+    if len(job_names) == 1:
+        return 'job-name={job_name}'.format(job_name=job_names[0])
+
+    return 'job-name in ({job_names})'.format(job_names=','.join(job_names))
+
+
+def find_pods(client, job_names, namespace=None, label_selector=None):
+    """Returns the pods of the given jobs, or of all jobs if none are given, that match the label selector. The pods
+        are found with a label selector so that only those pods are listed, and are in the order of the jobs and then
+        of when the pods were created."""
+    selectors = [job_selector(job_names) if job_names else None, label_selector]
+    label_selector = ','.join(selector for selector in selectors if selector)
+
+    pods = []
+    for page in client.list_pages(client.pods_path(namespace), {'labelSelector': label_selector}):
+        pods.extend(page.get('items') or [])
+
+    job_names = job_names or []
+
+    def order(pod):
+        job_name = pod['metadata'].get('labels', {}).get('job-name') or ''
+        job_order = job_names.index(job_name) if job_name in job_names else len(job_names)
+
+        # Pods of jobs that weren't named (e.g. found by the selector alone) are ordered by the name of their job
+        return job_order, job_name, pod['metadata'].get('creationTimestamp') or '', pod['metadata']['name']
+
+    return sorted(pods, key=order)
+
+
+class LogStreamer(object):
+    """Streams the logs of many pods at once, with max_concurrent worker threads each reading one pod's log at a time
+        into a bounded queue that the lines are written from, so lines from different pods are interleaved as they
+        arrive.
+
+        Only the lines asked for (e.g. with since_seconds or tail_lines) are sent by the API server, and at most
+        queue_size lines are held in memory at a time. Followed logs only end with their pod, so following more pods
+        than max_concurrent is a ValueError rather than leaving some of them unshown.
+    """
+
+    def __init__(self, client, pods, namespace=None, container=None, follow=False, since_seconds=None,
+                 tail_lines=None, timestamps=False, prefix=True, max_concurrent=MAX_CONCURRENT_STREAMS,
+                 queue_size=LOG_QUEUE_SIZE):
+        if max_concurrent < 1:
+            raise ValueError('The maximum number of concurrent streams must be at least 1')
+
+        if follow and len(pods) > max_concurrent:
+            raise ValueError('Following the logs of {n} pods needs a maximum of at least {n} concurrent streams, not '
+                             '{max_concurrent}'.format(n=len(pods), max_concurrent=max_concurrent))
+
+        self.client = client
+        self.pods = pods
+        self.namespace = namespace
+        self.query = {
+            'container': container,
+            'follow': 'true' if follow else None,
+            'sinceSeconds': since_seconds,
+            'tailLines': tail_lines,
+            'timestamps': 'true' if timestamps else None,
+        }
+        self.prefix = prefix
+        self.max_concurrent = max_concurrent
+        self.lines = queue.Queue(queue_size)
+        self.errors = []
+
+    def log_path(self, pod):
+        return '{pods_path}/{name}/log'.format(
+            pods_path=self.client.pods_path(self.namespace or pod['metadata'].get('namespace')),
+            name=pod['metadata']['name'],
+        )
+
+    def stream_pod(self, pod):
+        name = pod['metadata']['name']
+        prefix = '[{name}] '.format(name=name) if self.prefix else ''
+
+        try:
+            for line in self.client.stream_lines(self.log_path(pod), self.query):
+                self.lines.put(prefix + line.decode('utf-8', 'replace').rstrip('\n'))
+        except Exception as e:
+            self.errors.append((name, e))
+        finally:
+            # Tells the writer that this pod's log has ended
+            self.lines.put(None)
+
+    def stream_pods(self, pods):
+        """Streams the logs of pods from a queue one after the other, until the queue is empty."""
+        while True:
+            try:
+                pod = pods.get_nowait()
+            except queue.Empty:
+                return
+
+            self.stream_pod(pod)
+
+    def run(self, write):
+        """Streams the logs of all of the pods, calling write with each line, until all of the logs end."""
+        pods = queue.Queue()
+        for pod in self.pods:
+            pods.put(pod)
+
+        for _ in range(min(self.max_concurrent, len(self.pods))):
+            thread = threading.Thread(target=self.stream_pods, args=(pods,))
+            thread.daemon = True
+            thread.start()
+
+        n_streaming = len(self.pods)
+        while n_streaming:
+            line = self.lines.get()
+
+            if line is None:
+                n_streaming -= 1
+            else:
+                write(line)
+
+        return self.errors
@@ -0,0 +1,175 @@
+from k8s_jobs import cache, kubeconfig
+from k8s_jobs.klib import node_selector_labels
+from k8s_jobs.quantity import format_bytes, format_cpu, to_bytes, to_millicpus
+from k8s_jobs.validate import ValidationError
+
+
+# The resources requests are packed for: the request and limit arguments, their option and the resource
+PACKED_RESOURCES = [
+    ('cpu', 'cpu_limit', '--cpu', 'cpu'),
+    ('memory', 'memory_limit', '--memory', 'memory'),
+    ('disk', 'disk_limit', '--disk', 'ephemeral-storage'),
+]
+RESOURCES = [resource for _, _, _, resource in PACKED_RESOURCES]
+
+# Packed requests are rounded down to a multiple of these, in millicpus and bytes
+GRANULARITY = {
+    'cpu': 10,
+    'memory': 2 ** 20,
+    'ephemeral-storage': 2 ** 20,
+}
+
+
+def resource_amount(resource, value):
+    """Returns a quantity of a resource as a whole number, of millicpus for CPU and of bytes otherwise."""
+    return to_millicpus(value) if resource == 'cpu' else to_bytes(value)
+
+
+def format_amount(resource, amount):
+    return format_cpu(amount) if resource == 'cpu' else format_bytes(amount)
+
+
+def is_daemon_pod(pod):
+    return any(owner.get('kind') == 'DaemonSet' for owner in pod['metadata'].get('ownerReferences') or [])
+
+
+def pod_requests(pod):
+    requests = {}
+
+    for container in (pod.get('spec') or {}).get('containers') or []:
+        for resource, value in ((container.get('resources') or {}).get('requests') or {}).items():
+            if resource in RESOURCES:
+                requests[resource] = requests.get(resource, 0) + resource_amount(resource, value)
+
+    return requests
+
+
+def node_allocatable(node):
+    allocatable = (node.get('status') or {}).get('allocatable') or {}
+
+    return {resource: resource_amount(resource, allocatable.get(resource, 0)) for resource in RESOURCES}
+
+
+def node_shape(client, label_selector=None):
+    """Returns the resources that pods can request on the smallest schedulable node matching the label selector: its
+        allocatable CPU (in millicpus), memory and ephemeral storage (in bytes), less the requests of the DaemonSet pods
+        running on it, since those run on every node."""
+    nodes = [node for node in client.iter_items('/api/v1/nodes', {'labelSelector': label_selector or None})
+             if not (node.get('spec') or {}).get('unschedulable')]
+
+    if not nodes:
+        raise ValidationError(['--pods-per-node: no schedulable nodes match the node selector "{selector}"'.format(
+            selector=label_selector or '',
+        )])
+
+    node = min(nodes, key=lambda node: (node_allocatable(node)['cpu'], node_allocatable(node)['memory']))
+    shape = node_allocatable(node)
+
+    field_selector = 'spec.nodeName={name},status.phase!=Succeeded,status.phase!=Failed'.format(
+        name=node['metadata']['name'],
+    )
+
+    for pod in client.iter_items('/api/v1/pods', {'fieldSelector': field_selector}):
+        if is_daemon_pod(pod):
+            for resource, amount in pod_requests(pod).items():
+                shape[resource] -= amount
+
+    shape['node'] = node['metadata']['name']
+
+    return shape
+
+
+def free_slots(client, requests, label_selector=None):
+    """Returns how many more pods with the given requests (in millicpus and bytes) fit on the schedulable nodes matching
+        the label selector, from the allocatable resources of each node less the requests of the pods on it. Pods
+        waiting to be scheduled will take some of those first, so they are subtracted. Without any requests, the free
+        millicpus are returned instead."""
+    free_by_node = {node['metadata']['name']: node_allocatable(node)
+                    for node in client.iter_items('/api/v1/nodes', {'labelSelector': label_selector or None})
+                    if not (node.get('spec') or {}).get('unschedulable')}
+    n_unscheduled = 0
+
+    for pod in client.iter_items('/api/v1/pods', {'fieldSelector': 'status.phase!=Succeeded,status.phase!=Failed'}):
+        node_name = (pod.get('spec') or {}).get('nodeName')
+
+        if not node_name:
+            n_unscheduled += 1
+        elif node_name in free_by_node:
+            for resource, amount in pod_requests(pod).items():
+                free_by_node[node_name][resource] -= amount
+
+    requests = {resource: amount for resource, amount in requests.items() if amount > 0}
+
+    if not requests:
+        return sum(max(free['cpu'], 0) for free in free_by_node.values())
+
+    slots = sum(min(max(free[resource], 0) // amount for resource, amount in requests.items())
+                for free in free_by_node.values())
+
+    return max(slots - n_unscheduled, 0)
+
+
+def cached_node_shape(label_selector, client=None):
+    """Returns the node_shape for a node selector, which is cached for each kube context like its version. The client
+        is only needed (and by default created from the kubeconfig) when the shape is not cached."""
+    context_key = kubeconfig.current_context_key()
+    capabilities = cache.read_cluster_capabilities(context_key) if context_key else None
+    node_shapes = (capabilities or {}).get('node_shapes') or {}
+
+    if label_selector in node_shapes:
+        return node_shapes[label_selector]
+
+    if client is None:
+        from k8s_jobs.api import KubernetesClient
+
+        client = KubernetesClient.from_kubeconfig()
+
+    shape = node_shape(client, label_selector)
+
+    if context_key:
+        node_shapes = dict(node_shapes, **{label_selector: shape})
+        cache.write_cluster_capabilities(context_key, dict(capabilities or {}, node_shapes=node_shapes))
+
+    return shape
+
+
+def pack_requests(args, client=None):
+    """Sets the requests of the arguments to an equal share of the smallest node the job can be scheduled on (from its
+        node selector), so that args.pods_per_node of its pods fit on each node. Requests that fit in the share are
+        raised to it so that no part of the node is left unused, lower limits cap it, and requests that don't fit are
+        a ValidationError. Disk is only packed when --disk is given, since jobs often use persistent disks instead."""
+    label_selector = ','.join('{key}={value}'.format(key=key, value=value)
+                              for key, value in sorted(node_selector_labels(args).items()))
+    shape = cached_node_shape(label_selector, client)
+    problems = []
+
+    for attr, limit_attr, option, resource in PACKED_RESOURCES:
+        request = getattr(args, attr)
+        limit = getattr(args, limit_attr)
+
+        if resource == 'ephemeral-storage' and not request:
+            continue
+
+        share = shape[resource] // args.pods_per_node // GRANULARITY[resource] * GRANULARITY[resource]
+
+        if share <= 0:
+            problems.append('{option}: {n} pods do not fit on node {node}'.format(
+                option=option,
+                n=args.pods_per_node,
+                node=shape['node'],
+            ))
+            continue
+
+        if request and '$(' not in request and resource_amount(resource, request) > share:
+            problems.append('{option}: "{request}" is more than {share}, the share of each of {n} pods of node '
+                            '{node}'.format(option=option, request=request, share=format_amount(resource, share),
+                                            n=args.pods_per_node, node=shape['node']))
+            continue
+
+        if limit and '$(' not in limit:
+            share = min(share, resource_amount(resource, limit))
+
+        setattr(args, attr, format_amount(resource, share))
+
+    if problems:
+        raise ValidationError(problems)
@@ -0,0 +1,76 @@
+import decimal
+import re
+
+
+# A Kubernetes resource quantity: a number with an optional binary (Ki, Mi, ...) or decimal (m, k, M, ...) suffix, or
+# an exponent, e.g. 100m, 1.5, 128Mi or 1e6
+quantity_matcher = re.compile(r'^(?P<number>[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+))'
+                              r'(?:[eE](?P<exponent>[+-]?[0-9]+)|(?P<suffix>Ki|Mi|Gi|Ti|Pi|Ei|n|u|m|k|M|G|T|P|E))?$')
+
+SUFFIX_MULTIPLIERS = {
+    '': decimal.Decimal(1),
+    'n': decimal.Decimal('1e-9'),
+    'u': decimal.Decimal('1e-6'),
+    'm': decimal.Decimal('1e-3'),
+    'k': decimal.Decimal('1e3'),
+    'M': decimal.Decimal('1e6'),
+    'G': decimal.Decimal('1e9'),
+    'T': decimal.Decimal('1e12'),
+    'P': decimal.Decimal('1e15'),
+    'E': decimal.Decimal('1e18'),
+    'Ki': decimal.Decimal(2 ** 10),
+    'Mi': decimal.Decimal(2 ** 20),
+    'Gi': decimal.Decimal(2 ** 30),
+    'Ti': decimal.Decimal(2 ** 40),
+    'Pi': decimal.Decimal(2 ** 50),
+    'Ei': decimal.Decimal(2 ** 60),
+}
+
+
+def parse_quantity(value):
+    """Returns the value of a Kubernetes resource quantity (a string such as 100m or 128Mi, or a number) as a Decimal,
+        raising ValueError if it is not a valid quantity."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('"{value}" is not a valid quantity'.format(value=value))
+
+    quantity = quantity_matcher.match(str(value).strip())
+
+    if not quantity:
+        raise ValueError('"{value}" is not a valid quantity, expected a number with an optional suffix such as m, '
+                         'Mi or Gi, e.g. 100m or 128Mi'.format(value=value))
+
+    number = decimal.Decimal(quantity.group('number'))
+
+    if quantity.group('exponent'):
+        return number.scaleb(int(quantity.group('exponent')))
+
+    return number * SUFFIX_MULTIPLIERS[quantity.group('suffix') or '']
+
+
+def to_millicpus(value):
+    """Returns a CPU quantity as a whole number of millicpus, rounded up as Kubernetes does, e.g. 1.5 is 1500."""
+    return int((parse_quantity(value) * 1000).to_integral_value(rounding=decimal.ROUND_CEILING))
+
+
+def to_bytes(value):
+    """Returns a memory or disk quantity as a whole number of bytes, rounded up, e.g. 1Ki is 1024."""
+    return int(parse_quantity(value).to_integral_value(rounding=decimal.ROUND_CEILING))
+
+
+def format_cpu(millicpus, milli=True):
+    """Returns a number of millicpus as a CPU quantity, in millicpus (e.g. 1500m) or in CPUs (e.g. 1.5)."""
+    if milli:
+        return '{millicpus}m'.format(millicpus=millicpus)
+
+    return '{cpus:f}'.format(cpus=(decimal.Decimal(millicpus) / 1000).normalize())
+
+
+def format_bytes(n_bytes):
+    """Returns a number of bytes as a quantity with the largest binary suffix that represents it exactly, e.g. 16Gi."""
+    for suffix in ['Ei', 'Pi', 'Ti', 'Gi', 'Mi', 'Ki']:
+        multiplier = int(SUFFIX_MULTIPLIERS[suffix])
+
+        if n_bytes and n_bytes % multiplier == 0:
+            return '{n}{suffix}'.format(n=n_bytes // multiplier, suffix=suffix)
+
+    return str(n_bytes)
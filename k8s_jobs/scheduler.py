@@ -0,0 +1,197 @@
+import asyncio
+import concurrent.futures
+import random
+import time
+
+from k8s_jobs.klib import NonRetryableError
+
+
+class TokenBucket(object):
+    """Limits how often something happens to rate times per second on average, with bursts of up to burst times."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def reserve(self):
+        """Takes a token and returns how many seconds to wait before using it. Tokens can be reserved before they are
+            available, so waiting callers are served in order."""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+
+        return max(0.0, -self.tokens / self.rate)
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """Exponential backoff with full jitter: a random delay of up to base_delay * 2^attempt, capped at max_delay."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def is_retryable(error):
+    return not isinstance(error, NonRetryableError)
+
+
+class SubmissionResult(object):
+    def __init__(self, index, item, value=None, error=None, attempts=0):
+        self.index = index
+        self.item = item
+        self.value = value
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BatchSummary(object):
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def retries(self):
+        return sum(max(result.attempts - 1, 0) for result in self.results)
+
+    def report(self, unit='items', size=None, describe=None):
+        """Returns a readable summary of the batch. size counts how many units an item is (e.g. a chunk of jobs), and
+            describe names a failed SubmissionResult (by default, its index)."""
+        size = size or (lambda item: 1)
+        describe = describe or (lambda result: str(result.index))
+
+        n_items = sum(size(result.item) for result in self.results)
+        n_succeeded = sum(size(result.item) for result in self.succeeded)
+
+        lines = ['Submitted {n_succeeded} of {n_items} {unit} in {elapsed:.1f}s ({rate:.1f}/s) with {retries} retries, '
+                 '{n_failed} failed'.format(
+                     n_succeeded=n_succeeded,
+                     n_items=n_items,
+                     unit=unit,
+                     elapsed=self.elapsed,
+                     rate=n_succeeded / self.elapsed if self.elapsed else 0.0,
+                     retries=self.retries,
+                     n_failed=n_items - n_succeeded,
+                 )]
+
+        for result in self.failed:
+            lines.append('  {name}: failed after {attempts} attempt(s): {error}'.format(
+                name=describe(result),
+                attempts=result.attempts,
+                error=result.error,
+            ))
+
+        return '\n'.join(lines)
+
+
+class SubmissionScheduler(object):
+    """Submits items concurrently with asyncio, with at most `concurrency` submissions in flight and at most `rate`
+        submissions started per second (if given).
+
+        Each item is retried up to max_attempts times with jittered exponential backoff, unless its error is not
+        retryable. An error with a `retry_after` attribute (such as an ApiError for a 429 response) pauses all new
+        submissions for that many seconds, since it means the API server is throttling requests. Items that still
+        fail are reported in the BatchSummary instead of stopping the batch.
+
+        submit is called with each item and may be a regular function, which is run in a thread, or a coroutine
+        function.
+    """
+
+    def __init__(self, submit, concurrency=8, rate=None, burst=None, max_attempts=10, base_delay=1.0, max_delay=60.0,
+                 on_result=None):
+        self.submit = submit
+        self.concurrency = concurrency
+        self.token_bucket = TokenBucket(rate, burst) if rate else None
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_result = on_result
+        self.sleep = asyncio.sleep
+        self.paused_until = 0.0
+
+    async def wait_for_turn(self):
+        if self.token_bucket:
+            await self.sleep(self.token_bucket.reserve())
+
+        while time.monotonic() < self.paused_until:
+            await self.sleep(self.paused_until - time.monotonic())
+
+    async def submit_item(self, loop, executor, index, item):
+        result = SubmissionResult(index, item)
+
+        while True:
+            await self.wait_for_turn()
+            result.attempts += 1
+
+            try:
+                if asyncio.iscoroutinefunction(self.submit):
+                    result.value = await self.submit(item)
+                else:
+                    result.value = await loop.run_in_executor(executor, self.submit, item)
+
+                result.error = None
+                return result
+            except Exception as e:
+                result.error = e
+
+            if not is_retryable(result.error) or result.attempts >= self.max_attempts:
+                return result
+
+            delay = backoff_delay(result.attempts - 1, self.base_delay, self.max_delay)
+            retry_after = getattr(result.error, 'retry_after', None)
+
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                delay = max(delay, retry_after)
+
+            await self.sleep(delay)
+
+    async def worker(self, loop, executor, queue, results):
+        while not queue.empty():
+            index, item = queue.get_nowait()
+            result = await self.submit_item(loop, executor, index, item)
+            results[index] = result
+
+            if self.on_result:
+                self.on_result(result)
+
+    async def run_async(self, items):
+        loop = asyncio.get_event_loop()
+        items = list(items)
+        results = [None] * len(items)
+
+        queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            queue.put_nowait((index, item))
+
+        start_time = time.monotonic()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*[
+                self.worker(loop, executor, queue, results) for _ in range(min(self.concurrency, len(items)))
+            ])
+
+        return BatchSummary(results, time.monotonic() - start_time)
+
+    def run(self, items):
+        """Submits all of the items and returns a BatchSummary of the results, in the same order as the items."""
+        loop = asyncio.new_event_loop()
+
+        try:
+            asyncio.set_event_loop(loop)
+            return loop.run_until_complete(self.run_async(items))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import threading
+import time
+
+from k8s_jobs.api import NonRetryableApiError, UnknownOutcomeError
+from k8s_jobs.cancel import DELETE_OPTIONS
+from k8s_jobs.klib import SCRIPT_HASH_LABEL, get_path, insert_or_append_path
+from k8s_jobs.listing import age_seconds
+from k8s_jobs.validate import ValidationError
+
+
+SCRIPT_HASH_LENGTH = 16
+SCRIPT_KEY = 'script.sh'
+SCRIPT_VOLUME_NAME = 'kbatch-script'
+SCRIPT_MOUNT_PATH = '/etc/kbatch-script'
+
+# ConfigMaps are limited to 1MiB in total, which leaves room for their metadata
+MAX_SCRIPT_BYTES = 1000 * 1024
+
+# When a script ConfigMap was last used to submit jobs, in seconds since the epoch
+LAST_USED_ANNOTATION = 'k8s-jobs/last-used'
+
+# Unused script ConfigMaps aren't deleted until this long after they were last used, since jobs using them may still be
+# being submitted
+SCRIPT_GC_MIN_AGE_SECONDS = 3600
+
+# How long this process reuses a ConfigMap it created or found without marking it as used again, which is much less
+# than SCRIPT_GC_MIN_AGE_SECONDS so that it can't be deleted in the meantime
+SCRIPT_REUSE_SECONDS = 600
+
+# When this process last created or marked each ConfigMap as used, by API server, namespace and name, so that e.g.
+# kbatchd doesn't send a request for each submission
+known_configmaps = {}
+known_configmaps_lock = threading.Lock()
+
+
+def script_hash(contents):
+    return hashlib.sha256(contents).hexdigest()[:SCRIPT_HASH_LENGTH]
+
+
+def script_configmap_name(digest):
+    return 'kbatch-script-{digest}'.format(digest=digest)
+
+
+def script_command():
+    """Returns the command that runs the script mounted from its ConfigMap, the same way the script inlined into the
+        command is run."""
+    return 'cat {mount_path}/{key} | bash'.format(mount_path=SCRIPT_MOUNT_PATH, key=SCRIPT_KEY)
+
+
+def last_used_annotation(now):
+    return {LAST_USED_ANNOTATION: str(int(now))}
+
+
+def script_configmap(contents, digest, now):
+    """Returns the ConfigMap of a script, as text if it is UTF-8 and as binary data otherwise."""
+    configmap = {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {
+            'name': script_configmap_name(digest),
+            'labels': {SCRIPT_HASH_LABEL: digest},
+            'annotations': last_used_annotation(now),
+        },
+    }
+
+    try:
+        configmap['data'] = {SCRIPT_KEY: contents.decode('utf-8')}
+    except UnicodeDecodeError:
+        configmap['binaryData'] = {SCRIPT_KEY: base64.b64encode(contents).decode('utf-8')}
+
+    return configmap
+
+
+def configmaps_path(client, namespace=None):
+    return '/api/v1/namespaces/{namespace}/configmaps'.format(namespace=namespace or client.namespace)
+
+
+def ensure_configmap(client, configmap, namespace=None, now=None):
+    """Creates a ConfigMap named after the hash of its contents, or marks the existing one (with the same contents) as
+        used, so that it isn't garbage collected while jobs using it are submitted."""
+    now = now if now is not None else time.time()
+    name = configmap['metadata']['name']
+    key = (client.server, namespace or client.namespace, name)
+
+    with known_configmaps_lock:
+        if now - known_configmaps.get(key, float('-inf')) < SCRIPT_REUSE_SECONDS:
+            return
+
+    try:
+        try:
+            client.request('POST', configmaps_path(client, namespace), configmap)
+        except UnknownOutcomeError:
+            # The name is unique to the contents, so sending it again can't create a second ConfigMap
+            client.request('POST', configmaps_path(client, namespace), configmap)
+    except NonRetryableApiError as e:
+        if e.status != 409:
+            raise
+
+        # The same contents were already uploaded, by this or another batch, and must not be garbage collected now
+        client.request('PATCH', '{path}/{name}'.format(path=configmaps_path(client, namespace), name=name),
+                       {'metadata': {'annotations': last_used_annotation(now)}})
+
+    with known_configmaps_lock:
+        known_configmaps[key] = now
+
+
+def ensure_script_configmap(client, contents, namespace=None, now=None):
+    """Creates the ConfigMap of a script, named after the hash of its contents, or marks the existing one as used, and
+        returns the hash. Jobs submitted with the same script share its ConfigMap instead of each inlining the
+        script."""
+    if len(contents) > MAX_SCRIPT_BYTES:
+        raise ValidationError(['--script: the script is {size} bytes, larger than a ConfigMap can hold ({limit} '
+                               'bytes)'.format(size=len(contents), limit=MAX_SCRIPT_BYTES)])
+
+    now = now if now is not None else time.time()
+    digest = script_hash(contents)
+
+    ensure_configmap(client, script_configmap(contents, digest, now), namespace, now)
+
+    return digest
+
+
+def add_script_volume(config_template, digest):
+    """Mounts the ConfigMap of a script into every container of a job template."""
+    insert_or_append_path(config_template, 'spec.template.spec.volumes', {
+        'name': SCRIPT_VOLUME_NAME,
+        'configMap': {'name': script_configmap_name(digest)},
+    })
+
+    for i in range(len(get_path(config_template, 'spec.template.spec.containers', []))):
+        insert_or_append_path(config_template, 'spec.template.spec.containers.{}.volumeMounts'.format(i), {
+            'name': SCRIPT_VOLUME_NAME,
+            'mountPath': SCRIPT_MOUNT_PATH,
+            'readOnly': True,
+        })
+
+
+def seconds_since_used(configmap, now):
+    last_used = (configmap['metadata'].get('annotations') or {}).get(LAST_USED_ANNOTATION)
+
+    try:
+        return now - float(last_used)
+    except (TypeError, ValueError):
+        return age_seconds(configmap, now) or 0
+
+
+def unused_script_configmaps(client, namespace=None, min_age=SCRIPT_GC_MIN_AGE_SECONDS, now=None,
+                             label=SCRIPT_HASH_LABEL):
+    """Returns the names of the script ConfigMaps (or others labeled with the hash of their contents, such as the
+        parameters of indexed jobs) that no job uses any more, and that were last used to submit jobs at least min_age
+        seconds ago. The jobs using each ConfigMap are found by the label with its hash, listing them a page at a
+        time."""
+    now = now if now is not None else time.time()
+
+    used = set(job['metadata']['labels'][label] for job in client.iter_items(client.jobs_path(namespace),
+                                                                             {'labelSelector': label}))
+    configmaps = client.iter_items(configmaps_path(client, namespace), {'labelSelector': label})
+
+    def is_unused(configmap):
+        return configmap['metadata']['labels'][label] not in used and seconds_since_used(configmap, now) >= min_age
+
+    return [configmap['metadata']['name'] for configmap in configmaps if is_unused(configmap)]
+
+
+def delete_script_configmap(client, name, namespace=None):
+    """Deletes a script ConfigMap, returning whether it existed."""
+    try:
+        client.request('DELETE', '{path}/{name}'.format(path=configmaps_path(client, namespace), name=name),
+                       DELETE_OPTIONS)
+    except NonRetryableApiError as e:
+        if e.status == 404:
+            return False
+
+        raise
+
+    return True
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from k8s_jobs.api import NonRetryableApiError
+from k8s_jobs.klib import BATCH_LABEL, NonRetryableError, verify_retry_limit_supported
+from k8s_jobs.listing import iter_jobs
+from k8s_jobs.watch import PENDING, RUNNING, job_state
+
+
+QUEUED = 'queued'
+SUBMITTED = 'submitted'
+FAILED = 'failed'
+STATES = [QUEUED, SUBMITTED, FAILED]
+
+# Spooled jobs are named with their prefix and a hash of their batch id and index instead of a name generated by
+# Kubernetes, so that submitting one again (e.g. after the drain was interrupted) finds the existing job
+NAME_SUFFIX_LENGTH = 10
+MAX_NAME_LENGTH = 63
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    context TEXT NOT NULL,
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    batch_id TEXT NOT NULL,
+    manifest TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (context, namespace, name)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, context, namespace, enqueued_at);
+'''
+
+
+def spool_dir():
+    """Returns the directory of the spool: $K8S_JOBS_SPOOL_DIR, or k8s-jobs under $XDG_DATA_HOME (~/.local/share).
+        Unlike the caches, the spool holds jobs that were not submitted yet, so it is not kept with them."""
+    if os.environ.get('K8S_JOBS_SPOOL_DIR'):
+        return os.environ['K8S_JOBS_SPOOL_DIR']
+
+    xdg_data_home = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+
+    return os.path.join(xdg_data_home, 'k8s-jobs')
+
+
+def spool_path():
+    return os.path.join(spool_dir(), 'spool.db')
+
+
+def spooled_job_name(prefix, batch_id, index):
+    """Returns the name of a spooled job: the prefix it would have been generated from and a hash of its batch id and
+        index, which is the same each time the job is submitted."""
+    digest = hashlib.sha256('{batch_id}/{index}'.format(batch_id=batch_id, index=index).encode('utf-8')).hexdigest()
+
+    return '{prefix}{suffix}'.format(prefix=prefix[:MAX_NAME_LENGTH - NAME_SUFFIX_LENGTH],
+                                     suffix=digest[:NAME_SUFFIX_LENGTH])
+
+
+def name_manifest(manifest, batch_id, index):
+    """Replaces the generateName of a job with its spooled_job_name and returns the name. Jobs with a name of their
+        own keep it."""
+    metadata = manifest.setdefault('metadata', {})
+    generate_name = metadata.pop('generateName', None)
+
+    if not metadata.get('name'):
+        metadata['name'] = spooled_job_name(generate_name or 'kjob-', batch_id, index)
+
+    return metadata['name']
+
+
+class SpooledJob(object):
+    def __init__(self, context, namespace, name, batch_id, manifest, state=QUEUED, attempts=0, error=None):
+        self.context = context
+        self.namespace = namespace
+        self.name = name
+        self.batch_id = batch_id
+        self.manifest = manifest
+        self.state = state
+        self.attempts = attempts
+        self.error = error
+
+    @property
+    def key(self):
+        return (self.context, self.namespace, self.name)
+
+
+class Spool(object):
+    """A durable queue of rendered jobs in an SQLite database, which kbatch --spool adds jobs to and kspool drain
+        submits them from. Jobs are kept by kube context, namespace (empty for the namespace of the context) and name,
+        so adding a job that is already spooled does nothing. The database is in WAL mode so that jobs can be added
+        while it is being drained."""
+
+    def __init__(self, path=None):
+        self.path = path or spool_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def execute(self, sql, parameters=()):
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def enqueue(self, context, batch_id, manifests, now=None):
+        """Names the job manifests of a batch with name_manifest and adds them to the spool for a kube context, and
+            returns their names."""
+        now = now if now is not None else time.time()
+        rows = []
+
+        for index, manifest in enumerate(manifests):
+            name = name_manifest(manifest, batch_id, index)
+            namespace = manifest['metadata'].get('namespace') or ''
+            rows.append((context, namespace, name, batch_id, json.dumps(manifest, separators=(',', ':')), QUEUED,
+                         now, now))
+
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO jobs (context, namespace, name, batch_id, manifest, '
+                                        'state, enqueued_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+        return [row[2] for row in rows]
+
+    def queued_namespaces(self, context):
+        return [namespace for namespace, in self.execute(
+            'SELECT DISTINCT namespace FROM jobs WHERE state = ? AND context = ? ORDER BY namespace',
+            (QUEUED, context),
+        )]
+
+    def count_queued(self, context):
+        return self.execute('SELECT COUNT(*) FROM jobs WHERE state = ? AND context = ?', (QUEUED, context))[0][0]
+
+    def queued(self, context, namespace, limit=None):
+        """Returns the queued jobs of a namespace, oldest first, up to limit of them."""
+        rows = self.execute('SELECT context, namespace, name, batch_id, manifest, state, attempts, error FROM jobs '
+                            'WHERE state = ? AND context = ? AND namespace = ? ORDER BY enqueued_at, rowid LIMIT ?',
+                            (QUEUED, context, namespace, limit if limit is not None else -1))
+
+        return [SpooledJob(context, namespace, name, batch_id, json.loads(manifest), state, attempts, error)
+                for context, namespace, name, batch_id, manifest, state, attempts, error in rows]
+
+    def set_state(self, job, state, error=None, now=None):
+        """Records the outcome of an attempt to submit a job: SUBMITTED, FAILED, or QUEUED to try again later."""
+        self.execute('UPDATE jobs SET state = ?, attempts = attempts + 1, error = ?, updated_at = ? '
+                     'WHERE context = ? AND namespace = ? AND name = ?',
+                     (state, error, now if now is not None else time.time()) + job.key)
+
+    def counts(self):
+        """Returns the number of jobs in each state, by kube context, namespace and batch."""
+        counts = {}
+
+        for context, namespace, batch_id, state, n in self.execute(
+                'SELECT context, namespace, batch_id, state, COUNT(*) FROM jobs '
+                'GROUP BY context, namespace, batch_id, state ORDER BY MIN(enqueued_at)'):
+            counts.setdefault((context, namespace, batch_id), {})[state] = n
+
+        return counts
+
+    def failed(self, batch_id=None):
+        """Returns the name, batch id and error of each failed job (of a batch)."""
+        return self.execute('SELECT name, batch_id, error FROM jobs WHERE state = ? AND '
+                            'batch_id = COALESCE(?, batch_id) ORDER BY enqueued_at, rowid', (FAILED, batch_id))
+
+    def retry_failed(self, batch_id=None):
+        """Queues the failed jobs (of a batch) again, and returns how many there were."""
+        with self.lock, self.connection:
+            return self.connection.execute('UPDATE jobs SET state = ?, error = NULL WHERE state = ? AND '
+                                           'batch_id = COALESCE(?, batch_id)', (QUEUED, FAILED, batch_id)).rowcount
+
+    def purge(self, states, batch_id=None, older_than=None, now=None):
+        """Deletes the jobs in the given states (of a batch, and last updated at least older_than seconds ago), and
+            returns how many there were."""
+        updated_before = (now if now is not None else time.time()) - (older_than or 0)
+
+        with self.lock, self.connection:
+            return self.connection.execute(
+                'DELETE FROM jobs WHERE state IN ({states}) AND batch_id = COALESCE(?, batch_id) AND '
+                'updated_at <= ?'.format(states=', '.join('?' for _ in states)),
+                tuple(states) + (batch_id, updated_before),
+            ).rowcount
+
+
+def jobs_in_flight(client, namespace=None):
+    """Returns how many of the jobs submitted by kbatch in a namespace are pending or running."""
+    return sum(1 for job in iter_jobs(client, namespace, label_selector=BATCH_LABEL)
+               if job_state(job) in (PENDING, RUNNING))
+
+
+def is_saturated(error):
+    """Returns whether a job that failed to be submitted should be queued again rather than marked as failed: the
+        API server was unavailable or throttling requests, or the namespace is at its resource quota."""
+    if not isinstance(error, NonRetryableError):
+        return True
+
+    return getattr(error, 'status', None) == 403 and 'exceeded quota' in str(error)
+
+
+def submit_spooled_job(client, job):
+    """Creates a spooled job, and returns its name. A job of the same name and batch that already exists was submitted
+        by an earlier drain, so it is not created again."""
+    try:
+        client.create_job(job.manifest, job.namespace or None)
+    except NonRetryableApiError as e:
+        if e.status != 409:
+            raise
+
+        existing = client.request('GET', '{path}/{name}'.format(path=client.jobs_path(job.namespace or None),
+                                                                name=job.name))
+
+        if ((existing.get('metadata') or {}).get('labels') or {}).get(BATCH_LABEL) != job.batch_id:
+            raise
+
+    return job.name
+
+
+def drain_once(spool, client, context, max_in_flight=None, concurrency=8, rate=None, on_result=None):
+    """Submits the queued jobs of a kube context, with at most max_in_flight jobs submitted by kbatch pending or
+        running in each namespace, and returns the number of jobs submitted, queued again and failed. Jobs that can't
+        be submitted because the cluster is saturated stay queued for the next drain."""
+    from k8s_jobs.scheduler import SubmissionScheduler
+
+    counts = {SUBMITTED: 0, QUEUED: 0, FAILED: 0}
+
+    def record_result(result):
+        if result.ok:
+            state = SUBMITTED
+        else:
+            state = QUEUED if is_saturated(result.error) else FAILED
+
+        spool.set_state(result.item, state, None if result.ok else str(result.error))
+        counts[state] += 1
+
+        if on_result:
+            on_result(result, state)
+
+    for namespace in spool.queued_namespaces(context):
+        limit = None
+
+        if max_in_flight is not None:
+            limit = max_in_flight - jobs_in_flight(client, namespace or None)
+
+            if limit <= 0:
+                continue
+
+        jobs = spool.queued(context, namespace, limit)
+
+        # kbatch --spool doesn't check that the cluster supports the retry limit of the jobs, so it is checked before
+        # they are submitted
+        retry_limit = max([(job.manifest.get('spec') or {}).get('backoffLimit') or 0 for job in jobs] or [0])
+        verify_retry_limit_supported(retry_limit)
+
+        scheduler = SubmissionScheduler(lambda job: submit_spooled_job(client, job),
+                                        concurrency=concurrency,
+                                        rate=rate,
+                                        max_attempts=3,
+                                        on_result=record_result)
+        scheduler.run(jobs)
+
+    return counts
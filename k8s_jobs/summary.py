@@ -0,0 +1,194 @@
+import collections
+import json
+import math
+
+from k8s_jobs.listing import format_age, parse_timestamp
+from k8s_jobs.logs import find_pods
+from k8s_jobs.watch import COMPLETE, FAILED, FINAL_STATES, JobWatcher
+
+
+PERCENTILES = [50, 95, 99]
+
+# The distributions of the summary: from a job's creation until its first pod was scheduled to a node, until its first
+# container started (scheduling, pulling the image and starting it) and from then until the job finished (including
+# any retries)
+TIMINGS = [
+    ('schedule_seconds', 'Scheduling'),
+    ('queue_seconds', 'Queued'),
+    ('run_seconds', 'Running'),
+]
+
+
+def percentile(values, p):
+    """Returns the p-th percentile of the values by the nearest-rank method, or None if there are none."""
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return values[max(int(math.ceil(p / 100.0 * len(values))) - 1, 0)]
+
+
+def timestamp(value):
+    return parse_timestamp(value) if value else None
+
+
+def elapsed(start, end):
+    return end - start if start is not None and end is not None else None
+
+
+def condition_time(obj, condition_type):
+    for condition in (obj.get('status') or {}).get('conditions') or []:
+        if condition.get('type') == condition_type and condition.get('status') == 'True':
+            return timestamp(condition.get('lastTransitionTime'))
+
+    return None
+
+
+def failure_reason(job):
+    """Returns why a job failed, e.g. BackoffLimitExceeded when its pods failed too many times, or DeadlineExceeded when
+        it ran for longer than its activeDeadlineSeconds."""
+    for condition in (job.get('status') or {}).get('conditions') or []:
+        if condition.get('type') == FAILED and condition.get('status') == 'True':
+            return condition.get('reason') or 'Unknown'
+
+    return None
+
+
+def container_started(pod):
+    """Returns when the first container of a pod started, from the current or last state of its containers."""
+    started = []
+
+    for container_status in (pod.get('status') or {}).get('containerStatuses') or []:
+        for state in [container_status.get('state') or {}, container_status.get('lastState') or {}]:
+            for value in state.values():
+                if (value or {}).get('startedAt'):
+                    started.append(timestamp(value['startedAt']))
+
+    return min(started) if started else None
+
+
+def job_timing(job, pods, state):
+    """Returns the timing of a job from its creation until its first pod was scheduled and started, and until it
+        finished, with its state, why it failed and how many times its pods were retried."""
+    status = job.get('status') or {}
+    created = timestamp(job['metadata'].get('creationTimestamp'))
+
+    scheduled = [condition_time(pod, 'PodScheduled') for pod in pods]
+    started = [container_started(pod) for pod in pods]
+    scheduled = min([time for time in scheduled if time is not None], default=None)
+    started = min([time for time in started if time is not None], default=None)
+    finished = timestamp(status.get('completionTime')) or condition_time(job, COMPLETE) or condition_time(job, FAILED)
+
+    return {
+        'name': job['metadata']['name'],
+        'state': state,
+        'reason': failure_reason(job),
+        'retries': status.get('failed') or 0,
+        'created': created,
+        'finished': finished,
+        'schedule_seconds': elapsed(created, scheduled),
+        'queue_seconds': elapsed(created, started),
+        'run_seconds': elapsed(started, finished),
+    }
+
+
+def distribution(values):
+    values = [value for value in values if value is not None]
+    stats = {'p{p}'.format(p=p): percentile(values, p) for p in PERCENTILES}
+    stats.update(count=len(values), max=max(values, default=None))
+
+    return stats
+
+
+def summarize(jobs, pods, states):
+    """Summarizes a batch of jobs from the jobs, their pods and the state of each job (including deleted jobs, which
+        have no job object): how many are in each state, why they failed, how often they were retried, how long they
+        took to be scheduled, to start and to run, and how many completed per minute."""
+    pods_by_job = collections.defaultdict(list)
+    for pod in pods:
+        pods_by_job[(pod['metadata'].get('labels') or {}).get('job-name')].append(pod)
+
+    timings = [job_timing(job, pods_by_job[job['metadata']['name']], states.get(job['metadata']['name']))
+               for job in sorted(jobs, key=lambda job: job['metadata']['name'])]
+
+    created = [timing['created'] for timing in timings if timing['created'] is not None]
+    finished = [timing['finished'] for timing in timings if timing['finished'] is not None]
+    elapsed_seconds = max(finished) - min(created) if created and finished else None
+    n_complete = sum(1 for state in states.values() if state == COMPLETE)
+
+    summary = {
+        'jobs': len(states),
+        'states': dict(collections.Counter(state or 'Unknown' for state in states.values())),
+        'failure_reasons': dict(collections.Counter(timing['reason'] for timing in timings if timing['reason'])),
+        'retries': sum(timing['retries'] for timing in timings),
+        'jobs_retried': sum(1 for timing in timings if timing['retries']),
+        'elapsed_seconds': elapsed_seconds,
+        'completed_per_minute': 60.0 * n_complete / elapsed_seconds if elapsed_seconds else None,
+    }
+
+    for key, _ in TIMINGS:
+        summary[key] = distribution(timing[key] for timing in timings)
+
+    summary['job_timings'] = [{key: value for key, value in timing.items() if key not in ('created', 'finished')}
+                              for timing in timings]
+
+    return summary
+
+
+def format_summary(summary):
+    """Returns a readable report of a summary, with a table of the percentiles of each timing."""
+    lines = ['{jobs} jobs: {states}{elapsed}'.format(
+        jobs=summary['jobs'],
+        states=', '.join('{n} {state}'.format(n=n, state=state) for state, n in sorted(summary['states'].items())),
+        elapsed=' in {elapsed} ({rate:.1f} completed/min)'.format(
+            elapsed=format_age(summary['elapsed_seconds']),
+            rate=summary['completed_per_minute'] or 0.0,
+        ) if summary['elapsed_seconds'] else '',
+    )]
+
+    if summary['failure_reasons']:
+        lines.append('Failures: {reasons}'.format(reasons=', '.join(
+            '{n} {reason}'.format(n=n, reason=reason) for reason, n in sorted(summary['failure_reasons'].items())
+        )))
+
+    lines.append('Retries: {retries} in {jobs_retried} jobs'.format(**summary))
+
+    columns = ['p{p}'.format(p=p) for p in PERCENTILES] + ['max']
+    lines.append('{name:<12}{columns}'.format(name='', columns=''.join('{:>8}'.format(column) for column in columns)))
+
+    for key, name in TIMINGS:
+        lines.append('{name:<12}{values}'.format(name=name, values=''.join(
+            '{:>8}'.format(format_age(summary[key][column]) if summary[key][column] is not None else '-')
+            for column in columns
+        )))
+
+    return '\n'.join(lines)
+
+
+def write_summary(summary, path):
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def wait_and_summarize(client, names=None, namespace=None, label_selector=None, timeout=None, on_final=None):
+    """Watches the given jobs (or all jobs matching the label selector) until they are in a final state, or until the
+        timeout, then lists their pods and returns the summary of the jobs. The pods are listed with the label selector
+        if there is one, since kbatch gives pods the labels of their jobs (e.g. the id of their batch)."""
+    watcher = JobWatcher(client, namespace=namespace, label_selector=label_selector).start()
+
+    try:
+        states = watcher.wait(names, timeout=timeout, on_final=on_final)
+    finally:
+        watcher.stop()
+
+    with watcher.condition:
+        jobs = [watcher.jobs[name] for name in states if name in watcher.jobs]
+
+    pods = find_pods(client, [] if label_selector else list(states), namespace, label_selector) if jobs else []
+
+    summary = summarize(jobs, pods, states)
+    summary['timed_out'] = not all(state in FINAL_STATES for state in states.values())
+
+    return summary
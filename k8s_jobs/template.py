@@ -0,0 +1,318 @@
+import bisect
+import json
+import re
+
+import yaml
+
+
+class QuotedString(str):
+    """A string that is always written to yaml in quotes, so that it is still parsed as a string once its placeholders
+        are substituted, e.g. a label value of $(ARRAY_INDEX)."""
+
+
+def represent_quoted_string(dumper, value):
+    return dumper.represent_scalar('tag:yaml.org,2002:str', str(value), style="'")
+
+
+def construct_template_string(loader, node):
+    value = loader.construct_scalar(node)
+
+    # Placeholders the template quotes are substituted as strings, whatever the values look like, e.g. "$(SAMPLE)"
+    # stays a string for a value of yes
+    if node.style in ('"', "'") and placeholder_matcher.search(value):
+        return QuotedString(value)
+
+    return value
+
+
+yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+yaml_dumper = type('Dumper', (getattr(yaml, 'CSafeDumper', yaml.SafeDumper),), {})
+yaml_dumper.add_representer(QuotedString, represent_quoted_string)
+yaml_resolver = yaml.resolver.Resolver()
+
+# Loads job templates, keeping which strings with placeholders were quoted
+template_loader = type('TemplateLoader', (yaml_loader,), {})
+template_loader.add_constructor('tag:yaml.org,2002:str', construct_template_string)
+
+placeholder_matcher = re.compile(r'\$\((?P<name>[A-Za-z_][A-Za-z0-9_]*)\)')
+
+# Values that can be inserted into a plain yaml scalar without changing where it ends or what it is parsed as, other
+# than its type. Others are inserted into quoted scalars, or the job is rendered from the parsed yaml instead.
+plain_safe_matcher = re.compile(r'(?:[^\s\-?:,\[\]{}#&*!|>\'"%@`\\][^\n\'",\[\]{}#\\]*)?\Z')
+
+
+def is_plain_safe(value):
+    return plain_safe_matcher.match(value) is not None and ': ' not in value and not value.endswith((':', ' '))
+
+
+def escape_value(value, style):
+    """Returns a value escaped for the yaml scalar style of the scalar it is inserted into ('"' or "'" for quoted
+        scalars, '|' or '>' for block scalars, and None for plain scalars), or None if it can't be inserted into such a
+        scalar without changing how the rest of the scalar is parsed."""
+    if style == '"':
+        # JSON escapes are all valid in double-quoted yaml scalars
+        return json.dumps(value, ensure_ascii=False)[1:-1]
+
+    if style == "'":
+        return value.replace("'", "''") if '\n' not in value else None
+
+    if style in ('|', '>'):
+        return value if '\n' not in value else None
+
+    return value if is_plain_safe(value) else None
+
+
+class Template(object):
+    """A job yaml with the location of every $(NAME) placeholder indexed, so that it can be rendered with
+        many different sets of values in a single pass over its lines.
+
+        Rendering follows the same rules as replace_template: a value of None (or an empty list) removes every line
+        containing its placeholder, any other value is substituted for its placeholder, and placeholders without a
+        value are left as they are. Substituted values are inserted verbatim and are not searched for placeholders.
+    """
+
+    def __init__(self, data):
+        # Each line is stored as a list alternating literal text and placeholder names, starting and ending with
+        # literal text, so a line without placeholders is a list with a single item.
+        self.data = data
+        self.lines = [placeholder_matcher.split(line) for line in data.split('\n')]
+        self.line_numbers = {}
+        self.styles = None
+
+        for line_number, segments in enumerate(self.lines):
+            for name in segments[1::2]:
+                self.line_numbers.setdefault(name, set()).add(line_number)
+
+    @property
+    def names(self):
+        return set(self.line_numbers)
+
+    def render(self, values, segment_values=None):
+        """Renders the template with the values of its placeholders. segment_values replace the values of individual
+            placeholders, by line number and segment index."""
+        removed_lines = set()
+        for name, line_numbers in self.line_numbers.items():
+            if name in values and (values[name] is None or values[name] == []):
+                removed_lines.update(line_numbers)
+
+        rendered_lines = []
+        for line_number, segments in enumerate(self.lines):
+            if len(segments) == 1:
+                rendered_lines.append(segments[0])
+                continue
+
+            if line_number in removed_lines:
+                continue
+
+            rendered_segments = segments[:]
+            for i in range(1, len(segments), 2):
+                name = segments[i]
+                if segment_values and (line_number, i) in segment_values:
+                    rendered_segments[i] = segment_values[(line_number, i)]
+                else:
+                    rendered_segments[i] = values[name] if name in values else '$({name})'.format(name=name)
+
+            rendered_lines.append(''.join(rendered_segments))
+
+        return '\n'.join(rendered_lines)
+
+    def placeholder_styles(self):
+        """Returns the yaml scalar style (see escape_value) of the scalar each placeholder is in, by line number and
+            segment index. The yaml is only scanned for them once."""
+        if self.styles is not None:
+            return self.styles
+
+        scalars = sorted((token.start_mark.index, token.end_mark.index, token.style)
+                         for token in yaml.scan(self.data, Loader=yaml_loader) if isinstance(token, yaml.ScalarToken))
+        starts = [start for start, _, _ in scalars]
+
+        self.styles = {}
+        offset = 0
+        for line_number, segments in enumerate(self.lines):
+            position = offset
+
+            for i, segment in enumerate(segments):
+                if i % 2:
+                    scalar = bisect.bisect_right(starts, position) - 1
+                    in_scalar = scalar >= 0 and position < scalars[scalar][1]
+                    self.styles[(line_number, i)] = scalars[scalar][2] if in_scalar else None
+                    segment = '$({name})'.format(name=segment)
+
+                position += len(segment)
+
+            offset = position + 1
+
+        return self.styles
+
+    def render_escaped(self, values):
+        """Renders the template like render, with each string value escaped for the yaml scalar it is inserted into, so
+            that the rendered yaml is parsed as the same job as rendering its parsed form with ObjectTemplate. Returns
+            None if a value can't be inserted into its scalar that way, e.g. a value containing ": " inserted into part
+            of a plain scalar."""
+        escaped_values = {}
+
+        for (line_number, i), style in self.placeholder_styles().items():
+            value = values.get(self.lines[line_number][i])
+
+            if isinstance(value, str):
+                escaped_values[(line_number, i)] = escape_value(value, style)
+
+                if escaped_values[(line_number, i)] is None:
+                    return None
+
+        return self.render(values, escaped_values)
+
+
+def quoted_paths(obj, path=()):
+    """Yields the path (a list of keys and indexes) of each QuotedString in a parsed template."""
+    if isinstance(obj, QuotedString):
+        yield list(path)
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            yield from quoted_paths(value, path + (key,))
+    elif isinstance(obj, list):
+        for i, value in enumerate(obj):
+            yield from quoted_paths(value, path + (i,))
+
+
+def mark_quoted(obj, paths):
+    """Makes the strings at the given paths of a template QuotedStrings again, e.g. after storing it as JSON."""
+    for path in paths:
+        if not path:
+            return QuotedString(obj)
+
+        parent = obj
+        for key in path[:-1]:
+            parent = parent[key]
+
+        parent[path[-1]] = QuotedString(parent[path[-1]])
+
+    return obj
+
+
+# Returned when rendering a value that should be removed from its parent
+REMOVE = object()
+
+
+def is_removed_value(value):
+    return value is None or value == []
+
+
+def is_plain_scalar(value):
+    """Whether yaml.dump would write a string without quotes, in which case the text it is rendered to is parsed as
+        a typed value (e.g. a number or boolean) again."""
+    return not yaml.dump(value, Dumper=yaml_dumper).startswith(("'", '"', '|', '>'))
+
+
+def resolve_scalar(value):
+    """Returns the value a plain yaml scalar with this text would be parsed as, e.g. '2100' is the integer 2100."""
+    if yaml_resolver.resolve(yaml.ScalarNode, value, (True, False)) == 'tag:yaml.org,2002:str':
+        return value
+
+    return yaml.load(value, Loader=yaml_loader)
+
+
+def substitute_text(text, values):
+    if not values or '$(' not in text:
+        return text
+
+    return placeholder_matcher.sub(lambda match: values.get(match.group('name'), match.group(0)), text)
+
+
+class ScalarTemplate(object):
+    def __init__(self, value):
+        self.segments = placeholder_matcher.split(value)
+        # Only strings the template didn't quote are parsed as typed values after substitution
+        self.plain = not isinstance(value, QuotedString) and is_plain_scalar(value)
+        self.value = value
+
+    def render(self, values, inner_values):
+        names = self.segments[1::2]
+
+        if not any(name in values for name in names):
+            return self.value
+
+        if any(name in values and is_removed_value(values[name]) for name in names):
+            return REMOVE
+
+        # A typed value (such as the list of a command) replaces a placeholder that is the whole string
+        if len(self.segments) == 3 and not self.segments[0] and not self.segments[2]:
+            value = values[names[0]]
+
+            if isinstance(value, list):
+                return [substitute_text(item, inner_values) if isinstance(item, str) else item for item in value]
+
+        rendered_segments = self.segments[:]
+        for i in range(1, len(self.segments), 2):
+            name = self.segments[i]
+
+            if name in values:
+                value = values[name]
+                value = value if isinstance(value, str) else json.dumps(value)
+                rendered_segments[i] = substitute_text(value, inner_values)
+            else:
+                rendered_segments[i] = '$({name})'.format(name=name)
+
+        rendered = ''.join(rendered_segments)
+
+        return resolve_scalar(rendered) if self.plain else rendered
+
+
+class ObjectTemplate(object):
+    """A parsed job (e.g. from yaml.safe_load) with its $(NAME) placeholders indexed, which is rendered to a new
+        job object by substituting values directly into the object instead of into yaml text.
+
+        Rendering gives the same job as dumping the object to yaml, rendering it with Template and parsing the
+        result: a value of None (or an empty list) removes the entry containing its placeholder, mappings and lists
+        emptied by that become None, and strings that would be written to yaml without quotes are parsed as typed
+        values after substitution (so '$(TIME_LIMIT_SECONDS)' becomes an integer), unless they are QuotedStrings (such
+        as those quoted in the template, see template_loader). A list value that replaces a whole
+        string is inserted as a list, which is how commands are rendered.
+
+        inner_values are substituted into the values that are inserted, the same as rendering the output of a
+        Template again with those values, e.g. to substitute the variables of each job in an array.
+    """
+
+    def __init__(self, obj):
+        self.root = self.compile(obj)
+
+    def compile(self, obj):
+        if isinstance(obj, dict):
+            return dict, [(key, self.compile(value)) for key, value in obj.items()]
+
+        if isinstance(obj, list):
+            return list, [self.compile(value) for value in obj]
+
+        if isinstance(obj, str) and placeholder_matcher.search(obj):
+            return ScalarTemplate(obj)
+
+        return obj
+
+    def render_node(self, node, values, inner_values):
+        if isinstance(node, ScalarTemplate):
+            return node.render(values, inner_values)
+
+        if not isinstance(node, tuple):
+            return node
+
+        node_type, children = node
+
+        if node_type is dict:
+            rendered = {}
+            for key, child in children:
+                value = self.render_node(child, values, inner_values)
+
+                if value is not REMOVE:
+                    rendered[key] = value
+        else:
+            rendered = [value for value in (self.render_node(child, values, inner_values) for child in children)
+                        if value is not REMOVE]
+
+        # As in yaml text, a mapping or list with all of its lines removed is left empty, which is parsed as null
+        if children and not rendered:
+            return None
+
+        return rendered
+
+    def render(self, values, inner_values=None):
+        return self.render_node(self.root, values, inner_values)
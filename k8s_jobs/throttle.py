@@ -0,0 +1,88 @@
+import time
+
+from k8s_jobs.scheduler import BatchSummary, SubmissionScheduler
+from k8s_jobs.watch import COMPLETE, DELETED, FAILED, PENDING, RUNNING
+
+
+# How long to wait for a job of the batch to change before checking the watcher again anyway
+CHECK_INTERVAL_SECONDS = 10
+
+
+def job_counts(watcher, names):
+    """Returns how many of the named jobs are in each state. Jobs the watcher has not seen yet were only just created,
+        so they are counted as pending."""
+    counts = {PENDING: 0, RUNNING: 0, COMPLETE: 0, FAILED: 0, DELETED: 0}
+
+    for name in names:
+        counts[watcher.state(name) or PENDING] += 1
+
+    return counts
+
+
+def format_progress(n_submitted, n_jobs, counts):
+    return ('Submitted {n_submitted}/{n_jobs} jobs: {pending} pending, {running} running, {complete} complete, '
+            '{failed} failed'.format(n_submitted=n_submitted, n_jobs=n_jobs, pending=counts[PENDING],
+                                     running=counts[RUNNING], complete=counts[COMPLETE],
+                                     failed=counts[FAILED] + counts[DELETED]))
+
+
+def submit_throttled(chunks, submit, watcher, max_running, job_names, concurrency=4, rate=None, max_attempts=20,
+                     on_result=None, on_progress=None, check_interval=CHECK_INTERVAL_SECONDS):
+    """Submits chunks of jobs so that at most max_running of them are pending or running at once, and returns the
+        BatchSummary. The started JobWatcher of their batch is used to see the jobs finish, and as they do, the next
+        chunks that fit are submitted. job_names returns the names of the jobs created by a SubmissionResult.
+        on_progress is called with n_submitted, the number of jobs and the job_counts whenever the counts change."""
+    n_jobs = sum(len(chunk) for chunk in chunks)
+    results = []
+    submitted = []
+    next_chunk = 0
+    last_progress = None
+    started = time.monotonic()
+
+    def record_result(result):
+        submitted.extend(job_names(result))
+
+        if on_result:
+            on_result(result)
+
+    while True:
+        with watcher.condition:
+            if watcher.error is not None:
+                raise watcher.error
+
+            counts = job_counts(watcher, submitted)
+            seen = (watcher.n_lists, watcher.n_events)
+
+        progress = (len(submitted), counts)
+        if on_progress and progress != last_progress:
+            on_progress(len(submitted), n_jobs, counts)
+            last_progress = progress
+
+        if next_chunk == len(chunks):
+            return BatchSummary(results, time.monotonic() - started)
+
+        free = max_running - counts[PENDING] - counts[RUNNING]
+        first_chunk = next_chunk
+
+        while next_chunk < len(chunks) and len(chunks[next_chunk]) <= free:
+            free -= len(chunks[next_chunk])
+            next_chunk += 1
+
+        if next_chunk > first_chunk:
+            scheduler = SubmissionScheduler(submit,
+                                            concurrency=concurrency,
+                                            rate=rate,
+                                            max_attempts=max_attempts,
+                                            on_result=record_result)
+
+            for result in scheduler.run(chunks[first_chunk:next_chunk]).results:
+                result.index += first_chunk
+                results.append(result)
+
+            continue
+
+        with watcher.condition:
+            # Nothing fits until a job finishes, which the watcher is notified of
+            while (watcher.n_lists, watcher.n_events) == seen and watcher.error is None:
+                if not watcher.condition.wait(check_interval):
+                    break
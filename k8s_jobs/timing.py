@@ -0,0 +1,146 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+# The phases of submitting jobs, in the order they happen
+PHASES = ['parse', 'mutate', 'validate', 'dump', 'substitute', 'version_check', 'write', 'submit']
+
+
+class Timings(object):
+    """Records how many times each phase of submitting jobs ran and how long it took in total, and counts events such
+        as retries. Phases that run in several threads at once (e.g. the submissions of a job array) add up to more
+        than the time that passed.
+
+        Hooks added with add_hook are called with the name and seconds of each phase as it ends, e.g. to trace them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.events = {}
+        self.hooks = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self.lock:
+            count, total, longest = self.phases.get(name, (0, 0.0, 0.0))
+            self.phases[name] = (count + 1, total + seconds, max(longest, seconds))
+
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.events[name] = self.events.get(name, 0) + n
+
+    def reset(self):
+        with self.lock:
+            self.phases = {}
+            self.events = {}
+
+    def snapshot(self):
+        """Returns the timings as a dict, with the count, total and longest seconds of each phase."""
+        with self.lock:
+            return {
+                'phases': {name: {'count': count, 'seconds': total, 'max_seconds': longest}
+                           for name, (count, total, longest) in self.phases.items()},
+                'events': dict(self.events),
+            }
+
+
+def phase_order(name):
+    return (PHASES.index(name) if name in PHASES else len(PHASES)), name
+
+
+def format_timings(snapshot, elapsed=None):
+    """Returns a readable breakdown of the timings, with the share of the elapsed time spent in each phase."""
+    lines = ['{phase:<16}{count:>8}{seconds:>12}{max_seconds:>12}{share:>8}'.format(
+        phase='phase', count='count', seconds='seconds', max_seconds='max', share='%',
+    )]
+
+    for name in sorted(snapshot['phases'], key=phase_order):
+        stats = snapshot['phases'][name]
+
+        lines.append('{phase:<16}{count:>8}{seconds:>12.4f}{max_seconds:>12.4f}{share:>8}'.format(
+            phase=name,
+            count=stats['count'],
+            seconds=stats['seconds'],
+            max_seconds=stats['max_seconds'],
+            share='{:.1f}'.format(100 * stats['seconds'] / elapsed) if elapsed else '-',
+        ))
+
+    if elapsed is not None:
+        lines.append('{phase:<16}{count:>8}{seconds:>12.4f}'.format(phase='total', count='', seconds=elapsed))
+
+    for name, n in sorted(snapshot['events'].items()):
+        lines.append('{name}: {n}'.format(name=name, n=n))
+
+    return '\n'.join(lines)
+
+
+def format_prometheus(snapshot, elapsed=None):
+    """Returns the timings in the Prometheus text format, as gauges of the last run, e.g. for the textfile collector
+        of the node exporter."""
+    lines = [
+        '# HELP kbatch_phase_seconds Seconds spent in each phase of the last kbatch submission.',
+        '# TYPE kbatch_phase_seconds gauge',
+    ]
+    lines.extend('kbatch_phase_seconds{{phase="{name}"}} {seconds}'.format(name=name, seconds=stats['seconds'])
+                 for name, stats in sorted(snapshot['phases'].items()))
+
+    lines.extend([
+        '# HELP kbatch_phase_count Number of times each phase ran in the last kbatch submission.',
+        '# TYPE kbatch_phase_count gauge',
+    ])
+    lines.extend('kbatch_phase_count{{phase="{name}"}} {count}'.format(name=name, count=stats['count'])
+                 for name, stats in sorted(snapshot['phases'].items()))
+
+    lines.extend([
+        '# HELP kbatch_events Number of events (such as retries) in the last kbatch submission.',
+        '# TYPE kbatch_events gauge',
+    ])
+    lines.extend('kbatch_events{{event="{name}"}} {n}'.format(name=name, n=n)
+                 for name, n in sorted(snapshot['events'].items()))
+
+    if elapsed is not None:
+        lines.extend([
+            '# HELP kbatch_elapsed_seconds Seconds the last kbatch submission took.',
+            '# TYPE kbatch_elapsed_seconds gauge',
+            'kbatch_elapsed_seconds {elapsed}'.format(elapsed=elapsed),
+        ])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_timings(snapshot, path, elapsed=None):
+    """Writes the timings to a file, in the Prometheus text format if its name ends with .prom and as JSON otherwise.
+        The file is replaced at once, so that a collector never reads it half written."""
+    if path.endswith('.prom'):
+        data = format_prometheus(snapshot, elapsed)
+    else:
+        data = json.dumps(dict(snapshot, elapsed_seconds=elapsed), indent=2, sort_keys=True) + '\n'
+
+    temp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+
+    with open(temp_path, 'w') as f:
+        f.write(data)
+
+    os.replace(temp_path, path)
+
+
+# The timings of this process, which k8s_jobs.klib records the phases of submitting jobs in
+timings = Timings()
@@ -0,0 +1,283 @@
+import collections
+import hashlib
+import json
+import re
+import threading
+
+from k8s_jobs.klib import NonRetryableError, label_key_matcher, label_value_matcher
+from k8s_jobs.quantity import parse_quantity
+
+
+# How many validated renders are remembered, so that rendering the same job again (e.g. in kbatchd) does not validate
+# it again
+VALIDATION_CACHE_SIZE = 256
+
+# Digests of the renders that were valid, in least recently used order
+validated_renders = collections.OrderedDict()
+validated_renders_lock = threading.Lock()
+
+# Job and container names are DNS labels. Names generated from a prefix are truncated by Kubernetes to fit.
+dns_label_matcher = re.compile(r'^[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?$')
+generate_name_matcher = re.compile(r'^[a-z0-9][-a-z0-9.]*$')
+
+RESTART_POLICIES = ['Never', 'OnFailure']
+RESOURCES = ['cpu', 'memory', 'ephemeral-storage']
+
+
+class ValidationError(NonRetryableError):
+    """A job (or kbatch arguments) that Kubernetes would reject, which is not submitted (or retried)."""
+
+    def __init__(self, problems):
+        super(ValidationError, self).__init__('Invalid job: {problems}'.format(problems='; '.join(problems)))
+        self.problems = problems
+
+
+# The kbatch arguments that are resource quantities, by their option
+QUANTITY_ARGUMENTS = [
+    ('cpu', '--cpu'),
+    ('memory', '--memory'),
+    ('disk', '--disk'),
+    ('cpu_limit', '--cpu-limit'),
+    ('memory_limit', '--memory-limit'),
+    ('disk_limit', '--disk-limit'),
+]
+
+
+def validate_arguments(args):
+    """Checks the resource quantities and numbers of the kbatch arguments before they are used to render the job, so
+        that e.g. --cpu "4 cores" is reported as an invalid quantity. Raises a ValidationError listing every problem."""
+    problems = []
+
+    for attr, option in QUANTITY_ARGUMENTS:
+        value = getattr(args, attr, None)
+
+        if value and not is_substituted_later(value):
+            try:
+                parse_quantity(value)
+            except ValueError as e:
+                problems.append('{option}: {error}'.format(option=option, error=e))
+
+    for attr, option in [('time', '--time'), ('retry_limit', '--retry-limit')]:
+        value = getattr(args, attr, None)
+
+        if value and not is_substituted_later(value) and not str(value).isdigit():
+            problems.append('{option}: "{value}" must be a whole number'.format(option=option, value=value))
+
+    if problems:
+        raise ValidationError(problems)
+
+
+def is_substituted_later(value):
+    # Values with placeholders (e.g. $(ARRAY_INDEX)) are only known once the values of each job are substituted
+    return isinstance(value, str) and '$(' in value
+
+
+def validate_metadata(metadata, path, problems):
+    if not isinstance(metadata, dict):
+        problems.append('{path}: must be a mapping'.format(path=path))
+        return
+
+    for field in ['labels', 'annotations']:
+        values = metadata.get(field) or {}
+
+        if not isinstance(values, dict):
+            problems.append('{path}.{field}: must be a mapping'.format(path=path, field=field))
+            continue
+
+        for key, value in values.items():
+            if not is_substituted_later(key) and not label_key_matcher.match(str(key)):
+                problems.append('{path}.{field}: "{key}" is not a valid key'.format(path=path, field=field, key=key))
+
+            is_valid_value = value in (None, '') or is_substituted_later(value) or label_value_matcher.match(str(value))
+
+            if field == 'labels' and not is_valid_value:
+                problems.append('{path}.labels.{key}: "{value}" must be at most 63 letters, digits, "-", "_" or ".", '
+                                'starting and ending with a letter or digit'.format(path=path, key=key, value=value))
+
+            if field == 'annotations' and not isinstance(value, str):
+                problems.append('{path}.annotations.{key}: must be a string'.format(path=path, key=key))
+
+
+def validate_count(spec, field, minimum, problems):
+    value = spec.get(field)
+
+    if value is None or is_substituted_later(value):
+        return
+
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        problems.append('spec.{field}: "{value}" must be an integer of at least {minimum}'.format(
+            field=field,
+            value=value,
+            minimum=minimum,
+        ))
+
+
+def validate_resources(resources, path, problems):
+    if not isinstance(resources, dict):
+        problems.append('{path}: must be a mapping'.format(path=path))
+        return
+
+    quantities = {}
+
+    for kind in ['requests', 'limits']:
+        for resource, value in (resources.get(kind) or {}).items():
+            if value is None or is_substituted_later(value):
+                continue
+
+            try:
+                quantity = parse_quantity(value)
+            except ValueError as e:
+                problems.append('{path}.{kind}.{resource}: {error}'.format(path=path, kind=kind, resource=resource,
+                                                                           error=e))
+                continue
+
+            if quantity < 0:
+                problems.append('{path}.{kind}.{resource}: "{value}" must not be negative'.format(
+                    path=path, kind=kind, resource=resource, value=value,
+                ))
+
+            quantities[(kind, resource)] = quantity
+
+    for resource in RESOURCES:
+        request = quantities.get(('requests', resource))
+        limit = quantities.get(('limits', resource))
+
+        if request is not None and limit is not None and request > limit:
+            problems.append('{path}.requests.{resource}: "{request}" must not be more than the limit "{limit}"'.format(
+                path=path,
+                resource=resource,
+                request=resources['requests'][resource],
+                limit=resources['limits'][resource],
+            ))
+
+
+def validate_containers(containers, problems):
+    path = 'spec.template.spec.containers'
+
+    if not isinstance(containers, list) or not containers:
+        problems.append('{path}: at least one container is required'.format(path=path))
+        return
+
+    names = set()
+
+    for i, container in enumerate(containers):
+        container_path = '{path}.{i}'.format(path=path, i=i)
+
+        if not isinstance(container, dict):
+            problems.append('{path}: must be a mapping'.format(path=container_path))
+            continue
+
+        name = container.get('name')
+        if not name:
+            problems.append('{path}.name: is required'.format(path=container_path))
+        elif not is_substituted_later(name):
+            if not dns_label_matcher.match(str(name)):
+                problems.append('{path}.name: "{name}" must be at most 63 lowercase letters, digits or "-", starting '
+                                'and ending with a letter or digit'.format(path=container_path, name=name))
+            elif name in names:
+                problems.append('{path}.name: "{name}" is the name of another container'.format(
+                    path=container_path,
+                    name=name,
+                ))
+            names.add(name)
+
+        image = container.get('image')
+        if not image or not isinstance(image, str) or image != image.strip():
+            problems.append('{path}.image: an image is required, without leading or trailing whitespace'.format(
+                path=container_path,
+            ))
+
+        if container.get('resources') is not None:
+            validate_resources(container['resources'], '{path}.resources'.format(path=container_path), problems)
+
+
+def validate_job(job):
+    """Checks a rendered job for the mistakes that Kubernetes would reject it for: missing required fields, invalid
+        names, labels and resource quantities, and requests above their limits. Values that still contain $(NAME)
+        placeholders are not checked. Raises a ValidationError listing every problem found."""
+    problems = []
+
+    if not isinstance(job, dict):
+        raise ValidationError(['the job must be a mapping'])
+
+    if not job.get('apiVersion'):
+        problems.append('apiVersion: is required')
+
+    if job.get('kind') != 'Job':
+        problems.append('kind: "{kind}" must be Job'.format(kind=job.get('kind')))
+
+    metadata = job.get('metadata') or {}
+    validate_metadata(metadata, 'metadata', problems)
+
+    if isinstance(metadata, dict):
+        name = metadata.get('name')
+        generate_name = metadata.get('generateName')
+
+        if not name and not generate_name:
+            problems.append('metadata: name or generateName is required')
+        elif name and not is_substituted_later(name) and not dns_label_matcher.match(str(name)):
+            problems.append('metadata.name: "{name}" must be at most 63 lowercase letters, digits or "-", starting and '
+                            'ending with a letter or digit'.format(name=name))
+        elif not name and not (is_substituted_later(generate_name) or generate_name_matcher.match(str(generate_name))):
+            problems.append('metadata.generateName: "{name}" must be lowercase letters, digits, "-" or ".", starting '
+                            'with a letter or digit'.format(name=generate_name))
+
+    spec = job.get('spec')
+
+    if not isinstance(spec, dict):
+        problems.append('spec: is required')
+        raise ValidationError(problems)
+
+    validate_count(spec, 'activeDeadlineSeconds', 1, problems)
+    validate_count(spec, 'backoffLimit', 0, problems)
+
+    template = spec.get('template')
+
+    if not isinstance(template, dict) or not isinstance(template.get('spec'), dict):
+        problems.append('spec.template.spec: is required')
+        raise ValidationError(problems)
+
+    if template.get('metadata') is not None:
+        validate_metadata(template['metadata'], 'spec.template.metadata', problems)
+
+    restart_policy = template['spec'].get('restartPolicy')
+    if restart_policy not in RESTART_POLICIES and not is_substituted_later(restart_policy):
+        problems.append('spec.template.spec.restartPolicy: "{policy}" must be one of {policies}'.format(
+            policy=restart_policy,
+            policies=', '.join(RESTART_POLICIES),
+        ))
+
+    validate_containers(template['spec'].get('containers'), problems)
+
+    if problems:
+        raise ValidationError(problems)
+
+
+def render_digest(config_template, template_values):
+    data = json.dumps([config_template, template_values], sort_keys=True, default=str)
+
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def validate_render(config_template, template_values):
+    """Validates the job rendered from a prepared template and the values of its placeholders. Renders that were
+        already valid are remembered, so e.g. kbatchd only validates each distinct render once. Returns whether the
+        render was already validated."""
+    from k8s_jobs.template import ObjectTemplate
+
+    digest = render_digest(config_template, template_values)
+
+    with validated_renders_lock:
+        if digest in validated_renders:
+            validated_renders.move_to_end(digest)
+            return True
+
+    validate_job(ObjectTemplate(config_template).render(template_values))
+
+    with validated_renders_lock:
+        validated_renders[digest] = True
+
+        while len(validated_renders) > VALIDATION_CACHE_SIZE:
+            validated_renders.popitem(last=False)
+
+    return False
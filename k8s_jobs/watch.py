@@ -0,0 +1,233 @@
+import http.client
+import threading
+import time
+
+from k8s_jobs.api import ApiError
+from k8s_jobs.scheduler import backoff_delay
+
+
+# States of a job, the last four of which are final. Jobs that were waited for by name but weren't found when the jobs
+# were listed are NotFound
+PENDING = 'Pending'
+RUNNING = 'Running'
+COMPLETE = 'Complete'
+FAILED = 'Failed'
+DELETED = 'Deleted'
+NOT_FOUND = 'NotFound'
+
+FINAL_STATES = {COMPLETE, FAILED, DELETED, NOT_FOUND}
+
+# How long the API server keeps each watch open, which has to be less than the client's read timeout
+WATCH_TIMEOUT_SECONDS = 50
+
+
+class ResourceExpired(Exception):
+    """The resourceVersion a watch resumed from is too old, so the jobs have to be listed again."""
+
+
+def job_state(job):
+    status = job.get('status') or {}
+
+    for condition in status.get('conditions') or []:
+        if condition.get('status') == 'True' and condition.get('type') in (COMPLETE, FAILED):
+            return condition['type']
+
+    return RUNNING if status.get('active') else PENDING
+
+
+class JobWatcher(object):
+    """Keeps an index of the jobs in a namespace, by name and by label, up to date with one list of the jobs followed
+        by a watch of the changes to them, instead of listing every job again each time their status is needed.
+
+        When a watch ends it is resumed from the resourceVersion of the last change seen, so each change is only
+        sent once; the jobs are only listed again if the API server no longer has that version. Callers can block
+        until jobs reach a final state with wait().
+    """
+
+    def __init__(self, client, namespace=None, label_selector=None, timeout_seconds=WATCH_TIMEOUT_SECONDS):
+        self.client = client
+        self.path = client.jobs_path(namespace)
+        self.label_selector = label_selector
+        self.timeout_seconds = timeout_seconds
+
+        self.jobs = {}
+        self.labels = {}
+        self.deleted = set()
+        self.resource_version = None
+        self.n_lists = 0
+        self.n_events = 0
+
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def add(self, job):
+        name = job['metadata']['name']
+        self.remove(name)
+
+        self.jobs[name] = job
+        self.deleted.discard(name)
+
+        for label in (job['metadata'].get('labels') or {}).items():
+            self.labels.setdefault(label, set()).add(name)
+
+    def remove(self, name):
+        job = self.jobs.pop(name, None)
+
+        if job is None:
+            return
+
+        for label in (job['metadata'].get('labels') or {}).items():
+            self.labels[label].discard(name)
+
+            if not self.labels[label]:
+                del self.labels[label]
+
+    def list(self):
+        """Replaces the index with a list of the jobs, and sets the resourceVersion to watch from."""
+        jobs = []
+        resource_version = None
+
+        for page in self.client.list_pages(self.path, {'labelSelector': self.label_selector}):
+            jobs.extend(page.get('items') or [])
+            resource_version = resource_version or page['metadata'].get('resourceVersion')
+
+        with self.condition:
+            names = {job['metadata']['name'] for job in jobs}
+            self.deleted.update(name for name in self.jobs if name not in names)
+
+            for name in list(self.jobs):
+                self.remove(name)
+
+            for job in jobs:
+                self.add(job)
+
+            self.resource_version = resource_version
+            self.n_lists += 1
+            self.condition.notify_all()
+
+    def apply(self, event):
+        """Updates the index with a watch event."""
+        event_type = event.get('type')
+        obj = event.get('object') or {}
+
+        if event_type == 'ERROR':
+            if obj.get('code') == 410:
+                raise ResourceExpired(obj.get('message'))
+
+            raise ApiError(obj.get('code'), obj.get('reason'), '{}', None)
+
+        with self.condition:
+            if event_type in ('ADDED', 'MODIFIED'):
+                self.add(obj)
+            elif event_type == 'DELETED':
+                self.remove(obj['metadata']['name'])
+                self.deleted.add(obj['metadata']['name'])
+
+            self.resource_version = obj.get('metadata', {}).get('resourceVersion') or self.resource_version
+            self.n_events += 1
+            self.condition.notify_all()
+
+    def watch(self):
+        """Applies the events of one watch, from the last resourceVersion seen until the API server ends it."""
+        query = {'labelSelector': self.label_selector}
+
+        try:
+            for event in self.client.watch(self.path, self.resource_version, query, self.timeout_seconds):
+                self.apply(event)
+
+                if self.stopped.is_set():
+                    return
+        except ApiError as e:
+            if e.status == 410:
+                raise ResourceExpired(str(e))
+
+            raise
+
+    def run(self):
+        """Lists the jobs, then watches them until stop() is called, resuming each watch where the last one ended."""
+        attempt = 0
+
+        while not self.stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self.list()
+
+                self.watch()
+                attempt = 0
+            except ResourceExpired:
+                self.resource_version = None
+            except (ApiError, http.client.HTTPException, OSError) as e:
+                if isinstance(e, ApiError) and e.status in (401, 403, 404):
+                    self.fail(e)
+                    return
+
+                self.stopped.wait(backoff_delay(attempt))
+                attempt += 1
+            except Exception as e:
+                self.fail(e)
+                return
+
+    def fail(self, error):
+        with self.condition:
+            self.error = error
+            self.condition.notify_all()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='job-watcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def state(self, name):
+        """Returns the state of a job, or None if it has not been seen."""
+        if name in self.jobs:
+            return job_state(self.jobs[name])
+
+        return DELETED if name in self.deleted else None
+
+    def find(self, labels):
+        """Returns the names of the jobs with all of the given labels."""
+        names = None
+        for label in labels.items():
+            names = self.labels.get(label, set()) if names is None else names & self.labels.get(label, set())
+
+        return sorted(self.jobs if names is None else names)
+
+    def wait(self, names=None, timeout=None, on_final=None):
+        """Blocks until the given jobs (or all jobs being watched, once they have been listed) are in a final state,
+            or until the timeout, and returns the state of each job. Given jobs that are not found once the jobs have
+            been listed are NOT_FOUND, so they must exist before the watcher is started. on_final is called with the
+            name and state of each job as it reaches its final state."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        reported = set()
+
+        with self.condition:
+            while True:
+                if self.error is not None:
+                    raise self.error
+
+                listed = self.n_lists > 0
+                wait_names = names if names is not None else (sorted(self.jobs) if listed else [])
+                states = {name: self.state(name) or (NOT_FOUND if listed else None) for name in wait_names}
+
+                for name, state in sorted(states.items()):
+                    if state in FINAL_STATES and name not in reported:
+                        reported.add(name)
+
+                        if on_final:
+                            on_final(name, state)
+
+                if (listed or names is not None) and all(state in FINAL_STATES for state in states.values()):
+                    return states
+
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return states
+
+                self.condition.wait(remaining)
@@ -21,12 +21,15 @@ setup(name='k8s-jobs',
       py_modules=['k8s_jobs'],
       install_requires=['pyyaml', 'semantic-version'],
       scripts=['bin/kbatch',
+               'bin/kbatchd',
                'bin/kcancel',
                'bin/klist',
                'bin/krun',
+               'bin/kspool',
                'bin/kstatus',
                'bin/klogs',
                'bin/kpods',
-               'bin/kexec'],
+               'bin/kexec',
+               'bin/kwait'],
       package_data={'k8s_jobs': ['*.yaml']},
       packages=find_packages())
@@ -0,0 +1,133 @@
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from k8s_jobs import cache, validate
+
+
+@pytest.fixture(autouse=True)
+def isolated_environment(monkeypatch, tmpdir):
+    """Keeps tests from reading the user's kubeconfig or spool, or sharing caches with each other."""
+    monkeypatch.setenv('K8S_JOBS_CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.setenv('K8S_JOBS_SPOOL_DIR', str(tmpdir.join('spool')))
+    monkeypatch.setenv('KUBECONFIG', str(tmpdir.join('kubeconfig')))
+    cache.template_cache.clear()
+    validate.validated_renders.clear()
+
+
+class FakeRequest(object):
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+class FakeApiServer(ThreadingMixIn, HTTPServer):
+    """A stand-in for the Kubernetes API server. Routes map (method, path) to a function taking the FakeRequest and
+        returning (status, body) or (status, body, headers); a body that is a list is streamed as JSON lines."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super(FakeApiServer, self).__init__(('127.0.0.1', 0), FakeApiHandler)
+        self.routes = {}
+        self.requests = []
+        self.n_connections = 0
+        # Closes connections after each response without telling the client, like an idle keep-alive timeout
+        self.drop_connections = False
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{port}'.format(port=self.server_address[1])
+
+    def route(self, method, path, handler):
+        self.routes[(method, path)] = handler
+
+    def client(self, **kwargs):
+        from k8s_jobs.api import KubernetesClient
+
+        return KubernetesClient(self.url, **kwargs)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(FakeApiHandler, self).setup()
+
+        with self.server.lock:
+            self.server.n_connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+
+        request = FakeRequest(self.command, url.path, dict(urllib.parse.parse_qsl(url.query)), self.headers,
+                              json.loads(body.decode('utf-8')) if body else None)
+
+        with self.server.lock:
+            self.server.requests.append(request)
+
+        handler = self.server.routes.get((self.command, url.path))
+        response = handler(request) if handler else (404, {'kind': 'Status', 'message': 'not found'})
+
+        if response is None:
+            # The connection fails after the request was received, without a response
+            self.close_connection = True
+            return
+
+        status, response_body = response[:2]
+        headers = response[2] if len(response) > 2 else {}
+
+        self.send_response(status)
+
+        for header, value in headers.items():
+            self.send_header(header, value)
+
+        if isinstance(response_body, list):
+            # Streamed responses (watches and logs) are ended by closing the connection
+            self.send_header('Connection', 'close')
+            self.end_headers()
+
+            for item in response_body:
+                line = item if isinstance(item, str) else json.dumps(item)
+                self.wfile.write((line + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+            self.close_connection = True
+            return
+
+        data = json.dumps(response_body).encode('utf-8')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+        if self.server.drop_connections:
+            self.close_connection = True
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+
+@pytest.fixture
+def fake_api():
+    server = FakeApiServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01})
+    thread.daemon = True
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
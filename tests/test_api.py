@@ -0,0 +1,299 @@
+import base64
+import itertools
+import time
+from unittest.mock import patch
+
+import pytest
+import yaml
+
+from k8s_jobs import api, klib
+
+
+def create_job_route(fake_api, namespace='default'):
+    counter = itertools.count()
+
+    def create_job(request):
+        job = dict(request.body)
+        job['metadata'] = dict(job['metadata'], name='{prefix}{i:05d}'.format(
+            prefix=job['metadata']['generateName'],
+            i=next(counter),
+        ))
+
+        return 201, job
+
+    fake_api.route('POST', '/apis/batch/v1/namespaces/{namespace}/jobs'.format(namespace=namespace), create_job)
+
+
+def test_create_job(fake_api):
+    create_job_route(fake_api)
+    client = fake_api.client(headers={'Authorization': 'Bearer secret'})
+
+    job = client.create_job({'kind': 'Job', 'metadata': {'generateName': 'kjob-'}})
+
+    assert job['metadata']['name'] == 'kjob-00000'
+    assert fake_api.requests[0].body == {'kind': 'Job', 'metadata': {'generateName': 'kjob-'}}
+    assert fake_api.requests[0].headers['Authorization'] == 'Bearer secret'
+    assert fake_api.requests[0].headers['Content-Type'] == 'application/json'
+
+
+def test_create_job_namespace(fake_api):
+    create_job_route(fake_api, namespace='team')
+    create_job_route(fake_api, namespace='other')
+    client = fake_api.client(namespace='team')
+
+    assert client.create_job({'metadata': {'generateName': 'a-'}})['metadata']['name'] == 'a-00000'
+    assert client.create_job({'metadata': {'generateName': 'b-', 'namespace': 'other'}})['metadata']['name'] == \
+        'b-00000'
+    assert [request.path for request in fake_api.requests] == [
+        '/apis/batch/v1/namespaces/team/jobs',
+        '/apis/batch/v1/namespaces/other/jobs',
+    ]
+
+
+def test_keep_alive(fake_api):
+    create_job_route(fake_api)
+    client = fake_api.client()
+
+    names = [client.create_job({'metadata': {'generateName': 'kjob-'}})['metadata']['name'] for _ in range(20)]
+
+    assert names == ['kjob-{i:05d}'.format(i=i) for i in range(20)]
+    assert fake_api.n_connections == 1
+
+
+def wait_for_dropped_connections(client):
+    deadline = time.time() + 5
+    while not all(api.is_connection_dropped(connection) for connection in client.idle_connections):
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_reconnect_after_server_closes_connection(fake_api):
+    create_job_route(fake_api)
+    fake_api.drop_connections = True
+    client = fake_api.client()
+    names = []
+
+    for _ in range(3):
+        names.append(client.create_job({'metadata': {'generateName': 'kjob-'}})['metadata']['name'])
+        wait_for_dropped_connections(client)
+
+    assert names == ['kjob-00000', 'kjob-00001', 'kjob-00002']
+    assert fake_api.n_connections == 3
+
+
+def test_idempotent_request_retried_after_server_closes_connection(fake_api):
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs/a', lambda request: (200, {'kind': 'Job'}))
+    fake_api.drop_connections = True
+    client = fake_api.client()
+
+    # Whether or not the client notices that the connection was closed before sending, the request succeeds
+    jobs = [client.request('GET', '/apis/batch/v1/namespaces/default/jobs/a') for _ in range(3)]
+
+    assert jobs == [{'kind': 'Job'}] * 3
+
+
+def test_create_job_not_sent_again_after_it_may_have_been_received(fake_api):
+    fake_api.route('POST', '/apis/batch/v1/namespaces/default/jobs', lambda request: None)
+    client = fake_api.client()
+
+    with pytest.raises(api.UnknownOutcomeError) as error:
+        client.create_job({'metadata': {'generateName': 'kjob-'}})
+
+    assert isinstance(error.value, klib.NonRetryableError)
+    assert len(fake_api.requests) == 1
+
+
+@pytest.mark.parametrize('existing_jobs', [[], [{'metadata': {'name': 'kjob-abcde'}}]])
+def test_create_job_looks_up_job_after_unknown_outcome(fake_api, existing_jobs):
+    fake_api.route('POST', '/apis/batch/v1/namespaces/default/jobs', lambda request: None)
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs',
+                   lambda request: (200, {'metadata': {}, 'items': existing_jobs}))
+    client = fake_api.client()
+    job = {'metadata': {'generateName': 'kjob-', 'labels': {klib.BATCH_LABEL: 'batch-1', klib.ARRAY_INDEX_LABEL: '7'}}}
+
+    if existing_jobs:
+        assert client.create_job(job) == existing_jobs[0]
+    else:
+        # The job wasn't created, so creating it can be retried
+        with pytest.raises(ConnectionError) as error:
+            client.create_job(job)
+
+        assert not isinstance(error.value, klib.NonRetryableError)
+
+    assert [request.method for request in fake_api.requests] == ['POST', 'GET']
+    assert fake_api.requests[1].query == {'labelSelector': 'k8s-jobs/batch=batch-1,k8s-jobs/array-index=7'}
+
+
+def test_create_named_job_looks_up_job_after_unknown_outcome(fake_api):
+    fake_api.route('POST', '/apis/batch/v1/namespaces/default/jobs', lambda request: None)
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs/kjob-a',
+                   lambda request: (200, {'metadata': {'name': 'kjob-a'}}))
+    client = fake_api.client()
+
+    assert client.create_job({'metadata': {'name': 'kjob-a'}}) == {'metadata': {'name': 'kjob-a'}}
+
+
+@pytest.mark.parametrize('status, headers, expected_error, retry_after', [
+    (422, {}, api.NonRetryableApiError, None),
+    (403, {}, api.NonRetryableApiError, None),
+    (429, {'Retry-After': '3'}, api.ApiError, 3.0),
+    # The job may have been created, and it can't be looked up without a name or array index
+    (503, {}, api.UnknownOutcomeError, None),
+    (504, {}, api.UnknownOutcomeError, None),
+])
+def test_request_errors(fake_api, status, headers, expected_error, retry_after):
+    fake_api.route('POST', '/apis/batch/v1/namespaces/default/jobs', lambda request: (status, {
+        'kind': 'Status',
+        'message': 'mock failure',
+    }, headers))
+    client = fake_api.client()
+
+    with pytest.raises(expected_error) as error:
+        client.create_job({'metadata': {'generateName': 'kjob-'}})
+
+    assert error.value.status == status
+    assert error.value.retry_after == retry_after
+    assert 'mock failure' in str(error.value)
+    assert isinstance(error.value, klib.NonRetryableError) == (expected_error is not api.ApiError)
+
+
+def test_create_job_after_server_error(fake_api):
+    responses = iter([(504, {'kind': 'Status', 'message': 'timeout'}), (201, {'metadata': {'name': 'kjob-00000'}})])
+    fake_api.route('POST', '/apis/batch/v1/namespaces/default/jobs', lambda request: next(responses))
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs',
+                   lambda request: (200, {'metadata': {}, 'items': []}))
+    client = fake_api.client()
+    job = {'metadata': {'generateName': 'kjob-', 'labels': {klib.BATCH_LABEL: 'batch-1', klib.ARRAY_INDEX_LABEL: '0'}}}
+
+    # The job doesn't exist, so the error is retryable, and the retry creates it
+    with pytest.raises(api.ApiError) as error:
+        client.create_job(job)
+
+    assert error.value.status == 504
+    assert not isinstance(error.value, klib.NonRetryableError)
+    assert client.create_job(job)['metadata']['name'] == 'kjob-00000'
+    assert [request.method for request in fake_api.requests] == ['POST', 'GET', 'POST']
+
+
+def write_kubeconfig(tmpdir, monkeypatch, server, user):
+    path = tmpdir.join('kubeconfig')
+    path.write(yaml.safe_dump({
+        'clusters': [{'name': 'cluster', 'cluster': {'server': server}}],
+        'contexts': [
+            {'name': 'context', 'context': {'cluster': 'cluster', 'user': 'user', 'namespace': 'team'}},
+            {'name': 'other', 'context': {'cluster': 'cluster', 'user': 'user'}},
+        ],
+        'users': [{'name': 'user', 'user': user}],
+        'current-context': 'context',
+    }))
+    monkeypatch.setenv('KUBECONFIG', str(path))
+
+
+def test_from_kubeconfig(fake_api, tmpdir, monkeypatch):
+    write_kubeconfig(tmpdir, monkeypatch, fake_api.url, {'token': 'secret'})
+    create_job_route(fake_api, namespace='team')
+
+    client = api.KubernetesClient.from_kubeconfig()
+
+    assert client.namespace == 'team'
+    assert client.create_job({'metadata': {'generateName': 'kjob-'}})['metadata']['name'] == 'kjob-00000'
+    assert fake_api.requests[0].headers['Authorization'] == 'Bearer secret'
+
+    assert api.KubernetesClient.from_kubeconfig(context='other').namespace == 'default'
+
+    with pytest.raises(RuntimeError):
+        api.KubernetesClient.from_kubeconfig(context='missing')
+
+
+def test_from_kubeconfig_basic_auth(fake_api, tmpdir, monkeypatch):
+    write_kubeconfig(tmpdir, monkeypatch, fake_api.url, {'username': 'admin', 'password': 'hunter2'})
+
+    client = api.KubernetesClient.from_kubeconfig()
+
+    assert client.headers['Authorization'] == 'Basic {}'.format(base64.b64encode(b'admin:hunter2').decode('utf-8'))
+
+
+@patch('k8s_jobs.api.sp.check_output')
+def test_from_kubeconfig_exec_plugin(check_output, fake_api, tmpdir, monkeypatch):
+    write_kubeconfig(tmpdir, monkeypatch, fake_api.url, {'exec': {
+        'apiVersion': 'client.authentication.k8s.io/v1beta1',
+        'command': 'gke-gcloud-auth-plugin',
+        'args': ['--verbose'],
+    }})
+    check_output.side_effect = [
+        b'{"kind": "ExecCredential", "status": {"token": "token-1"}}',
+        b'{"kind": "ExecCredential", "status": {"token": "token-2"}}',
+    ]
+
+    responses = iter([(401, {'message': 'expired'}), (201, {'metadata': {'name': 'kjob-a'}})])
+    fake_api.route('POST', '/apis/batch/v1/namespaces/team/jobs', lambda request: next(responses))
+
+    client = api.KubernetesClient.from_kubeconfig()
+
+    assert client.create_job({'metadata': {'generateName': 'kjob-'}})['metadata']['name'] == 'kjob-a'
+    assert [request.headers['Authorization'] for request in fake_api.requests] == ['Bearer token-1', 'Bearer token-2']
+    assert check_output.call_args[0][0] == ['gke-gcloud-auth-plugin', '--verbose']
+
+
+def test_submit_manifests_api(fake_api):
+    create_job_route(fake_api)
+    client = fake_api.client()
+
+    manifests = ['kind: Job\nmetadata:\n  generateName: a-\n', 'kind: Job\nmetadata:\n  generateName: b-\n']
+
+    assert klib.submit_manifests_api(client, manifests) == ['a-00000', 'b-00001']
+
+
+def test_submit_manifests_api_partial_failure(fake_api):
+    responses = iter([(201, {'metadata': {'name': 'a-1'}}), (500, {'message': 'mock failure'})])
+    fake_api.route('POST', '/apis/batch/v1/namespaces/default/jobs', lambda request: next(responses))
+    client = fake_api.client()
+
+    with pytest.raises(klib.PartialSubmissionError) as error:
+        klib.submit_manifests_api(client, ['metadata: {generateName: a-}', 'metadata: {generateName: b-}'])
+
+    assert error.value.job_names == ['a-1']
+
+
+def test_list_pages(fake_api):
+    pages = {
+        None: {'items': [1, 2], 'metadata': {'resourceVersion': '10', 'continue': 'page-2'}},
+        'page-2': {'items': [3], 'metadata': {'resourceVersion': '10'}},
+    }
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs',
+                   lambda request: (200, pages[request.query.get('continue')]))
+    client = fake_api.client()
+
+    items = [item for page in client.list_pages(client.jobs_path(), {'labelSelector': 'a=b'}, limit=2)
+             for item in page['items']]
+
+    assert items == [1, 2, 3]
+    assert [request.query for request in fake_api.requests] == [
+        {'labelSelector': 'a=b', 'limit': '2'},
+        {'labelSelector': 'a=b', 'limit': '2', 'continue': 'page-2'},
+    ]
+
+
+def test_watch(fake_api):
+    events = [{'type': 'ADDED', 'object': {'metadata': {'name': 'a'}}}, '',
+              {'type': 'DELETED', 'object': {'metadata': {'name': 'a'}}}]
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs', lambda request: (200, events))
+    client = fake_api.client()
+
+    assert list(client.watch(client.jobs_path(), resource_version='10', timeout_seconds=30)) == [events[0], events[2]]
+    assert fake_api.requests[0].query == {
+        'watch': '1',
+        'allowWatchBookmarks': 'true',
+        'resourceVersion': '10',
+        'timeoutSeconds': '30',
+    }
+
+
+def test_watch_error(fake_api):
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs',
+                   lambda request: (410, {'kind': 'Status', 'message': 'too old resource version'}))
+
+    with pytest.raises(api.ApiError) as error:
+        list(fake_api.client().watch('/apis/batch/v1/namespaces/default/jobs', resource_version='1'))
+
+    assert error.value.status == 410
@@ -0,0 +1,87 @@
+from argparse import Namespace
+
+import yaml
+
+from k8s_jobs import batch
+
+
+def kbatch_args(**kwargs):
+    args = dict(file=None,
+                script=None,
+                cmd_args=['echo', '$(ARRAY_INDEX)'],
+                image='syncing/the-ship',
+                preemptible=None,
+                name='kjob',
+                container_name=None,
+                time=None,
+                cpu=None,
+                memory=None,
+                disk=None,
+                cpu_limit=None,
+                memory_limit=None,
+                disk_limit=None,
+                persistent_disk_name=None,
+                mount_path=None,
+                volume_name=None,
+                retry_limit=None,
+                labels=[],
+                partition=None,
+                volume_read_write=None,
+                array=None,
+                params_file=None,
+                chunk_size=200,
+                concurrency=4,
+                rate=None,
+                backend='kubectl',
+                render_mode='text',
+                use_temp_file=False)
+    args.update(kwargs)
+
+    return Namespace(**args)
+
+
+class FakeSubmitter(object):
+    def __init__(self, fail_chunks=()):
+        self.chunks = []
+        self.fail_chunks = fail_chunks
+
+    def __call__(self, manifests):
+        jobs = [yaml.safe_load(manifest) if isinstance(manifest, str) else manifest for manifest in manifests]
+        # The fake job names are the argument echoed by each job
+        job_names = [job['spec']['template']['spec']['containers'][0]['command'][-1].split()[-1] for job in jobs]
+
+        if any(job_name in self.fail_chunks for job_name in job_names):
+            raise batch.PartialSubmissionError([], len(manifests))
+
+        self.chunks.append(jobs)
+
+        return job_names
+
+
+def test_submit_job():
+    submit = FakeSubmitter()
+
+    assert batch.submit_job(kbatch_args(cmd_args=['echo', 'hello']), submit) == ['hello']
+    assert submit.chunks[0][0]['metadata']['generateName'] == 'kjob-'
+
+
+def test_submit_job_array():
+    submit = FakeSubmitter(fail_chunks=['4'])
+    job_names = []
+    args = kbatch_args(array=5, chunk_size=2, render_mode='object')
+
+    summary = batch.submit_job_array(args, submit, job_names.extend)
+
+    assert sorted(job_names) == ['0', '1', '2', '3']
+    assert [len(chunk) for chunk in submit.chunks] == [2, 2]
+    assert len(summary.failed) == 1
+
+    report = batch.array_report(args, summary)
+    assert '\n  array indexes 4-4: failed after 1 attempt(s): Only 0 of 1 jobs were created: \n' in report
+    assert report.endswith('\nBatch {batch_id} (cancel with: kcancel --batch {batch_id})'.format(
+        batch_id=args.batch_id))
+
+
+def test_api_backend_submits_jobs_individually():
+    assert batch.array_chunk_size(kbatch_args(backend='api', chunk_size=200)) == 1
+    assert batch.array_chunk_size(kbatch_args(backend='kubectl', chunk_size=200)) == 200
@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess as sp
+import sys
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def run_suite(*args):
+    return sp.run([sys.executable, os.path.join('benchmarks', 'suite.py'), '--quick', '--min-time', '0'] + list(args),
+                  cwd=root_dir, stdout=sp.PIPE, stderr=sp.PIPE, universal_newlines=True)
+
+
+def test_suite_report(tmpdir):
+    output = str(tmpdir.join('report.json'))
+    process = run_suite('--filter', 'submit_array', '--output', output)
+
+    assert process.returncode == 0, process.stderr
+
+    with open(output) as f:
+        report = json.load(f)
+
+    assert report['quick']
+    assert sorted(report['benchmarks']) == ['submit_array[api]', 'submit_array[kubectl]']
+
+    for result in report['benchmarks'].values():
+        assert result['jobs_per_second'] > 0
+        assert result['peak_memory_bytes_per_job'] > 0
+
+
+def test_suite_compare_regression(tmpdir):
+    baseline = str(tmpdir.join('baseline.json'))
+
+    with open(baseline, 'w') as f:
+        json.dump({'benchmarks': {
+            'render_job_yaml[default_cmd.yaml]': {'jobs_per_second': 1e12},
+            'render_job[default_cmd.yaml]': {'jobs_per_second': 1e-3},
+        }}, f)
+
+    process = run_suite('--filter', '[default_cmd.yaml]', '--compare', baseline)
+
+    assert process.returncode == 1
+    assert 'render_job_yaml[default_cmd.yaml]' in process.stdout.splitlines()[-1]
+    assert 'render_job[default_cmd.yaml]' not in process.stdout.splitlines()[-1]
+    assert 'SLOWER' in process.stdout
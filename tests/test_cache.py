@@ -0,0 +1,106 @@
+import os
+from unittest.mock import patch
+
+from k8s_jobs import cache
+
+
+def test_cache_dir(monkeypatch):
+    monkeypatch.setenv('K8S_JOBS_CACHE_DIR', '/tmp/k8s-jobs-cache')
+    assert cache.cache_dir() == '/tmp/k8s-jobs-cache'
+
+    monkeypatch.delenv('K8S_JOBS_CACHE_DIR')
+    monkeypatch.setenv('XDG_CACHE_HOME', '/tmp/xdg-cache')
+    assert cache.cache_dir() == os.path.join('/tmp/xdg-cache', 'k8s-jobs')
+
+
+def test_cluster_capabilities():
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1') is None
+
+    cache.write_cluster_capabilities('context-1@https://10.0.0.1', {'server_version': '1.10.5'})
+    cache.write_cluster_capabilities('context-2@https://10.0.0.2', {'server_version': '1.11.0'})
+
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1') == {'server_version': '1.10.5'}
+    assert cache.read_cluster_capabilities('context-2@https://10.0.0.2') == {'server_version': '1.11.0'}
+    assert cache.read_cluster_capabilities('context-3@https://10.0.0.3') is None
+
+
+@patch('k8s_jobs.cache.time.time')
+def test_cluster_capabilities_ttl(time, monkeypatch):
+    time.return_value = 1000.0
+    cache.write_cluster_capabilities('context-1@https://10.0.0.1', {'server_version': '1.10.5'})
+
+    time.return_value = 1000.0 + cache.CLUSTER_CACHE_TTL_SECONDS
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1') == {'server_version': '1.10.5'}
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1', ttl=60) is None
+
+    monkeypatch.setenv('K8S_JOBS_CLUSTER_CACHE_TTL', '10')
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1') is None
+
+    time.return_value = 1000.0 + cache.CLUSTER_CACHE_TTL_SECONDS + 1
+    monkeypatch.delenv('K8S_JOBS_CLUSTER_CACHE_TTL')
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1') is None
+
+
+def test_read_corrupt_cache():
+    os.makedirs(cache.cache_dir())
+    with open(cache.cluster_cache_path(), 'w') as f:
+        f.write('{not json')
+
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1') is None
+
+    cache.write_cluster_capabilities('context-1@https://10.0.0.1', {'server_version': '1.10.5'})
+    assert cache.read_cluster_capabilities('context-1@https://10.0.0.1') == {'server_version': '1.10.5'}
+
+
+def test_template_digest():
+    assert cache.template_digest('kind: Job') == cache.template_digest('kind: Job')
+    assert cache.template_digest('kind: Job') != cache.template_digest('kind: Pod')
+
+    digest = cache.template_digest('kind: Job')
+
+    # Upgrading k8s-jobs invalidates cached templates
+    with patch('k8s_jobs.cache.__version__', '0.0.0'):
+        assert cache.template_digest('kind: Job') != digest
+
+
+def test_template_cache():
+    digest = cache.template_digest('kind: Job')
+
+    assert cache.read_template(digest) is None
+
+    cache.write_template(digest, '{"kind": "Job"}')
+
+    assert cache.read_template(digest) == '{"kind": "Job"}'
+
+    # A new process only has the on-disk cache
+    cache.template_cache.clear()
+
+    assert cache.read_template(digest) == '{"kind": "Job"}'
+    assert digest in cache.template_cache
+
+
+def test_template_cache_memory_only(monkeypatch):
+    monkeypatch.setenv('K8S_JOBS_TEMPLATE_CACHE', '0')
+    digest = cache.template_digest('kind: Job')
+
+    cache.write_template(digest, '{"kind": "Job"}')
+    assert cache.read_template(digest) == '{"kind": "Job"}'
+
+    cache.template_cache.clear()
+    assert cache.read_template(digest) is None
+    assert not os.path.exists(cache.template_cache_path(digest))
+
+
+@patch('k8s_jobs.cache.TEMPLATE_CACHE_SIZE', 2)
+@patch('k8s_jobs.cache.TEMPLATE_DISK_CACHE_SIZE', 3)
+def test_template_cache_size():
+    for i in range(5):
+        cache.write_template('digest-{i}'.format(i=i), '{}')
+        os.utime(cache.template_cache_path('digest-{i}'.format(i=i)), (i, i))
+
+    assert list(cache.template_cache) == ['digest-3', 'digest-4']
+    assert sorted(os.listdir(os.path.join(cache.cache_dir(), 'templates'))) == [
+        'digest-2.json',
+        'digest-3.json',
+        'digest-4.json',
+    ]
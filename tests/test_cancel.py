@@ -0,0 +1,77 @@
+from k8s_jobs import cancel
+from k8s_jobs.klib import batch_selector
+
+
+jobs_path = '/apis/batch/v1/namespaces/default/jobs'
+
+
+def job(name):
+    return {'metadata': {'name': name}}
+
+
+def test_delete_job(fake_api):
+    fake_api.route('DELETE', '{jobs_path}/kjob-a'.format(jobs_path=jobs_path), lambda request: (200, job('kjob-a')))
+    fake_api.route('DELETE', '{jobs_path}/kjob-b'.format(jobs_path=jobs_path),
+                   lambda request: (404, {'kind': 'Status', 'message': 'jobs.batch "kjob-b" not found'}))
+
+    client = fake_api.client()
+
+    assert cancel.delete_job(client, 'kjob-a') is True
+    assert cancel.delete_job(client, 'kjob-b') is False
+    assert fake_api.requests[0].body['propagationPolicy'] == 'Background'
+
+
+def test_delete_jobs_matching(fake_api):
+    fake_api.route('DELETE', jobs_path, lambda request: (200, {'items': [job('kjob-a'), job('kjob-b')]}))
+
+    selector = batch_selector('20200101-000000-abcdef')
+
+    assert cancel.delete_jobs_matching(fake_api.client(), selector) == ['kjob-a', 'kjob-b']
+    assert fake_api.requests[0].query == {'labelSelector': 'k8s-jobs/batch=20200101-000000-abcdef'}
+    assert fake_api.requests[0].body['propagationPolicy'] == 'Background'
+
+
+def test_job_names_with_prefix(fake_api):
+    fake_api.route('GET', jobs_path, lambda request: (200, {'metadata': {}, 'items': [
+        job('align-1'), job('sort-1'), job('align-2'),
+    ]}))
+
+    assert cancel.job_names_with_prefix(fake_api.client(), 'align-', label_selector='app=x') == ['align-1', 'align-2']
+    assert fake_api.requests[0].query == {'labelSelector': 'app=x', 'limit': '500'}
+
+
+def test_delete_jobs(fake_api):
+    for i in range(20):
+        name = 'kjob-{i}'.format(i=i)
+        fake_api.route('DELETE', '{jobs_path}/{name}'.format(jobs_path=jobs_path, name=name),
+                       lambda request, name=name: (200, job(name)))
+
+    fake_api.route('DELETE', '{jobs_path}/kjob-missing'.format(jobs_path=jobs_path),
+                   lambda request: (404, {'kind': 'Status', 'message': 'not found'}))
+
+    names = ['kjob-{i}'.format(i=i) for i in range(20)] + ['kjob-missing']
+    results = []
+    summary = cancel.delete_jobs(fake_api.client(), names, concurrency=4, on_result=results.append)
+
+    assert summary.failed == []
+    assert len(results) == 21
+    assert [result.item for result in summary.succeeded if not result.value] == ['kjob-missing']
+    assert sorted(request.path for request in fake_api.requests) == \
+        sorted('{jobs_path}/{name}'.format(jobs_path=jobs_path, name=name) for name in names)
+
+
+def test_progress_reporter():
+    lines = []
+    times = iter([0.0, 0.5, 1.0, 1.2, 2.0])
+
+    class Output(object):
+        def write(self, data):
+            if data.strip():
+                lines.append(data)
+
+    progress = cancel.ProgressReporter(4, interval=1.0, file=Output(), clock=lambda: next(times))
+
+    for _ in range(4):
+        progress(None)
+
+    assert lines == ['Deleted 2/4 jobs (2.0/s)', 'Deleted 4/4 jobs (2.0/s)']
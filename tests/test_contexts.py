@@ -0,0 +1,147 @@
+import itertools
+import json
+from unittest.mock import call, patch
+
+import pytest
+
+from k8s_jobs import batch, contexts
+from test_batch import kbatch_args
+from test_nodes import node
+
+
+@pytest.fixture
+def clusters(fake_api, tmpdir, monkeypatch):
+    """Two kube contexts, a and b, both for the fake API server, with jobs in the namespace of the same name."""
+    kubeconfig = tmpdir.join('kubeconfig')
+    kubeconfig.write('\n'.join([
+        'current-context: a',
+        'contexts:',
+        '- {name: a, context: {cluster: fake, namespace: a}}',
+        '- {name: b, context: {cluster: fake, namespace: b}}',
+        'clusters:',
+        '- {{name: fake, cluster: {{server: "{url}"}}}}'.format(url=fake_api.url),
+    ]))
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig))
+
+    job_ids = itertools.count()
+
+    def create_job(request):
+        return 201, dict(request.body, metadata=dict(request.body['metadata'], name='kjob-{}'.format(next(job_ids))))
+
+    for namespace in ['a', 'b']:
+        fake_api.route('POST', '/apis/batch/v1/namespaces/{}/jobs'.format(namespace), create_job)
+
+    return fake_api
+
+
+def created_jobs(fake_api, namespace):
+    return [request.body for request in fake_api.requests
+            if request.method == 'POST' and request.path == '/apis/batch/v1/namespaces/{}/jobs'.format(namespace)]
+
+
+def test_parse_contexts():
+    assert contexts.parse_contexts('a=2,b, c=0.5') == [('a', 2.0), ('b', 1.0), ('c', 0.5)]
+
+
+@pytest.mark.parametrize('value, error', [
+    ('a,,b', 'empty context name'),
+    ('a,a=2', 'more than once'),
+    ('a=x', 'must be a number'),
+    ('a=-1', 'must not be negative'),
+    ('a=0,b=0', 'at least one context'),
+])
+def test_parse_contexts_invalid(value, error):
+    with pytest.raises(ValueError, match=error):
+        contexts.parse_contexts(value)
+
+
+@pytest.mark.parametrize('n, weights, expected', [
+    (10, [1, 1], [5, 5]),
+    (10, [2, 1], [7, 3]),
+    (10, [1, 1, 1], [4, 3, 3]),
+    (3, [0, 5, 0], [0, 3, 0]),
+    (5, [0, 0], [3, 2]),
+    (0, [1, 2], [0, 0]),
+])
+def test_shard_counts(n, weights, expected):
+    assert contexts.shard_counts(n, weights) == expected
+
+
+def test_submit_job_array_sharded(clusters, tmpdir):
+    args = kbatch_args(array=8, backend='api', render_mode='object', batch_id='batch-1')
+    job_names = []
+
+    shards = batch.submit_job_array_sharded(args, [('a', 3), ('b', 1)],
+                                            lambda context, names: job_names.extend((context, name) for name in names))
+
+    a_jobs, b_jobs = created_jobs(clusters, 'a'), created_jobs(clusters, 'b')
+    assert len(a_jobs) == 6
+    assert len(b_jobs) == 2
+    # Each context gets a contiguous range of the array, and the whole array is one batch
+    assert sorted(job['metadata']['labels']['k8s-jobs/array-index'] for job in b_jobs) == ['6', '7']
+    assert {job['metadata']['labels']['k8s-jobs/batch'] for job in a_jobs + b_jobs} == {'batch-1'}
+    assert sorted(context for context, _ in job_names) == ['a'] * 6 + ['b'] * 2
+    assert [(shard.first_index, len(shard.job_names)) for shard in shards] == [(0, 6), (6, 2)]
+
+    manifest_path = str(tmpdir.join('manifest.json'))
+    contexts.write_manifest(manifest_path, args.batch_id, shards, batch.array_chunk_size(args))
+    manifest = contexts.read_manifest(manifest_path)
+
+    assert manifest['batch_id'] == 'batch-1'
+    assert [(entry['context'], entry['namespace'], entry['n_jobs'], entry['failed_indexes'])
+            for entry in manifest['contexts']] == [('a', 'a', 6, []), ('b', 'b', 2, [])]
+    assert sorted(manifest['contexts'][1]['jobs']) == sorted(shards[1].job_names)
+
+    report = batch.sharded_array_report(args, shards, manifest_path)
+    assert report.splitlines()[1].startswith('b: Submitted 2 of 2 jobs')
+    assert 'kcancel --manifest {path}'.format(path=manifest_path) in report
+
+
+@patch('k8s_jobs.klib.verify_retry_limit_supported')
+def test_submit_job_array_sharded_checks_version_of_each_context(verify_retry_limit_supported, clusters):
+    args = kbatch_args(array=2, backend='api', render_mode='object', retry_limit=3)
+
+    batch.submit_job_array_sharded(args, [('a', 1), ('b', 1)])
+
+    assert verify_retry_limit_supported.call_args_list == [call(3, 'a'), call(3, 'b')]
+
+
+@patch('k8s_jobs.klib.run_kubectl_create', return_value=['kjob-abcde'])
+def test_kubectl_submitter_context(run_kubectl_create):
+    assert batch.manifest_submitter('kubectl', context='b')([{'kind': 'Job'}]) == ['kjob-abcde']
+
+    assert run_kubectl_create.call_args[0][:2] == (['--context', 'b', '-f', '-'], 1)
+
+
+def test_submit_job_array_sharded_by_capacity(clusters):
+    node_lists = itertools.count()
+
+    def nodes(request):
+        # Both contexts are the same server, so the first one asked has room for 3 jobs and the other for 1
+        n_nodes = 3 if next(node_lists) == 0 else 1
+        return 200, {'metadata': {}, 'items': [node('node-{}'.format(i), '2', '8Gi') for i in range(n_nodes)]}
+
+    clusters.route('GET', '/api/v1/nodes', nodes)
+    clusters.route('GET', '/api/v1/pods', lambda request: (200, {'metadata': {}, 'items': []}))
+    args = kbatch_args(array=8, backend='api', render_mode='object', cpu='2', shard_by='capacity')
+
+    shards = batch.submit_job_array_sharded(args, [('a', 1), ('b', 1)])
+
+    assert sorted(shard.capacity for shard in shards) == [1, 3]
+    assert sorted(len(shard.manifests) for shard in shards) == [2, 6]
+    assert len(created_jobs(clusters, 'a')) + len(created_jobs(clusters, 'b')) == 8
+
+
+def test_read_manifest_invalid(tmpdir):
+    path = tmpdir.join('manifest.json')
+    path.write(json.dumps({'jobs': []}))
+
+    with pytest.raises(ValueError, match='not a kbatch manifest'):
+        contexts.read_manifest(str(path))
+
+
+def test_map_manifest(clusters):
+    manifest = {'batch_id': 'batch-1', 'contexts': [{'context': 'a', 'namespace': 'a'}, {'context': 'b'}]}
+
+    assert contexts.map_manifest(manifest, lambda client, namespace, entry: namespace) == ['a', None]
+    assert contexts.map_manifest(manifest, lambda client, namespace, entry: namespace, 'other') == ['other', 'other']
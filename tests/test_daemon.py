@@ -0,0 +1,135 @@
+import os
+import subprocess as sp
+import sys
+import threading
+
+import pytest
+
+from k8s_jobs import __version__, daemon
+
+from test_batch import FakeSubmitter, kbatch_args
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+@pytest.fixture
+def kbatchd(tmpdir, monkeypatch):
+    """Runs kbatchd in a thread, submitting jobs with a FakeSubmitter."""
+    path = str(tmpdir.join('kbatchd.sock'))
+    monkeypatch.setenv('KBATCHD_SOCKET', path)
+
+    submit = FakeSubmitter(fail_chunks=['fail'])
+    server = daemon.make_server(path, daemon.KbatchDaemon(submitter=lambda backend: submit))
+    server.submit = submit
+
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01})
+    thread.daemon = True
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def request(message):
+    return list(daemon.send_request(daemon.connect(), message))
+
+
+def test_ping(kbatchd):
+    assert request({'op': 'ping'}) == [{'done': True, 'version': __version__, 'pid': os.getpid()}]
+
+
+def test_submit_job(kbatchd):
+    responses = request(daemon.submit_request(kbatch_args(cmd_args=['echo', 'hello'])))
+
+    assert responses == [{'job_names': ['hello']}, {'done': True}]
+    assert kbatchd.submit.chunks[0][0]['metadata']['generateName'] == 'kjob-'
+
+
+def test_submit_job_array(kbatchd):
+    responses = request(daemon.submit_request(kbatch_args(array=3, chunk_size=2)))
+
+    assert sorted(name for response in responses[:-1] for name in response['job_names']) == ['0', '1', '2']
+    assert responses[-1]['done']
+    assert responses[-1]['failed'] == 0
+    assert responses[-1]['report'].startswith('Submitted 3 of 3 jobs')
+
+
+def test_submit_error(kbatchd):
+    responses = request(daemon.submit_request(kbatch_args(cmd_args=['echo', 'fail'])))
+
+    assert responses == [{'done': True, 'error': 'PartialSubmissionError: Only 0 of 1 jobs were created: '}]
+
+
+def test_submit_falls_back_for_different_environment(kbatchd, monkeypatch):
+    message = daemon.submit_request(kbatch_args())
+    monkeypatch.setenv('KUBECONFIG', '/other/kubeconfig')
+
+    responses = request(message)
+
+    assert responses[0]['fallback']
+    assert kbatchd.submit.chunks == []
+
+
+def test_multiple_requests_per_connection(kbatchd):
+    sock = daemon.connect()
+
+    with sock.makefile('rwb') as f:
+        f.write(b'{"op": "ping"}\nnot json\n{"op": "ping"}\n')
+        f.flush()
+
+        assert [b'"done": true' in f.readline() for _ in range(3)] == [True, True, True]
+
+    sock.close()
+
+
+def test_submit_request(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+
+    message = daemon.submit_request(kbatch_args(file='job.yaml', params_file='params.tsv', no_daemon=False))
+
+    assert message['version'] == __version__
+    assert message['args']['file'] == str(tmpdir.join('job.yaml'))
+    assert message['args']['params_file'] == str(tmpdir.join('params.tsv'))
+    assert message['args']['script'] is None
+    assert 'no_daemon' not in message['args']
+
+
+def test_connect_without_daemon(tmpdir):
+    with pytest.raises(daemon.DaemonUnavailable):
+        daemon.connect(str(tmpdir.join('missing.sock')))
+
+
+def test_make_server_replaces_stale_socket(kbatchd, tmpdir):
+    with pytest.raises(RuntimeError):
+        daemon.make_server(kbatchd.server_address)
+
+    stale_path = str(tmpdir.join('stale.sock'))
+    tmpdir.join('stale.sock').write('')
+
+    server = daemon.make_server(stale_path, daemon.KbatchDaemon(submitter=lambda backend: None))
+    server.server_close()
+
+    assert oct(os.stat(stale_path).st_mode & 0o777) == oct(0o600)
+
+
+def test_kbatch_uses_daemon(kbatchd):
+    env = dict(os.environ, PYTHONPATH=root_dir)
+
+    def kbatch(*args):
+        return sp.run([sys.executable, 'bin/kbatch', '-i', 'syncing/the-ship'] + list(args), cwd=root_dir, env=env,
+                      stdout=sp.PIPE, stderr=sp.PIPE)
+
+    process = kbatch('--array', '2', '--', 'echo $(ARRAY_INDEX)')
+
+    assert sorted(process.stdout.decode('utf-8').split()) == ['0', '1']
+    assert 'Submitted 2 of 2 jobs' in process.stderr.decode('utf-8')
+    assert process.returncode == 0
+
+    process = kbatch('--', 'echo fail')
+
+    assert process.stderr.decode('utf-8') == 'kbatchd: PartialSubmissionError: Only 0 of 1 jobs were created: \n'
+    assert process.returncode == 1
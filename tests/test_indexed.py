@@ -0,0 +1,210 @@
+import subprocess as sp
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from k8s_jobs import batch, indexed, klib, scripts
+from k8s_jobs.validate import ValidationError
+from k8s_jobs.watch import COMPLETE, FAILED, PENDING, RUNNING
+from test_batch import kbatch_args
+
+
+CONFIGMAPS_PATH = '/api/v1/namespaces/default/configmaps'
+PARAMS = [
+    {'SAMPLE': 'sample-1', 'READS': 'gs://bucket/sample 1.fq'},
+    {'SAMPLE': "it's", 'READS': '$(not run)'},
+]
+
+
+@pytest.fixture(autouse=True)
+def forget_configmaps():
+    scripts.known_configmaps.clear()
+
+
+def test_params_env_is_sourced_verbatim(tmpdir):
+    env_file = tmpdir.join('1.env')
+    env_file.write(indexed.params_env(PARAMS[1]))
+
+    output = sp.check_output(['/bin/sh', '-c', '. {path} && echo "$SAMPLE|$READS"'.format(path=env_file)])
+
+    assert output.decode('utf-8') == "it's|$(not run)\n"
+
+
+@pytest.mark.parametrize('value, indexes', [
+    ('', set()),
+    ('3', {3}),
+    ('0-2,5,7-8', {0, 1, 2, 5, 7, 8}),
+])
+def test_parse_and_format_indexes(value, indexes):
+    assert indexed.parse_indexes(value) == indexes
+    assert indexed.format_indexes(indexes) == value
+
+
+def test_render_indexed_job_array():
+    job = indexed.render_indexed_job(kbatch_args(array=10, max_running=4, indexed=True))
+
+    assert job['spec']['completionMode'] == 'Indexed'
+    assert job['spec']['completions'] == 10
+    assert job['spec']['parallelism'] == 4
+    assert job['spec']['template']['spec']['containers'][0]['command'] == [
+        '/bin/sh', '-c', 'echo $(JOB_COMPLETION_INDEX)',
+    ]
+    # A single job is submitted, so it isn't labeled with an array index
+    assert klib.ARRAY_INDEX_LABEL not in job['metadata']['labels']
+    assert 'volumes' not in job['spec']['template']['spec']
+
+
+def test_render_indexed_job_params():
+    args = kbatch_args(cmd_args=['align', '--sample', '$(SAMPLE)', '$(READS)'], indexed=True, params_hash='abc')
+
+    job = indexed.render_indexed_job(args, PARAMS)
+    pod_spec = job['spec']['template']['spec']
+
+    assert job['spec']['completions'] == 2
+    assert job['spec']['parallelism'] == 2
+    assert job['metadata']['labels'][klib.PARAMS_HASH_LABEL] == 'abc'
+    assert pod_spec['containers'][0]['command'] == [
+        '/bin/sh', '-c', '. /etc/kbatch-params/${JOB_COMPLETION_INDEX}.env && align --sample ${SAMPLE} ${READS}',
+    ]
+    assert pod_spec['containers'][0]['volumeMounts'] == [
+        {'name': 'kbatch-params', 'mountPath': '/etc/kbatch-params', 'readOnly': True},
+    ]
+    assert pod_spec['volumes'] == [{'name': 'kbatch-params', 'configMap': {'name': 'kbatch-params-abc'}}]
+
+
+def test_render_indexed_job_params_without_shell(tmpdir):
+    template = tmpdir.join('job.yaml')
+    template.write('\n'.join([
+        'apiVersion: batch/v1',
+        'kind: Job',
+        'metadata: {generateName: align-}',
+        'spec:',
+        '  template:',
+        '    spec:',
+        '      restartPolicy: Never',
+        '      containers:',
+        '      - {name: align, image: aligner, command: [align, $(SAMPLE)]}',
+    ]))
+
+    with pytest.raises(ValidationError, match='/bin/sh -c'):
+        indexed.render_indexed_job(kbatch_args(file=str(template), cmd_args=[], params_hash='abc'), PARAMS)
+
+
+def test_render_indexed_job_params_in_labels():
+    args = kbatch_args(cmd_args=['align', '$(SAMPLE)'], indexed=True, params_hash='abc', job_labels=['s=$(SAMPLE)'])
+
+    with pytest.raises(ValidationError, match=r'\$\(SAMPLE\) is used in metadata\.labels\.s,'):
+        indexed.render_indexed_job(args, PARAMS)
+
+
+def test_render_indexed_job_params_outside_shell_command(tmpdir):
+    template = tmpdir.join('job.yaml')
+    template.write('\n'.join([
+        'apiVersion: batch/v1',
+        'kind: Job',
+        'metadata: {generateName: align-}',
+        'spec:',
+        '  template:',
+        '    spec:',
+        '      restartPolicy: Never',
+        '      containers:',
+        '      - name: align',
+        '        image: aligner',
+        '        command: [/bin/sh, -c, align $(SAMPLE)]',
+        '        args: [$(READS)]',
+        '        env: [{name: SAMPLE_NAME, value: $(SAMPLE)}]',
+    ]))
+
+    with pytest.raises(ValidationError) as error:
+        indexed.render_indexed_job(kbatch_args(file=str(template), cmd_args=[], params_hash='abc'), PARAMS)
+
+    assert [problem.split(',')[0] for problem in error.value.problems] == [
+        '--params-file: $(READS) is used in spec.template.spec.containers.0.args.0',
+        '--params-file: $(SAMPLE) is used in spec.template.spec.containers.0.env.0.value',
+    ]
+
+
+def test_render_indexed_job_too_many():
+    with pytest.raises(ValidationError):
+        indexed.render_indexed_job(kbatch_args(array=indexed.MAX_COMPLETIONS + 1))
+
+
+def test_ensure_params_configmap(fake_api):
+    fake_api.route('POST', CONFIGMAPS_PATH, lambda request: (201, request.body))
+
+    digest = indexed.ensure_params_configmap(fake_api.client(), PARAMS, now=1000)
+
+    configmap = fake_api.requests[0].body
+    assert configmap['metadata']['name'] == 'kbatch-params-{digest}'.format(digest=digest)
+    assert configmap['metadata']['labels'] == {klib.PARAMS_HASH_LABEL: digest}
+    assert sorted(configmap['data']) == ['0.env', '1.env']
+    assert configmap['data']['0.env'] == "export READS='gs://bucket/sample 1.fq'\nexport SAMPLE='sample-1'\n"
+
+
+def test_submit_job_indexed(fake_api, tmpdir):
+    params_file = tmpdir.join('params.tsv')
+    params_file.write('SAMPLE\tREADS\nsample-1\ta.fq\nsample-2\tb.fq\nsample-3\tc.fq\n')
+    fake_api.route('POST', CONFIGMAPS_PATH, lambda request: (201, request.body))
+    submit = MagicMock(return_value=['align-abcde'])
+    args = kbatch_args(params_file=str(params_file), indexed=True, cmd_args=['align', '$(SAMPLE)'])
+
+    assert not batch.is_array(args)
+
+    with patch('k8s_jobs.api.KubernetesClient.from_kubeconfig', return_value=fake_api.client()):
+        assert batch.submit_job(args, submit) == ['align-abcde']
+
+    job = submit.call_args[0][0][0]
+    assert job['spec']['completions'] == 3
+    assert job['metadata']['labels'][klib.PARAMS_HASH_LABEL] == args.params_hash
+    assert fake_api.requests[0].body['metadata']['name'] == indexed.params_configmap_name(args.params_hash)
+
+
+def pod(name, index, phase, created):
+    return {
+        'metadata': {
+            'name': name,
+            'creationTimestamp': created,
+            'annotations': {indexed.INDEX_ANNOTATION: str(index)},
+        },
+        'status': {'phase': phase},
+    }
+
+
+def test_index_states():
+    job = {
+        'spec': {'completions': 5, 'completionMode': 'Indexed'},
+        'status': {'active': 2, 'completedIndexes': '0,2', 'failedIndexes': '4'},
+    }
+    pods = [
+        pod('job-0-a', 0, 'Succeeded', '2026-01-01T00:00:00Z'),
+        pod('job-1-b', 1, 'Running', '2026-01-01T00:02:00Z'),
+        pod('job-1-a', 1, 'Failed', '2026-01-01T00:01:00Z'),
+        pod('job-2-a', 2, 'Succeeded', '2026-01-01T00:00:00Z'),
+        pod('job-3-a', 3, 'Pending', '2026-01-01T00:00:00Z'),
+        {'metadata': {'name': 'other'}, 'status': {'phase': 'Running'}},
+    ]
+
+    states = indexed.index_states(job, pods)
+
+    assert [(state['index'], state['state'], state['attempts'], state['pod']) for state in states] == [
+        (0, COMPLETE, 1, 'job-0-a'),
+        (1, RUNNING, 2, 'job-1-b'),
+        (2, COMPLETE, 1, 'job-2-a'),
+        (3, PENDING, 1, 'job-3-a'),
+        (4, FAILED, 0, None),
+    ]
+    assert indexed.format_index_summary(states) == '2 complete, 1 failed (4), 1 running, 1 pending'
+
+
+def test_index_states_of_failed_job():
+    job = {
+        'spec': {'completions': 2, 'completionMode': 'Indexed'},
+        'status': {'completedIndexes': '0', 'conditions': [{'type': 'Failed', 'status': 'True'}]},
+    }
+
+    assert [state['state'] for state in indexed.index_states(job, [])] == [COMPLETE, FAILED]
+
+
+def test_completion_index_from_label():
+    assert indexed.completion_index({'metadata': {'labels': {indexed.INDEX_ANNOTATION: '7'}}}) == 7
+    assert indexed.completion_index({'metadata': {}}) is None
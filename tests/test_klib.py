@@ -128,6 +128,66 @@ def test_verify_retry_limit_supported(Popen, num_retries, kubernetes_version, sh
         Popen.assert_called_once_with('kubectl version -o json', shell=True, stdout=sp.PIPE)
 
 
+def kubeconfig_for_context(context_name):
+    return """
+clusters:
+- cluster:
+    server: https://{context_name}.example.com
+  name: cluster
+contexts:
+- context:
+    cluster: cluster
+  name: {context_name}
+current-context: {context_name}
+""".format(context_name=context_name)
+
+
+@patch('k8s_jobs.klib.sp.Popen')
+def test_get_kubernetes_version_cached_per_context(Popen, tmpdir, monkeypatch):
+    popen_retval = MagicMock()
+    popen_retval.communicate.return_value = json.dumps({
+        'serverVersion': {'gitVersion': 'v1.11.0-gke.3'},
+    }).encode('utf-8'), None
+    Popen.return_value = popen_retval
+
+    kubeconfig_path = tmpdir.join('kubeconfig')
+    kubeconfig_path.write(kubeconfig_for_context('context-1'))
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig_path))
+
+    assert klib.get_kubernetes_version() == '1.11.0'
+    assert klib.get_kubernetes_version() == '1.11.0'
+    assert Popen.call_count == 1
+
+    # Switching to another context asks its cluster for the version
+    kubeconfig_path.write(kubeconfig_for_context('context-2'))
+    popen_retval.communicate.return_value = json.dumps({
+        'serverVersion': {'gitVersion': 'v1.10.0'},
+    }).encode('utf-8'), None
+
+    assert klib.get_kubernetes_version() == '1.10.0'
+    assert Popen.call_count == 2
+
+    # Switching back uses the version cached for the original context
+    kubeconfig_path.write(kubeconfig_for_context('context-1'))
+
+    assert klib.get_kubernetes_version() == '1.11.0'
+    assert Popen.call_count == 2
+
+
+@patch('k8s_jobs.klib.sp.Popen')
+def test_get_kubernetes_version_of_context(Popen, tmpdir, monkeypatch):
+    Popen.return_value.communicate.return_value = json.dumps({
+        'serverVersion': {'gitVersion': 'v1.12.0'},
+    }).encode('utf-8'), None
+
+    kubeconfig_path = tmpdir.join('kubeconfig')
+    kubeconfig_path.write(kubeconfig_for_context('context-1'))
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig_path))
+
+    assert klib.get_kubernetes_version('other context') == '1.12.0'
+    assert Popen.call_args[0][0] == "kubectl version -o json --context 'other context'"
+
+
 @pytest.mark.parametrize('script, cmd_args, expected_cmd_args', [
     ('tests/scripts/hello_world.sh', ['echo', '"Hello, World!"'], [
         'echo ZWNobyAnSGVsbG8sIFdvcmxkIScK | base64 --decode | bash',
@@ -154,6 +214,14 @@ def test_combine_script_and_args(script, cmd_args, expected_cmd_args):
     (None, None),
     ('16', '15.5'),
     ('16000m', '15500m'),
+    ('4.0', '3.5'),
+    ('1.5', '1'),
+    # Small requests are lowered by at most half, instead of to zero or less
+    ('0.5', '0.25'),
+    ('250m', '125m'),
+    ('1', '0.5'),
+    ('1e3', '999.5'),
+    ('$(CPU)', '$(CPU)'),
 ])
 def test_adjust_cpu_request(cpu_request, expected_cpu_request):
     args = Namespace(cpu=cpu_request)
@@ -290,7 +358,7 @@ def test_generate_yaml_complete(add_node_selectors, adjust_time, adjust_cpu_requ
         klib.generate_templated_yaml(args)
 
     if should_call_verify_retry_limit_supported:
-        assert verify_retry_limit_supported.call_args_list == [call(retry_limit) for _ in range(3)]
+        assert verify_retry_limit_supported.call_args_list == [call(retry_limit, None) for _ in range(3)]
     else:
         assert verify_retry_limit_supported.call_count == 0
 
@@ -300,6 +368,7 @@ def test_generate_yaml_complete(add_node_selectors, adjust_time, adjust_cpu_requ
 
 
 def test_generate_yaml_sections_missing():
+    # The bogus template is not a valid job, validation is skipped to test adding sections to it
     args = Namespace(file='tests/templates/bogus.yaml',
                      cmd_args=['ls', '-la'],
                      image='syncing/the-ship',
@@ -319,7 +388,8 @@ def test_generate_yaml_sections_missing():
                      retry_limit=None,
                      labels=[],
                      partition=None,
-                     volume_read_write=None)
+                     volume_read_write=None,
+                     skip_validation=True)
 
     # This should not return an error
     klib.generate_templated_yaml(args)
@@ -473,3 +543,416 @@ def test_retries():
 
     assert fail_1.n_tries == 0
     assert fail_2.n_tries == 0
+
+
+def test_retries_non_retryable():
+    fail_1 = MockFail(1)
+
+    @klib.run_with_retries(3)
+    def non_retryable_runner():
+        fail_1.n_tries -= 1
+        raise klib.NonRetryableError('Mock Exception')
+
+    with pytest.raises(klib.NonRetryableError):
+        non_retryable_runner()
+
+    assert fail_1.n_tries == 0
+
+
+def test_load_params_file(tmpdir):
+    params_file = tmpdir.join('params.tsv')
+    params_file.write('SAMPLE\tREADS\nsample-1\tgs://bucket/1.fq\n\nsample-2\tgs://bucket/2.fq\n')
+
+    assert klib.load_params_file(str(params_file)) == [
+        {'SAMPLE': 'sample-1', 'READS': 'gs://bucket/1.fq'},
+        {'SAMPLE': 'sample-2', 'READS': 'gs://bucket/2.fq'},
+    ]
+
+
+@pytest.mark.parametrize('contents', [
+    '',
+    'SAMPLE\tREADS\nsample-1\n',
+    'SAMPLE\tnot-a-name\nsample-1\tvalue\n',
+    'SAMPLE\tARRAY_INDEX\nsample-1\t1\n',
+    'CPU_REQUEST\nsample-1\n',
+])
+def test_load_params_file_invalid(contents, tmpdir):
+    params_file = tmpdir.join('params.tsv')
+    params_file.write(contents)
+
+    with pytest.raises(ValueError):
+        klib.load_params_file(str(params_file))
+
+
+def test_array_template_values():
+    assert klib.array_template_values(3) == [{'ARRAY_INDEX': '0'}, {'ARRAY_INDEX': '1'}, {'ARRAY_INDEX': '2'}]
+    assert klib.array_template_values(0) == []
+    assert klib.array_template_values(params=[{'SAMPLE': 'a'}, {'SAMPLE': 'b'}]) == [
+        {'SAMPLE': 'a', 'ARRAY_INDEX': '0'},
+        {'SAMPLE': 'b', 'ARRAY_INDEX': '1'},
+    ]
+
+
+def job_args(**kwargs):
+    args = dict(file=None,
+                script=None,
+                cmd_args=['ls', '-la'],
+                image='syncing/the-ship',
+                preemptible=None,
+                name=None,
+                container_name=None,
+                time=None,
+                cpu=None,
+                memory=None,
+                disk=None,
+                cpu_limit=None,
+                memory_limit=None,
+                disk_limit=None,
+                persistent_disk_name=None,
+                mount_path=None,
+                volume_name=None,
+                retry_limit=None,
+                labels=[],
+                partition=None,
+                volume_read_write=None)
+    args.update(kwargs)
+
+    return Namespace(**args)
+
+
+def test_render_array_manifests():
+    args = job_args(cmd_args=['process', '$(SAMPLE)', '--shard', '$(ARRAY_INDEX)'], name='$(SAMPLE)')
+
+    manifests = klib.render_array_manifests(args, klib.array_template_values(params=[
+        {'SAMPLE': 'sample-a'},
+        {'SAMPLE': 'sample-b'},
+    ]))
+
+    assert len(manifests) == 2
+
+    job_a, job_b = [yaml.safe_load(manifest) for manifest in manifests]
+
+    assert job_a['metadata']['generateName'] == 'sample-a-'
+    assert job_a['spec']['template']['spec']['containers'][0]['command'] == [
+        '/bin/sh', '-c', 'process sample-a --shard 0',
+    ]
+    assert job_b['metadata']['generateName'] == 'sample-b-'
+    assert job_b['spec']['template']['spec']['containers'][0]['command'] == [
+        '/bin/sh', '-c', 'process sample-b --shard 1',
+    ]
+
+
+def test_parse_created_job_names():
+    output = 'job.batch/kjob-abcde created\njob.batch "kjob-fghij" created\nsomething else\n'
+
+    assert klib.parse_created_job_names(output) == ['kjob-abcde', 'kjob-fghij']
+
+
+@pytest.mark.parametrize('returncode, output, expected_error', [
+    (0, b'job.batch/kjob-abcde created\njob.batch/kjob-fghij created\n', None),
+    (1, b'job.batch/kjob-abcde created\n', klib.PartialSubmissionError),
+    (1, b'', sp.CalledProcessError),
+])
+@patch('k8s_jobs.klib.sp.Popen')
+def test_submit_manifests(Popen, returncode, output, expected_error):
+    popen_retval = MagicMock()
+    popen_retval.communicate.return_value = output, None
+    popen_retval.returncode = returncode
+    Popen.return_value = popen_retval
+
+    manifests = ['kind: Job\nname: a\n', 'kind: Job\nname: b\n']
+
+    if expected_error:
+        with pytest.raises(expected_error):
+            klib.submit_manifests(manifests)
+    else:
+        assert klib.submit_manifests(manifests) == ['kjob-abcde', 'kjob-fghij']
+
+    Popen.assert_called_once_with(['kubectl', 'create', '-f', '-'], stdin=sp.PIPE, stdout=sp.PIPE,
+                                  stderr=sp.PIPE)
+    popen_retval.communicate.assert_called_once_with(b'kind: Job\nname: a\n---\nkind: Job\nname: b\n')
+
+
+@pytest.mark.parametrize('errors, expected_error', [
+    (b'The Job "Kjob" is invalid: metadata.name: Invalid value: "Kjob"\n', klib.RejectedManifestError),
+    (b'error: error validating "STDIN": error validating data: unknown field "comand"\n', klib.RejectedManifestError),
+    (b'Unable to connect to the server: dial tcp: i/o timeout\n', sp.CalledProcessError),
+])
+@patch('k8s_jobs.klib.sp.Popen')
+def test_submit_manifests_rejected(Popen, errors, expected_error, capsys):
+    popen_retval = MagicMock()
+    popen_retval.communicate.return_value = b'', errors
+    popen_retval.returncode = 1
+    Popen.return_value = popen_retval
+
+    submit = klib.run_with_retries(3, show_errors=False)(klib.submit_manifests)
+
+    with patch('k8s_jobs.klib.time.sleep'):
+        with pytest.raises(expected_error):
+            submit(['kind: Job\n'])
+
+    # Rejected manifests fail the same way every time, so they are not retried
+    assert Popen.call_count == (1 if expected_error is klib.RejectedManifestError else 3)
+    assert capsys.readouterr().err.startswith(errors.decode('utf-8'))
+
+
+@patch('k8s_jobs.klib.os.fsync')
+@patch('tempfile.NamedTemporaryFile')
+def test_render_job_yaml_in_memory(NamedTemporaryFile, fsync):
+    data = klib.render_job_yaml(job_args(name='job-name', cpu='4'))
+
+    assert 'generateName: job-name-' in data
+    assert 'command: ["/bin/sh", "-c", "ls -la"]' in data
+    assert 'cpu: 3.5' in data
+
+    job = klib.render_job(job_args(name='job-name', cpu='4'))
+
+    assert job['metadata']['generateName'] == 'job-name-'
+    assert job['spec']['template']['spec']['containers'][0]['command'] == ['/bin/sh', '-c', 'ls -la']
+    assert job == yaml.safe_load(data)
+
+    assert NamedTemporaryFile.call_count == 0
+    assert fsync.call_count == 0
+
+
+@patch('k8s_jobs.klib.sp.Popen')
+def test_submit_manifest_file(Popen):
+    popen_retval = MagicMock()
+    popen_retval.communicate.return_value = b'job.batch/kjob-abcde created\n', None
+    popen_retval.returncode = 0
+    Popen.return_value = popen_retval
+
+    assert klib.submit_manifest_file('/tmp/job.yaml') == ['kjob-abcde']
+
+    Popen.assert_called_once_with(['kubectl', 'create', '-f', '/tmp/job.yaml'], stdin=None, stdout=sp.PIPE,
+                                  stderr=sp.PIPE)
+
+
+def test_load_template_cached():
+    with open('tests/templates/default_cmd.yaml') as template_file:
+        data = template_file.read()
+
+    with patch('yaml.load', wraps=yaml.load) as load:
+        template_1 = klib.load_template(data)
+        template_2 = klib.load_template(data)
+
+        assert load.call_count == 1
+
+    assert template_1 == template_2 == yaml.safe_load(data)
+
+    # Each call returns a copy that can be modified without changing the cached template
+    template_1['spec']['template']['spec']['containers'].append({'name': 'sidecar'})
+
+    assert klib.load_template(data) == template_2
+    assert klib.load_template(data) is not template_2
+
+
+def test_load_template_not_json():
+    with patch('k8s_jobs.klib.cache.write_template') as write_template:
+        template = klib.load_template('kind: Job\ncreated: 2018-01-01\n')
+
+    assert str(template['created']) == '2018-01-01'
+    assert write_template.call_count == 0
+
+
+@pytest.mark.parametrize('arg_values', [
+    {},
+    {'cmd_args': None},
+    {'cmd_args': []},
+    {'cmd_args': ['echo', '"quoted; $(NOT_A_VALUE)"', '5']},
+    {'preemptible': True, 'persistent_disk_name': 'test-disk', 'cpu': '4', 'memory': '1Gi', 'disk': '10G',
+     'time': '10', 'retry_limit': '3', 'name': 'job-name', 'partition': 'highmem'},
+    {'persistent_disk_name': 'test-disk', 'volume_read_write': True, 'mount_path': '/data', 'volume_name': 'data',
+     'cpu': '1500m', 'cpu_limit': '2', 'memory_limit': '2Gi', 'disk_limit': '20Gi', 'container_name': '123'},
+    {'image': 'gcr.io/example-project/jobcontainer:image-tag', 'labels': ['pool=a', 'zone=b']},
+])
+@pytest.mark.parametrize('test_template', [None] + sorted(
+    os.path.join('tests', 'templates', name) for name in os.listdir(os.path.join('tests', 'templates'))
+))
+@patch('k8s_jobs.klib.verify_retry_limit_supported')
+def test_render_job_matches_yaml(verify_retry_limit_supported, test_template, arg_values):
+    if test_template == 'tests/templates/default_cmd.yaml' and not arg_values.get('cmd_args', True):
+        # See test_render_job_without_first_key_of_container
+        return
+
+    text_args = job_args(file=test_template, **arg_values)
+    object_args = job_args(file=test_template, **arg_values)
+
+    try:
+        data = klib.render_job_yaml(text_args)
+    except (RuntimeError, KeyError) as e:
+        with pytest.raises(type(e)):
+            klib.render_job(object_args)
+
+        return
+
+    job = klib.render_job(object_args)
+
+    assert job == yaml.safe_load(data)
+    assert json.loads(json.dumps(job)) == job
+
+
+def test_render_array_manifests_object_matches_yaml():
+    arg_values = {'cmd_args': ['process', '$(SAMPLE)', '$(ARRAY_INDEX)'], 'name': '$(SAMPLE)', 'time': '$(MINUTES)'}
+    index_values = klib.array_template_values(params=[
+        {'SAMPLE': 'sample-a', 'MINUTES': '10'},
+        {'SAMPLE': '5', 'MINUTES': '20'},
+    ])
+
+    with patch('k8s_jobs.klib.adjust_time'):
+        manifests = klib.render_array_manifests(job_args(**arg_values), index_values)
+        jobs = klib.render_array_manifests(job_args(**arg_values), index_values, render_mode='object')
+
+    assert jobs == [yaml.safe_load(manifest) for manifest in manifests]
+    assert jobs[1]['metadata']['generateName'] == '5-'
+    assert jobs[1]['spec']['activeDeadlineSeconds'] == 20
+    assert jobs[1]['spec']['template']['spec']['containers'][0]['command'] == ['/bin/sh', '-c', 'process 5 1']
+
+
+def test_render_array_manifests_escapes_values():
+    arg_values = {'cmd_args': ['echo', '$(SAMPLE)'], 'name': '$(NAME)', 'job_labels': ['note=$(SAMPLE)']}
+    index_values = klib.array_template_values(params=[
+        {'SAMPLE': 'a"b x: y', 'NAME': 'plain'},
+        {'SAMPLE': "it's \\ #1", 'NAME': 'n'},
+        # A value with ": " can't be inserted into an unquoted string, so it is substituted into the parsed yaml
+        {'SAMPLE': 'z', 'NAME': 'a: b'},
+    ])
+
+    manifests = klib.render_array_manifests(job_args(**arg_values), index_values)
+    jobs = klib.render_array_manifests(job_args(**arg_values), index_values, render_mode='object')
+
+    assert [yaml.safe_load(manifest) for manifest in manifests] == jobs
+    assert jobs[0]['spec']['template']['spec']['containers'][0]['command'] == ['/bin/sh', '-c', 'echo a"b x: y']
+    assert jobs[1]['metadata']['labels']['note'] == "it's \\ #1"
+    assert jobs[2]['metadata']['generateName'] == 'a: b-'
+
+
+QUOTED_PLACEHOLDERS_TEMPLATE = '''apiVersion: batch/v1
+kind: Job
+metadata:
+  generateName: kjob-
+spec:
+  template:
+    spec:
+      restartPolicy: Never
+      containers:
+      - name: main
+        image: syncing/the-ship
+        command: [/bin/sh, -c, echo]
+        env:
+        - {name: SAMPLE, value: "$(SAMPLE)"}
+        - {name: INDEX, value: '$(ARRAY_INDEX)'}
+        - {name: RUN, value: "run-$(SAMPLE)"}
+'''
+
+
+def test_render_array_manifests_keeps_quoted_placeholders_strings(tmpdir):
+    template = tmpdir.join('job.yaml')
+    template.write(QUOTED_PLACEHOLDERS_TEMPLATE)
+    index_values = klib.array_template_values(params=[{'SAMPLE': 'yes'}, {'SAMPLE': '1'}])
+
+    for _ in range(2):
+        # The second time, the template is read from the template cache
+        manifests = klib.render_array_manifests(job_args(file=str(template), cmd_args=None), index_values)
+
+        assert [[env['value'] for env in yaml.safe_load(manifest)['spec']['template']['spec']['containers'][0]['env']]
+                for manifest in manifests] == [['yes', '0', 'run-yes'], ['1', '1', 'run-1']]
+
+
+def test_render_array_objects_keeps_quoted_placeholders_strings(tmpdir):
+    template = tmpdir.join('job.yaml')
+    template.write(QUOTED_PLACEHOLDERS_TEMPLATE)
+    index_values = klib.array_template_values(params=[{'SAMPLE': 'yes'}, {'SAMPLE': '1'}])
+
+    jobs = klib.render_array_manifests(job_args(file=str(template), cmd_args=None), index_values, 'object')
+
+    assert [[env['value'] for env in job['spec']['template']['spec']['containers'][0]['env']] for job in jobs] == [
+        ['yes', '0', 'run-yes'],
+        ['1', '1', 'run-1'],
+    ]
+
+
+@patch('k8s_jobs.klib.sp.Popen')
+def test_submit_manifests_objects(Popen):
+    popen_retval = MagicMock()
+    popen_retval.communicate.return_value = b'job.batch/kjob-abcde created\njob.batch/kjob-fghij created\n', None
+    popen_retval.returncode = 0
+    Popen.return_value = popen_retval
+
+    assert klib.submit_manifests([{'kind': 'Job'}, {'kind': 'Job', 'spec': {}}]) == ['kjob-abcde', 'kjob-fghij']
+
+    popen_retval.communicate.assert_called_once_with(b'{"kind": "Job"}\n---\n{"kind": "Job", "spec": {}}\n')
+
+
+def test_render_job_without_first_key_of_container():
+    # Removing the line of the first key of a container also removes the "- " that starts the container in the yaml,
+    # so only the object rendering keeps the list of containers
+    data = klib.render_job_yaml(job_args(file='tests/templates/default_cmd.yaml', cmd_args=None))
+    job = klib.render_job(job_args(file='tests/templates/default_cmd.yaml', cmd_args=None))
+
+    assert isinstance(yaml.safe_load(data)['spec']['template']['spec']['containers'], dict)
+    assert job['spec']['template']['spec']['containers'] == [{
+        'name': 'the-ship',
+        'image': 'syncing/the-ship',
+        'resources': {'requests': None, 'limits': None},
+    }]
+
+
+@patch('k8s_jobs.klib.current_user', return_value='jane.doe@example.com')
+def test_render_job_metadata(current_user):
+    args = job_args(batch_id='20200101-000000-abcdef', job_labels=['app=align', 'k8s-jobs/submitter=jdoe'],
+                    annotations=['note=re-run of 1234'])
+    job = klib.render_job(args)
+
+    assert job['metadata']['labels'] == {
+        klib.BATCH_LABEL: '20200101-000000-abcdef',
+        klib.SUBMITTER_LABEL: 'jdoe',
+        klib.TEMPLATE_HASH_LABEL: job['metadata']['labels'][klib.TEMPLATE_HASH_LABEL],
+        'app': 'align',
+    }
+    assert len(job['metadata']['labels'][klib.TEMPLATE_HASH_LABEL]) == klib.TEMPLATE_HASH_LENGTH
+    assert job['metadata']['annotations'] == {
+        klib.VERSION_ANNOTATION: klib.__version__,
+        klib.TEMPLATE_ANNOTATION: 'default',
+        'note': 're-run of 1234',
+    }
+
+    text_job = yaml.safe_load(klib.render_job_yaml(args))
+    for metadata in [job['spec']['template']['metadata'], text_job['metadata'],
+                     text_job['spec']['template']['metadata']]:
+        assert metadata['labels'] == job['metadata']['labels']
+        assert metadata['annotations'] == job['metadata']['annotations']
+
+    job = klib.render_job(job_args(job_labels=['k8s-jobs/template-hash=']))
+
+    assert job['metadata']['labels'] == {klib.SUBMITTER_LABEL: 'jane.doe-example.com'}
+    assert klib.batch_id_matcher.match(klib.new_batch_id())
+
+
+@pytest.mark.parametrize('render_mode', ['text', 'object'])
+def test_render_array_manifests_metadata(render_mode):
+    args = job_args(job_labels=['sample=$(SAMPLE)'], annotations=['reads=$(READS)'])
+    index_values = klib.array_template_values(params=[{'SAMPLE': '5', 'READS': '10'}])
+
+    job, = klib.render_array_manifests(args, index_values, render_mode)
+    job = yaml.safe_load(job) if render_mode == 'text' else job
+
+    # Values are strings, as Kubernetes requires, even when they are rendered to a number
+    for metadata in [job['metadata'], job['spec']['template']['metadata']]:
+        assert metadata['labels'][klib.ARRAY_INDEX_LABEL] == '0'
+        assert metadata['labels']['sample'] == '5'
+
+    assert job['metadata']['annotations']['reads'] == '10'
+
+
+@pytest.mark.parametrize('job_labels, annotations', [
+    (['app'], []),
+    (['=value'], []),
+    (['app=has space'], []),
+    (['bad key=value'], []),
+    (['app=-starts-with-dash'], []),
+    ([], ['note']),
+])
+def test_job_metadata_invalid(job_labels, annotations):
+    with pytest.raises(ValueError):
+        klib.render_job(job_args(job_labels=job_labels, annotations=annotations))
@@ -0,0 +1,81 @@
+import os
+
+from k8s_jobs import kubeconfig
+
+
+kubeconfig_1 = """
+apiVersion: v1
+clusters:
+- cluster:
+    server: https://10.0.0.1
+  name: cluster-1
+- cluster:
+    server: https://10.0.0.2
+  name: cluster-2
+contexts:
+- context:
+    cluster: cluster-1
+    user: user-1
+  name: context-1
+- context:
+    cluster: cluster-2
+    user: user-1
+  name: context-2
+current-context: context-1
+users:
+- name: user-1
+  user:
+    token: secret
+"""
+
+kubeconfig_2 = """
+apiVersion: v1
+clusters:
+- cluster:
+    server: https://10.0.0.3
+  name: cluster-1
+contexts:
+- context:
+    cluster: cluster-1
+    user: user-2
+  name: context-3
+current-context: context-3
+"""
+
+
+def test_kubeconfig_paths(monkeypatch):
+    monkeypatch.setenv('KUBECONFIG', os.pathsep.join(['/a/config', '', '/b/config']))
+    assert kubeconfig.kubeconfig_paths() == ['/a/config', '/b/config']
+
+    monkeypatch.delenv('KUBECONFIG')
+    assert kubeconfig.kubeconfig_paths() == [os.path.join(os.path.expanduser('~'), '.kube', 'config')]
+
+
+def test_load_kubeconfig_merges(tmpdir):
+    path_1 = tmpdir.join('config-1')
+    path_1.write(kubeconfig_1)
+    path_2 = tmpdir.join('config-2')
+    path_2.write(kubeconfig_2)
+
+    config = kubeconfig.load_kubeconfig([str(path_1), str(tmpdir.join('missing')), str(path_2)])
+
+    assert config['current-context'] == 'context-1'
+    assert [cluster['name'] for cluster in config['clusters']] == ['cluster-1', 'cluster-2']
+    assert [context['name'] for context in config['contexts']] == ['context-1', 'context-2', 'context-3']
+    assert kubeconfig.get_named(config, 'clusters', 'cluster-1') == {'server': 'https://10.0.0.1'}
+    assert kubeconfig.get_named(config, 'users', 'user-1') == {'token': 'secret'}
+    assert kubeconfig.get_named(config, 'users', 'user-2') is None
+
+
+def test_current_context_key(tmpdir, monkeypatch):
+    assert kubeconfig.current_context_key() is None
+
+    path = tmpdir.join('kubeconfig')
+    path.write(kubeconfig_1)
+    monkeypatch.setenv('KUBECONFIG', str(path))
+
+    assert kubeconfig.current_context_key() == 'context-1@https://10.0.0.1'
+
+    path.write(kubeconfig_1.replace('current-context: context-1', 'current-context: context-2'))
+
+    assert kubeconfig.current_context_key() == 'context-2@https://10.0.0.2'
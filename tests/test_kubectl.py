@@ -0,0 +1,77 @@
+import os
+import subprocess as sp
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from k8s_jobs.kubectl import parse_args_or_run_kubectl
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def argument_parser(parser_class):
+    parser = parser_class()
+    parser.add_argument('--output', '-o', choices=['table', 'tsv'], default='table')
+    parser.add_argument('names', nargs='*')
+
+    return parser
+
+
+@patch('k8s_jobs.kubectl.os.execvp', side_effect=SystemExit(0))
+def test_parse_args(execvp):
+    _, args = parse_args_or_run_kubectl(argument_parser, ['get', 'pods'], argv=['-o', 'tsv', 'a'])
+
+    assert (args.output, args.names) == ('tsv', ['a'])
+    assert execvp.call_count == 0
+
+
+@pytest.mark.parametrize('argv', [
+    ['-o', 'wide'],
+    ['-n', 'team', 'a'],
+    ['--all'],
+])
+@patch('k8s_jobs.kubectl.os.execvp', side_effect=SystemExit(0))
+def test_run_kubectl_for_other_args(execvp, argv):
+    with pytest.raises(SystemExit):
+        parse_args_or_run_kubectl(argument_parser, ['get', 'pods'], argv=argv)
+
+    execvp.assert_called_once_with('kubectl', ['kubectl', 'get', 'pods'] + argv)
+
+
+@patch('k8s_jobs.kubectl.os.execvp', side_effect=SystemExit(0))
+def test_run_kubectl_when_is_kubectl_args(execvp):
+    with pytest.raises(SystemExit):
+        parse_args_or_run_kubectl(argument_parser, ['get', 'job'], lambda args: not args.names, argv=[])
+
+    execvp.assert_called_once_with('kubectl', ['kubectl', 'get', 'job'])
+
+
+@patch('k8s_jobs.kubectl.os.execvp', side_effect=FileNotFoundError(2, 'No such file or directory'))
+def test_kubectl_not_found(execvp, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        parse_args_or_run_kubectl(argument_parser, ['get', 'pods'], argv=['-o', 'wide'])
+
+    assert exit_info.value.code == 1
+    assert 'Could not run kubectl get pods -o wide' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('script, args, expected_kubectl_args', [
+    ('kpods', ['-o', 'wide', 'a-1'], 'get pods -o wide a-1'),
+    ('kstatus', [], 'get job'),
+    ('kstatus', ['-o', 'yaml', 'a'], 'get job -o yaml a'),
+    ('kstatus', ['-n', 'team', '-l', 'app=x'], 'get job -n team -l app=x'),
+    ('kcancel', ['--all'], 'delete job --all'),
+    ('kcancel', ['-n', 'team', 'a'], 'delete job -n team a'),
+])
+def test_scripts_run_kubectl(tmpdir, script, args, expected_kubectl_args):
+    kubectl = tmpdir.join('kubectl')
+    kubectl.write('#!/bin/sh\necho "kubectl $*"\n')
+    kubectl.chmod(0o755)
+    env = dict(os.environ, PATH='{bin}{sep}{path}'.format(bin=tmpdir, sep=os.pathsep, path=os.environ['PATH']),
+               PYTHONPATH=root_dir)
+
+    output = sp.check_output([sys.executable, os.path.join(root_dir, 'bin', script)] + args, env=env)
+
+    assert output.decode('utf-8') == 'kubectl {args}\n'.format(args=expected_kubectl_args)
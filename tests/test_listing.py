@@ -0,0 +1,129 @@
+import pytest
+
+from k8s_jobs import listing, watch
+
+
+now = listing.parse_timestamp('2020-01-02T00:00:00Z')
+
+
+def job(name, created, status=None, namespace='default'):
+    return {'metadata': {'name': name, 'namespace': namespace, 'creationTimestamp': created}, 'status': status or {}}
+
+
+def test_job_states_are_watch_states():
+    assert listing.JOB_STATES == [watch.PENDING, watch.RUNNING, watch.COMPLETE, watch.FAILED]
+
+
+def pages_route(fake_api, path, items, page_size):
+    """Routes a list of items, split into pages of page_size items with continue tokens."""
+    def list_page(request):
+        start = int(request.query.get('continue') or 0)
+        end = start + page_size
+
+        return 200, {
+            'metadata': {'resourceVersion': '10', 'continue': str(end) if end < len(items) else None},
+            'items': items[start:end],
+        }
+
+    fake_api.route('GET', path, list_page)
+
+
+@pytest.mark.parametrize('seconds, expected_age', [
+    (None, '<unknown>'),
+    (-1, '0s'),
+    (45, '45s'),
+    (119, '119s'),
+    (600, '10m'),
+    (3 * 3600, '3h'),
+    (5 * 86400 + 10, '5d'),
+])
+def test_format_age(seconds, expected_age):
+    assert listing.format_age(seconds) == expected_age
+
+
+def test_iter_jobs_pages(fake_api):
+    jobs = [job('job-{i}'.format(i=i), '2020-01-01T00:00:00Z') for i in range(5)]
+    pages_route(fake_api, '/apis/batch/v1/namespaces/default/jobs', jobs, 2)
+
+    listed = listing.iter_jobs(fake_api.client(), label_selector='app=align', limit=2)
+
+    # Nothing is listed until the first item is needed, and then only the first page
+    assert fake_api.requests == []
+    assert next(listed)['metadata']['name'] == 'job-0'
+    assert len(fake_api.requests) == 1
+
+    assert [item['metadata']['name'] for item in listed] == ['job-1', 'job-2', 'job-3', 'job-4']
+    assert [request.query for request in fake_api.requests] == [
+        {'labelSelector': 'app=align', 'limit': '2'},
+        {'labelSelector': 'app=align', 'limit': '2', 'continue': '2'},
+        {'labelSelector': 'app=align', 'limit': '2', 'continue': '4'},
+    ]
+
+
+def test_iter_jobs_filters(fake_api):
+    complete = {'conditions': [{'type': 'Complete', 'status': 'True'}], 'succeeded': 1}
+    pages_route(fake_api, '/apis/batch/v1/jobs', [
+        job('old-complete', '2020-01-01T00:00:00Z', complete),
+        job('old-running', '2020-01-01T00:00:00Z', {'active': 1}),
+        job('new-complete', '2020-01-01T23:59:00Z', complete),
+        job('no-timestamp', None, complete),
+    ], 2)
+
+    def names(**kwargs):
+        return [item['metadata']['name'] for item in listing.iter_jobs(fake_api.client(), all_namespaces=True,
+                                                                       now=now, **kwargs)]
+
+    assert names(state='Complete') == ['old-complete', 'new-complete', 'no-timestamp']
+    assert names(state='Complete', older_than=3600) == ['old-complete']
+    assert names(newer_than=3600) == ['new-complete']
+
+
+def test_iter_pods_state_selected_by_server(fake_api):
+    pages_route(fake_api, '/api/v1/namespaces/team/pods', [], 2)
+
+    list(listing.iter_pods(fake_api.client(), namespace='team', field_selector='spec.nodeName=node-1',
+                           state='Running'))
+
+    assert fake_api.requests[0].query['fieldSelector'] == 'spec.nodeName=node-1,status.phase=Running'
+
+
+def test_rows():
+    assert listing.job_row(job('kjob', '2020-01-01T00:00:00Z', {'active': 1}), now) == ['kjob', 'Running', '0/1', '24h']
+
+    pod = {
+        'metadata': {'name': 'kjob-abcde', 'creationTimestamp': '2020-01-01T23:00:00Z'},
+        'spec': {'nodeName': 'node-1'},
+        'status': {'phase': 'Pending', 'containerStatuses': [
+            {'restartCount': 2, 'state': {'waiting': {'reason': 'CrashLoopBackOff'}}},
+            {'restartCount': 1, 'state': {'running': {}}},
+        ]},
+    }
+
+    assert listing.pod_row(pod, now) == ['kjob-abcde', 'CrashLoopBackOff', '3', 'node-1', '60m']
+
+
+@pytest.mark.parametrize('output, expected_lines', [
+    ('table', ['NAMESPACE   NAME    STATE', 'default     a       Pending', 'team        b-job   Pending']),
+    ('tsv', ['NAMESPACE\tNAME\tSTATE', 'default\ta\tPending', 'team\tb-job\tPending']),
+    ('name', ['a', 'b-job']),
+    ('jsonl', ['{"metadata":{"name":"a","namespace":"default","creationTimestamp":null},"status":{}}',
+               '{"metadata":{"name":"b-job","namespace":"team","creationTimestamp":null},"status":{}}']),
+])
+def test_write_items(output, expected_lines):
+    lines = []
+    jobs = [job('a', None), job('b-job', None, namespace='team')]
+
+    listing.write_items(iter(jobs), lambda item: [item['metadata']['name'], 'Pending'], ['NAME', 'STATE'],
+                        lines.append, output=output, namespace_column=True)
+
+    assert lines == expected_lines
+
+
+def test_write_table_streams_after_first_rows(monkeypatch):
+    monkeypatch.setattr(listing, 'TABLE_WIDTH_ROWS', 1)
+    lines = []
+
+    listing.write_items(iter([job('a', None), job('longer-name', None)]), lambda item: [item['metadata']['name']],
+                        ['NAME'], lines.append, headers=False)
+
+    assert lines == ['a', 'longer-name']
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from k8s_jobs.logs import LogStreamer, find_pods, job_selector, parse_duration
+
+
+pods_path = '/api/v1/namespaces/default/pods'
+
+
+def pod(name, job_name, created):
+    return {'metadata': {'name': name, 'labels': {'job-name': job_name}, 'creationTimestamp': created}}
+
+
+@pytest.mark.parametrize('value, expected_seconds', [
+    ('30s', 30),
+    ('5m', 300),
+    ('1h', 3600),
+    ('1h30m', 5400),
+    ('2m5s', 125),
+])
+def test_parse_duration(value, expected_seconds):
+    assert parse_duration(value) == expected_seconds
+
+
+@pytest.mark.parametrize('value', ['', '5', '1d', 'm5', '5m1h'])
+def test_parse_invalid_duration(value):
+    with pytest.raises(ValueError):
+        parse_duration(value)
+
+
+def test_job_selector():
+    assert job_selector(['a']) == 'job-name=a'
+    assert job_selector(['a', 'b']) == 'job-name in (a,b)'
+
+
+def test_find_pods(fake_api):
+    fake_api.route('GET', pods_path, lambda request: (200, {'metadata': {}, 'items': [
+        pod('a-retry', 'a', '2020-01-01T00:02:00Z'),
+        pod('b-1', 'b', '2020-01-01T00:00:00Z'),
+        pod('a-1', 'a', '2020-01-01T00:01:00Z'),
+    ]}))
+
+    pods = find_pods(fake_api.client(), ['a', 'b'])
+
+    assert [pod['metadata']['name'] for pod in pods] == ['a-1', 'a-retry', 'b-1']
+    assert fake_api.requests[0].query == {'labelSelector': 'job-name in (a,b)', 'limit': '500'}
+
+
+def test_stream_logs(fake_api):
+    for name in ['a-1', 'a-2']:
+        fake_api.route('GET', '{pods_path}/{name}/log'.format(pods_path=pods_path, name=name),
+                       lambda request, name=name: (200, ['{name} line {i}'.format(name=name, i=i) for i in range(50)]))
+
+    lines = []
+    streamer = LogStreamer(fake_api.client(), [pod('a-1', 'a', None), pod('a-2', 'a', None)], follow=True,
+                           since_seconds=60, tail_lines=50, queue_size=2)
+
+    assert streamer.run(lines.append) == []
+
+    for name in ['a-1', 'a-2']:
+        prefix = '[{name}] '.format(name=name)
+
+        # Lines of different pods are interleaved, but the lines of each pod are in order
+        assert [line for line in lines if line.startswith(prefix)] == \
+            ['{prefix}{name} line {i}'.format(prefix=prefix, name=name, i=i) for i in range(50)]
+
+    assert len(lines) == 100
+    assert fake_api.requests[0].query == {'follow': 'true', 'sinceSeconds': '60', 'tailLines': '50'}
+
+
+def test_stream_logs_errors(fake_api):
+    fake_api.route('GET', '{pods_path}/a-1/log'.format(pods_path=pods_path), lambda request: (200, ['done']))
+    fake_api.route('GET', '{pods_path}/a-2/log'.format(pods_path=pods_path),
+                   lambda request: (400, {'kind': 'Status', 'message': 'container "main" is waiting to start'}))
+
+    lines = []
+    errors = LogStreamer(fake_api.client(), [pod('a-1', 'a', None), pod('a-2', 'a', None)], prefix=False,
+                         container='main').run(lines.append)
+
+    assert lines == ['done']
+    assert [(name, str(error)) for name, error in errors] == [
+        ('a-2', 'Kubernetes API error 400: container "main" is waiting to start'),
+    ]
+
+
+def test_stream_logs_of_more_pods_than_max_concurrent(fake_api):
+    lock = threading.Lock()
+    streaming = []
+    max_streaming = []
+
+    def log(request):
+        with lock:
+            streaming.append(request.path)
+            max_streaming.append(len(streaming))
+
+        time.sleep(0.02)
+
+        with lock:
+            streaming.remove(request.path)
+
+        return 200, ['done']
+
+    pods = [pod('a-{i}'.format(i=i), 'a', None) for i in range(7)]
+    for p in pods:
+        fake_api.route('GET', '{pods_path}/{name}/log'.format(pods_path=pods_path, name=p['metadata']['name']), log)
+
+    lines = []
+
+    assert LogStreamer(fake_api.client(), pods, prefix=False, max_concurrent=2).run(lines.append) == []
+    assert lines == ['done'] * 7
+    assert max(max_streaming) <= 2
+
+
+@pytest.mark.parametrize('n_pods, follow, max_concurrent', [
+    (1, False, 0),
+    (3, True, 2),
+])
+def test_stream_logs_invalid_max_concurrent(fake_api, n_pods, follow, max_concurrent):
+    pods = [pod('a-{i}'.format(i=i), 'a', None) for i in range(n_pods)]
+
+    with pytest.raises(ValueError, match='at least'):
+        LogStreamer(fake_api.client(), pods, follow=follow, max_concurrent=max_concurrent)
+
+
+def test_find_pods_by_selector(fake_api):
+    fake_api.route('GET', pods_path, lambda request: (200, {'metadata': {}, 'items': [
+        pod('b-1', 'b', '2020-01-01T00:00:00Z'),
+        pod('a-1', 'a', '2020-01-01T00:01:00Z'),
+    ]}))
+
+    pods = find_pods(fake_api.client(), [], label_selector='k8s-jobs/batch=x')
+
+    assert [pod['metadata']['name'] for pod in pods] == ['a-1', 'b-1']
+    assert fake_api.requests[0].query['labelSelector'] == 'k8s-jobs/batch=x'
+
+    find_pods(fake_api.client(), ['a'], label_selector='k8s-jobs/batch=x')
+
+    assert fake_api.requests[1].query['labelSelector'] == 'job-name=a,k8s-jobs/batch=x'
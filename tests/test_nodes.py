@@ -0,0 +1,147 @@
+from unittest.mock import patch
+
+import pytest
+
+from k8s_jobs import klib, nodes
+from k8s_jobs.validate import ValidationError
+from test_validate import job_args
+
+
+class Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def node(name, cpu, memory, unschedulable=False):
+    return {
+        'metadata': {'name': name},
+        'spec': {'unschedulable': unschedulable},
+        'status': {'allocatable': {'cpu': cpu, 'memory': memory, 'ephemeral-storage': '100Gi'}},
+    }
+
+
+def pod(cpu, memory, owner_kind='DaemonSet'):
+    return {
+        'metadata': {'ownerReferences': [{'kind': owner_kind}]},
+        'spec': {'containers': [{'resources': {'requests': {'cpu': cpu, 'memory': memory}}}]},
+    }
+
+
+def pack_args(**kwargs):
+    args = dict(cpu=None, memory=None, disk=None, cpu_limit=None, memory_limit=None, disk_limit=None, labels=[],
+                partition='batch', pods_per_node=3)
+    args.update(kwargs)
+
+    return Namespace(**args)
+
+
+@pytest.fixture
+def cluster(fake_api):
+    fake_api.route('GET', '/api/v1/nodes', lambda request: (200, {'metadata': {}, 'items': [
+        node('big', '15890m', '60Gi'),
+        node('small', '7910m', '29Gi'),
+        node('cordoned', '1', '1Gi', unschedulable=True),
+    ]}))
+    fake_api.route('GET', '/api/v1/pods', lambda request: (200, {'metadata': {}, 'items': [
+        pod('100m', '200Mi'),
+        pod('210m', '300Mi'),
+        pod('4', '8Gi', owner_kind='Job'),
+    ]}))
+
+    return fake_api
+
+
+def test_node_shape(cluster):
+    shape = nodes.node_shape(cluster.client(), 'partition=batch')
+
+    # The smallest schedulable node, less its DaemonSet pods
+    assert shape == {
+        'node': 'small',
+        'cpu': 7600,
+        'memory': 29 * 2 ** 30 - 500 * 2 ** 20,
+        'ephemeral-storage': 100 * 2 ** 30,
+    }
+
+    assert cluster.requests[0].query['labelSelector'] == 'partition=batch'
+    assert cluster.requests[1].query['fieldSelector'] == \
+        'spec.nodeName=small,status.phase!=Succeeded,status.phase!=Failed'
+
+
+def test_node_shape_no_nodes(fake_api):
+    fake_api.route('GET', '/api/v1/nodes', lambda request: (200, {'metadata': {}, 'items': []}))
+
+    with pytest.raises(ValidationError):
+        nodes.node_shape(fake_api.client(), 'partition=gpu')
+
+
+@pytest.mark.parametrize('kwargs, expected', [
+    # Requests are set to a third of the node, rounded down, or raised to it
+    ({}, dict(cpu='2530m', memory='9732Mi', disk=None)),
+    (dict(cpu='2', memory='4Gi', disk='10Gi'), dict(cpu='2530m', memory='9732Mi', disk='34133Mi')),
+    # Lower limits cap the requests
+    (dict(cpu_limit='2', memory_limit='8Gi'), dict(cpu='2000m', memory='8Gi', disk=None)),
+])
+def test_pack_requests(cluster, kwargs, expected):
+    args = pack_args(**kwargs)
+
+    nodes.pack_requests(args, cluster.client())
+
+    assert dict(cpu=args.cpu, memory=args.memory, disk=args.disk) == expected
+
+
+@pytest.mark.parametrize('kwargs, problem', [
+    (dict(cpu='3'), '--cpu: "3" is more than 2530m, the share of each of 3 pods of node small'),
+    (dict(pods_per_node=1000), '--cpu: 1000 pods do not fit on node small'),
+])
+def test_pack_requests_too_large(cluster, kwargs, problem):
+    with pytest.raises(ValidationError) as e:
+        nodes.pack_requests(pack_args(**kwargs), cluster.client())
+
+    assert e.value.problems[0] == problem
+
+
+def test_free_slots(fake_api):
+    fake_api.route('GET', '/api/v1/nodes', lambda request: (200, {'metadata': {}, 'items': [
+        node('big', '16', '64Gi'),
+        node('small', '8', '32Gi'),
+        node('cordoned', '16', '64Gi', unschedulable=True),
+    ]}))
+    fake_api.route('GET', '/api/v1/pods', lambda request: (200, {'metadata': {}, 'items': [
+        dict(pod('4', '8Gi', owner_kind='Job'), spec=dict(pod('4', '8Gi')['spec'], nodeName='big')),
+        dict(pod('6', '4Gi', owner_kind='Job'), spec=dict(pod('6', '4Gi')['spec'], nodeName='small')),
+        pod('1', '1Gi', owner_kind='Job'),
+    ]}))
+    client = fake_api.client()
+
+    # 12 CPUs are free on big and 2 on small, so 4 pods of 3 CPUs fit on big and none on small, less the pod waiting
+    # to be scheduled
+    assert nodes.free_slots(client, {'cpu': 3000, 'memory': 2 ** 30}, 'partition=batch') == 3
+    assert nodes.free_slots(client, {'cpu': 1000, 'memory': 28 * 2 ** 30}) == 2
+    assert nodes.free_slots(client, {}) == 14000
+    assert fake_api.requests[0].query['labelSelector'] == 'partition=batch'
+
+
+def test_node_shape_cached(cluster, tmpdir, monkeypatch):
+    kubeconfig = tmpdir.join('kubeconfig')
+    kubeconfig.write('current-context: test\ncontexts:\n- name: test\n  context: {cluster: test}\n'
+                     'clusters:\n- name: test\n  cluster: {server: "https://k8s"}\n')
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig))
+
+    shape = nodes.cached_node_shape('partition=batch', cluster.client())
+
+    assert nodes.cached_node_shape('partition=batch', cluster.client()) == shape
+    assert len(cluster.requests) == 2
+
+
+def test_render_job_packed():
+    shape = {'node': 'small', 'cpu': 7600, 'memory': 29 * 2 ** 30, 'ephemeral-storage': 100 * 2 ** 30}
+
+    with patch('k8s_jobs.nodes.cached_node_shape', return_value=shape) as cached_node_shape:
+        job = klib.render_job(job_args(cpu='2', pods_per_node=2, labels=['pool=batch'], partition=None))
+
+    # The share of the node is not lowered again for the system's reservation
+    assert job['spec']['template']['spec']['containers'][0]['resources']['requests'] == {
+        'cpu': '3800m',
+        'memory': '14848Mi',
+    }
+    assert cached_node_shape.call_args[0][0] == 'pool=batch'
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+import pytest
+
+from k8s_jobs.quantity import format_bytes, format_cpu, parse_quantity, to_bytes, to_millicpus
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('4', Decimal(4)),
+    ('100m', Decimal('0.1')),
+    ('1.5', Decimal('1.5')),
+    ('.5', Decimal('0.5')),
+    ('128Mi', Decimal(128 * 2 ** 20)),
+    ('1Gi', Decimal(2 ** 30)),
+    ('100M', Decimal(10 ** 8)),
+    ('1e6', Decimal(10 ** 6)),
+    ('1E3', Decimal(1000)),
+    ('2E', Decimal(2 * 10 ** 18)),
+    (4, Decimal(4)),
+    (15.5, Decimal('15.5')),
+])
+def test_parse_quantity(value, expected):
+    assert parse_quantity(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', '4 cores', '10Gb', '10mi', 'Mi', '1.2.3', '-', True, None, ['1']])
+def test_parse_quantity_invalid(value):
+    with pytest.raises(ValueError):
+        parse_quantity(value)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1', 1000),
+    ('1.5', 1500),
+    ('100m', 100),
+    ('1.0001', 1001),
+    ('0.0001', 1),
+    (2, 2000),
+    (15.5, 15500),
+])
+def test_to_millicpus(value, expected):
+    assert to_millicpus(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1Ki', 1024),
+    ('128Mi', 128 * 2 ** 20),
+    ('1G', 10 ** 9),
+    ('1.5Ki', 1536),
+    ('100m', 1),
+    (512, 512),
+])
+def test_to_bytes(value, expected):
+    assert to_bytes(value) == expected
+
+
+@pytest.mark.parametrize('millicpus, milli, expected', [
+    (1500, True, '1500m'),
+    (16000, True, '16000m'),
+    (1, True, '1m'),
+    (15500, False, '15.5'),
+    (16000, False, '16'),
+    (1001, False, '1.001'),
+    (100, False, '0.1'),
+    (0, False, '0'),
+])
+def test_format_cpu(millicpus, milli, expected):
+    assert format_cpu(millicpus, milli=milli) == expected
+
+
+@pytest.mark.parametrize('n_bytes, expected', [
+    (0, '0'),
+    (1000, '1000'),
+    (1536, '1536'),
+    (1024, '1Ki'),
+    (128 * 2 ** 20, '128Mi'),
+    (16 * 2 ** 30, '16Gi'),
+    (3 * 2 ** 40, '3Ti'),
+    (2 ** 30 + 2 ** 20, '1025Mi'),
+])
+def test_format_bytes(n_bytes, expected):
+    assert format_bytes(n_bytes) == expected
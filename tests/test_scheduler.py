@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from k8s_jobs import klib
+from k8s_jobs.scheduler import BatchSummary, SubmissionResult, SubmissionScheduler, TokenBucket, backoff_delay
+
+
+class MockClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ThrottledError(RuntimeError):
+    retry_after = 0.05
+
+
+def record_sleeps(scheduler):
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        await asyncio.sleep(0)
+
+    scheduler.sleep = sleep
+
+    return sleeps
+
+
+def test_token_bucket():
+    clock = MockClock()
+    bucket = TokenBucket(rate=10, burst=2, clock=clock)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+
+    clock.now = 1.0
+
+    assert bucket.reserve() == 0
+
+
+@pytest.mark.parametrize('attempt, expected_max', [(0, 1.0), (1, 2.0), (3, 8.0), (10, 60.0)])
+def test_backoff_delay(attempt, expected_max):
+    delays = [backoff_delay(attempt) for _ in range(200)]
+
+    assert all(0 <= delay <= expected_max for delay in delays)
+    assert max(delays) > expected_max / 2
+
+
+def test_run_concurrently():
+    lock = threading.Lock()
+    in_flight = [0]
+    max_in_flight = [0]
+
+    def submit(item):
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+
+        time.sleep(0.01)
+
+        with lock:
+            in_flight[0] -= 1
+
+        return item * 2
+
+    summary = SubmissionScheduler(submit, concurrency=4).run(range(20))
+
+    assert [result.value for result in summary.results] == [i * 2 for i in range(20)]
+    assert not summary.failed
+    assert max_in_flight[0] == 4
+
+
+def test_run_coroutine():
+    async def submit(item):
+        await asyncio.sleep(0)
+        return item + 1
+
+    summary = SubmissionScheduler(submit, concurrency=2).run([1, 2, 3])
+
+    assert [result.value for result in summary.results] == [2, 3, 4]
+
+
+def test_retries_and_failures_reported():
+    attempts = {}
+
+    def submit(item):
+        attempts[item] = attempts.get(item, 0) + 1
+
+        if item == 'flaky' and attempts[item] < 3:
+            raise RuntimeError('flaky')
+        if item == 'broken':
+            raise RuntimeError('broken')
+        if item == 'invalid':
+            raise klib.NonRetryableError('invalid')
+
+        return item
+
+    results = []
+    scheduler = SubmissionScheduler(submit, concurrency=2, max_attempts=5, on_result=results.append)
+    sleeps = record_sleeps(scheduler)
+
+    summary = scheduler.run(['ok', 'flaky', 'broken', 'invalid'])
+
+    assert attempts == {'ok': 1, 'flaky': 3, 'broken': 5, 'invalid': 1}
+    assert [result.item for result in summary.succeeded] == ['ok', 'flaky']
+    assert [result.item for result in summary.failed] == ['broken', 'invalid']
+    assert summary.retries == 2 + 4
+    assert sorted(result.item for result in results) == ['broken', 'flaky', 'invalid', 'ok']
+    assert len(sleeps) == 6
+    assert all(0 <= delay <= 8.0 for delay in sleeps)
+
+
+def test_retry_after_pauses_submissions():
+    attempts = []
+
+    def submit(item):
+        attempts.append((item, time.monotonic()))
+
+        if len(attempts) == 1:
+            raise ThrottledError('slow down')
+
+        return item
+
+    scheduler = SubmissionScheduler(submit, concurrency=1, base_delay=0.001)
+    summary = scheduler.run(['a', 'b'])
+
+    assert not summary.failed
+    assert [item for item, _ in attempts] == ['a', 'a', 'b']
+    assert attempts[1][1] - attempts[0][1] >= ThrottledError.retry_after
+
+
+def test_rate_limit():
+    scheduler = SubmissionScheduler(lambda item: item, concurrency=4, rate=100, burst=1)
+    sleeps = record_sleeps(scheduler)
+
+    scheduler.run(range(5))
+
+    assert sleeps[0] == 0
+    assert max(sleeps) > 0
+
+
+def test_report():
+    summary = BatchSummary([
+        SubmissionResult(0, ['a', 'b'], value=['job-a', 'job-b'], attempts=1),
+        SubmissionResult(1, ['c'], error=RuntimeError('mock failure'), attempts=3),
+    ], elapsed=2.0)
+
+    assert summary.report(unit='jobs', size=len) == (
+        'Submitted 2 of 3 jobs in 2.0s (1.0/s) with 2 retries, 1 failed\n'
+        '  1: failed after 3 attempt(s): mock failure'
+    )
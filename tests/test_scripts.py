@@ -0,0 +1,153 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from k8s_jobs import batch, klib, scripts
+from k8s_jobs.validate import ValidationError
+from test_validate import job_args
+
+
+SCRIPT = b"echo 'Hello, World!'\n"
+DIGEST = scripts.script_hash(SCRIPT)
+CONFIGMAPS_PATH = '/api/v1/namespaces/default/configmaps'
+
+
+@pytest.fixture(autouse=True)
+def forget_configmaps():
+    scripts.known_configmaps.clear()
+
+
+def test_ensure_script_configmap(fake_api):
+    fake_api.route('POST', CONFIGMAPS_PATH, lambda request: (201, request.body))
+    client = fake_api.client()
+
+    assert scripts.ensure_script_configmap(client, SCRIPT, now=1000) == DIGEST
+    # The ConfigMap is only created once by each process
+    assert scripts.ensure_script_configmap(client, SCRIPT, now=1100) == DIGEST
+
+    assert len(fake_api.requests) == 1
+    assert fake_api.requests[0].body == {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {
+            'name': 'kbatch-script-{digest}'.format(digest=DIGEST),
+            'labels': {klib.SCRIPT_HASH_LABEL: DIGEST},
+            'annotations': {scripts.LAST_USED_ANNOTATION: '1000'},
+        },
+        'data': {'script.sh': SCRIPT.decode('utf-8')},
+    }
+
+
+def test_ensure_script_configmap_exists(fake_api):
+    name = scripts.script_configmap_name(DIGEST)
+
+    fake_api.route('POST', CONFIGMAPS_PATH, lambda request: (409, {'kind': 'Status', 'reason': 'AlreadyExists'}))
+    fake_api.route('PATCH', '{path}/{name}'.format(path=CONFIGMAPS_PATH, name=name), lambda request: (200, {}))
+
+    assert scripts.ensure_script_configmap(fake_api.client(), SCRIPT, now=1000) == DIGEST
+
+    # The existing ConfigMap is marked as used, so that it isn't garbage collected while its jobs are submitted
+    patch_request = fake_api.requests[1]
+    assert patch_request.method == 'PATCH'
+    assert patch_request.headers['Content-Type'] == 'application/merge-patch+json'
+    assert patch_request.body == {'metadata': {'annotations': {scripts.LAST_USED_ANNOTATION: '1000'}}}
+
+
+def test_ensure_script_configmap_sent_again_after_unknown_outcome(fake_api):
+    responses = iter([None, (409, {'kind': 'Status', 'reason': 'AlreadyExists'})])
+    name = scripts.script_configmap_name(DIGEST)
+
+    fake_api.route('POST', CONFIGMAPS_PATH, lambda request: next(responses))
+    fake_api.route('PATCH', '{path}/{name}'.format(path=CONFIGMAPS_PATH, name=name), lambda request: (200, {}))
+
+    assert scripts.ensure_script_configmap(fake_api.client(), SCRIPT, now=1000) == DIGEST
+    assert [request.method for request in fake_api.requests] == ['POST', 'POST', 'PATCH']
+
+
+def test_ensure_script_configmap_reused_again(fake_api):
+    fake_api.route('POST', CONFIGMAPS_PATH, lambda request: (201, request.body))
+    client = fake_api.client()
+
+    scripts.ensure_script_configmap(client, SCRIPT, now=1000)
+    scripts.ensure_script_configmap(client, SCRIPT, now=1000 + scripts.SCRIPT_REUSE_SECONDS)
+
+    assert len(fake_api.requests) == 2
+
+
+def test_script_configmap_binary():
+    configmap = scripts.script_configmap(b'\xff\xfe', 'abc', now=0)
+
+    assert configmap['binaryData'] == {'script.sh': '//4='}
+    assert 'data' not in configmap
+
+
+def test_script_too_large():
+    with pytest.raises(ValidationError):
+        scripts.ensure_script_configmap(MagicMock(), b'#' * (scripts.MAX_SCRIPT_BYTES + 1))
+
+
+def test_render_job_script_configmap():
+    args = job_args(script='tests/scripts/hello_world.sh', cmd_args=['echo', 'done'], script_hash=DIGEST)
+    klib.combine_script_and_args(args)
+
+    job = klib.render_job(args)
+    pod_spec = job['spec']['template']['spec']
+
+    assert pod_spec['containers'][0]['command'] == [
+        '/bin/sh', '-c', 'cat /etc/kbatch-script/script.sh | bash echo done',
+    ]
+    assert pod_spec['containers'][0]['volumeMounts'] == [
+        {'name': 'kbatch-script', 'mountPath': '/etc/kbatch-script', 'readOnly': True},
+    ]
+    assert pod_spec['volumes'] == [
+        {'name': 'kbatch-script', 'configMap': {'name': 'kbatch-script-{digest}'.format(digest=DIGEST)}},
+    ]
+    assert job['metadata']['labels'][klib.SCRIPT_HASH_LABEL] == DIGEST
+    assert SCRIPT not in klib.render_job_yaml(args).encode('utf-8')
+
+
+def test_submit_job_uploads_script(fake_api):
+    fake_api.route('POST', CONFIGMAPS_PATH, lambda request: (201, request.body))
+    submit = MagicMock(return_value=['kjob-abcde'])
+    args = job_args(script='tests/scripts/hello_world.sh', script_configmap=True)
+
+    with patch('k8s_jobs.api.KubernetesClient.from_kubeconfig', return_value=fake_api.client()):
+        batch.submit_job(args, submit)
+
+    assert args.script_hash == DIGEST
+    assert 'cat /etc/kbatch-script/script.sh | bash' in submit.call_args[0][0][0]
+
+
+def test_unused_script_configmaps(fake_api):
+    def configmap(digest, last_used=None, created='2026-01-01T00:00:00Z'):
+        return {'metadata': {
+            'name': scripts.script_configmap_name(digest),
+            'creationTimestamp': created,
+            'labels': {klib.SCRIPT_HASH_LABEL: digest},
+            'annotations': {scripts.LAST_USED_ANNOTATION: str(last_used)} if last_used else {},
+        }}
+
+    now = 1800000000
+
+    fake_api.route('GET', '/apis/batch/v1/namespaces/default/jobs', lambda request: (200, {'metadata': {}, 'items': [
+        {'metadata': {'name': 'kjob-a', 'labels': {klib.SCRIPT_HASH_LABEL: 'used'}}},
+    ]}))
+    fake_api.route('GET', CONFIGMAPS_PATH, lambda request: (200, {'metadata': {}, 'items': [
+        configmap('used', last_used=now - 7200),
+        configmap('unused', last_used=now - 7200),
+        configmap('recent', last_used=now - 60),
+        configmap('unannotated'),
+    ]}))
+
+    assert scripts.unused_script_configmaps(fake_api.client(), now=now) == [
+        'kbatch-script-unused',
+        'kbatch-script-unannotated',
+    ]
+    assert fake_api.requests[0].query['labelSelector'] == klib.SCRIPT_HASH_LABEL
+
+
+def test_delete_script_configmap(fake_api):
+    fake_api.route('DELETE', '{path}/kbatch-script-a'.format(path=CONFIGMAPS_PATH), lambda request: (200, {}))
+
+    assert scripts.delete_script_configmap(fake_api.client(), 'kbatch-script-a')
+    assert not scripts.delete_script_configmap(fake_api.client(), 'kbatch-script-b')
@@ -0,0 +1,226 @@
+import os
+import subprocess as sp
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from k8s_jobs import batch, klib, spool
+from test_batch import kbatch_args
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+JOBS_PATH = '/apis/batch/v1/namespaces/default/jobs'
+
+
+def job_manifest(generate_name='kjob-', **metadata):
+    return {
+        'apiVersion': 'batch/v1',
+        'kind': 'Job',
+        'metadata': dict({'generateName': generate_name, 'labels': {klib.BATCH_LABEL: 'b1'}}, **metadata),
+        'spec': {},
+    }
+
+
+def active_job(name):
+    return {'metadata': {'name': name}, 'status': {'active': 1}}
+
+
+@pytest.fixture
+def job_spool(tmpdir):
+    job_spool = spool.Spool(str(tmpdir.join('spool.db')))
+
+    yield job_spool
+
+    job_spool.close()
+
+
+def test_spool_path(monkeypatch, tmpdir):
+    monkeypatch.delenv('K8S_JOBS_SPOOL_DIR')
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmpdir))
+
+    assert spool.spool_path() == str(tmpdir.join('k8s-jobs', 'spool.db'))
+
+
+def test_spooled_job_name():
+    name = spool.spooled_job_name('kjob-', 'b1', 0)
+
+    assert name.startswith('kjob-')
+    assert len(name) == len('kjob-') + spool.NAME_SUFFIX_LENGTH
+    assert name == spool.spooled_job_name('kjob-', 'b1', 0)
+    assert name != spool.spooled_job_name('kjob-', 'b1', 1)
+    assert name != spool.spooled_job_name('kjob-', 'b2', 0)
+    assert len(spool.spooled_job_name('x' * 100, 'b1', 0)) == spool.MAX_NAME_LENGTH
+
+
+def test_name_manifest_keeps_name():
+    manifest = job_manifest(generate_name=None, name='fixed')
+
+    assert spool.name_manifest(manifest, 'b1', 0) == 'fixed'
+    assert 'generateName' not in manifest['metadata']
+
+
+def test_enqueue(job_spool):
+    names = job_spool.enqueue('ctx', 'b1', [job_manifest(), job_manifest(namespace='other')])
+
+    assert names == [spool.spooled_job_name('kjob-', 'b1', 0), spool.spooled_job_name('kjob-', 'b1', 1)]
+    assert job_spool.queued_namespaces('ctx') == ['', 'other']
+    assert job_spool.queued_namespaces('another-ctx') == []
+
+    queued = job_spool.queued('ctx', '')
+    assert [job.name for job in queued] == names[:1]
+    assert queued[0].manifest['metadata']['name'] == names[0]
+    assert 'generateName' not in queued[0].manifest['metadata']
+
+    # Spooling the same jobs again does not add them twice
+    job_spool.enqueue('ctx', 'b1', [job_manifest()])
+    assert job_spool.count_queued('ctx') == 2
+
+
+def test_spool_survives_reopening(job_spool):
+    job_spool.enqueue('ctx', 'b1', [job_manifest()])
+    reopened = spool.Spool(job_spool.path)
+
+    try:
+        assert reopened.count_queued('ctx') == 1
+    finally:
+        reopened.close()
+
+
+def test_drain_once(job_spool, fake_api):
+    fake_api.route('GET', JOBS_PATH, lambda request: (200, {'metadata': {}, 'items': [active_job('running')]}))
+    fake_api.route('POST', JOBS_PATH, lambda request: (201, request.body))
+    job_spool.enqueue('ctx', 'b1', [job_manifest() for _ in range(5)])
+
+    counts = spool.drain_once(job_spool, fake_api.client(), 'ctx', max_in_flight=3)
+
+    # One job is already running, so only two more are submitted
+    assert counts == {spool.SUBMITTED: 2, spool.QUEUED: 0, spool.FAILED: 0}
+    assert job_spool.count_queued('ctx') == 3
+    assert fake_api.requests[0].query['labelSelector'] == klib.BATCH_LABEL
+
+    created = [request.body['metadata']['name'] for request in fake_api.requests if request.method == 'POST']
+    assert created == [spool.spooled_job_name('kjob-', 'b1', i) for i in range(2)]
+
+    # Without a limit, the rest are submitted
+    assert spool.drain_once(job_spool, fake_api.client(), 'ctx')[spool.SUBMITTED] == 3
+    assert job_spool.count_queued('ctx') == 0
+    assert job_spool.counts() == {('ctx', '', 'b1'): {spool.SUBMITTED: 5}}
+
+
+def test_drain_once_full(job_spool, fake_api):
+    fake_api.route('GET', JOBS_PATH, lambda request: (200, {'metadata': {}, 'items': [active_job('running')]}))
+    job_spool.enqueue('ctx', 'b1', [job_manifest()])
+
+    assert spool.drain_once(job_spool, fake_api.client(), 'ctx', max_in_flight=1)[spool.SUBMITTED] == 0
+    assert all(request.method == 'GET' for request in fake_api.requests)
+
+
+def test_drain_once_already_submitted(job_spool, fake_api):
+    name = job_spool.enqueue('ctx', 'b1', [job_manifest()])[0]
+
+    fake_api.route('POST', JOBS_PATH, lambda request: (409, {'kind': 'Status', 'reason': 'AlreadyExists'}))
+    fake_api.route('GET', '{path}/{name}'.format(path=JOBS_PATH, name=name),
+                   lambda request: (200, {'metadata': {'name': name, 'labels': {klib.BATCH_LABEL: 'b1'}}}))
+
+    # The job was created by a drain that was interrupted before recording it, so it is not created again
+    assert spool.drain_once(job_spool, fake_api.client(), 'ctx')[spool.SUBMITTED] == 1
+    assert job_spool.count_queued('ctx') == 0
+
+
+def test_drain_once_name_taken(job_spool, fake_api):
+    name = job_spool.enqueue('ctx', 'b1', [job_manifest()])[0]
+
+    fake_api.route('POST', JOBS_PATH, lambda request: (409, {'kind': 'Status', 'reason': 'AlreadyExists'}))
+    fake_api.route('GET', '{path}/{name}'.format(path=JOBS_PATH, name=name),
+                   lambda request: (200, {'metadata': {'name': name, 'labels': {klib.BATCH_LABEL: 'other'}}}))
+
+    assert spool.drain_once(job_spool, fake_api.client(), 'ctx')[spool.FAILED] == 1
+    assert [(failed_name, error[:26]) for failed_name, _, error in job_spool.failed()] == [
+        (name, 'Kubernetes API error 409: '),
+    ]
+
+    assert job_spool.retry_failed('b1') == 1
+    assert job_spool.count_queued('ctx') == 1
+
+
+def test_drain_once_quota_exceeded(job_spool, fake_api):
+    fake_api.route('POST', JOBS_PATH, lambda request: (403, {'kind': 'Status', 'message': 'jobs "x" is forbidden: '
+                                                                                          'exceeded quota: jobs'}))
+    job_spool.enqueue('ctx', 'b1', [job_manifest()])
+
+    # Jobs over the quota of the namespace stay queued, to be submitted once other jobs finish
+    assert spool.drain_once(job_spool, fake_api.client(), 'ctx')[spool.QUEUED] == 1
+    assert job_spool.queued('ctx', '')[0].attempts == 1
+
+
+def test_drain_once_rejected(job_spool, fake_api):
+    fake_api.route('POST', JOBS_PATH, lambda request: (422, {'kind': 'Status', 'message': 'invalid'}))
+    job_spool.enqueue('ctx', 'b1', [job_manifest()])
+
+    assert spool.drain_once(job_spool, fake_api.client(), 'ctx')[spool.FAILED] == 1
+    assert job_spool.count_queued('ctx') == 0
+
+
+@pytest.mark.parametrize('version, submitted', [('1.20.0', 1), ('1.9.0', 0)])
+def test_drain_once_checks_retry_limit(job_spool, fake_api, version, submitted):
+    fake_api.route('POST', JOBS_PATH, lambda request: (201, request.body))
+    job_spool.enqueue('ctx', 'b1', [dict(job_manifest(), spec={'backoffLimit': 2})])
+
+    with patch('k8s_jobs.klib.get_kubernetes_version', return_value=version):
+        if submitted:
+            assert spool.drain_once(job_spool, fake_api.client(), 'ctx')[spool.SUBMITTED] == submitted
+        else:
+            with pytest.raises(RuntimeError):
+                spool.drain_once(job_spool, fake_api.client(), 'ctx')
+
+    assert job_spool.count_queued('ctx') == 1 - submitted
+
+
+def test_purge(job_spool):
+    job_spool.enqueue('ctx', 'b1', [job_manifest(), job_manifest()], now=1000)
+    job_spool.set_state(job_spool.queued('ctx', '')[0], spool.SUBMITTED, now=1000)
+
+    assert job_spool.purge([spool.SUBMITTED], older_than=60, now=1030) == 0
+    assert job_spool.purge([spool.SUBMITTED], older_than=60, now=1100) == 1
+    assert job_spool.purge([spool.SUBMITTED, spool.QUEUED], batch_id='b2') == 0
+    assert job_spool.count_queued('ctx') == 1
+
+
+def test_spool_jobs(job_spool):
+    args = kbatch_args(array=3, batch_id='b1')
+
+    names = batch.spool_jobs(args, job_spool)
+
+    assert names == [spool.spooled_job_name('kjob-', 'b1', i) for i in range(3)]
+
+    jobs = job_spool.queued('', '')
+    assert [job.manifest['metadata']['labels'][klib.ARRAY_INDEX_LABEL] for job in jobs] == ['0', '1', '2']
+    assert jobs[2].manifest['spec']['template']['spec']['containers'][0]['command'][-1].endswith('echo 2')
+
+
+@patch('k8s_jobs.klib.get_kubernetes_version', side_effect=AssertionError('The version is checked by kspool drain'))
+def test_spool_jobs_retry_limit(get_kubernetes_version, job_spool):
+    args = kbatch_args(batch_id='b1', retry_limit='2', spool=True)
+
+    batch.spool_jobs(args, job_spool)
+
+    assert job_spool.queued('', '')[0].manifest['spec']['backoffLimit'] == 2
+
+
+@pytest.mark.parametrize('args', [
+    ['--max-running', '10'],
+    ['--rate', '5'],
+    ['--concurrency', '8'],
+    ['--backend', 'api'],
+    ['--script', 'run.sh', '--script-configmap'],
+    ['--params-file', 'params.tsv', '--indexed'],
+    ['--pods-per-node', '2'],
+])
+def test_kbatch_spool_rejects_options(args):
+    process = sp.run([sys.executable, 'bin/kbatch', '--spool', '-i', 'syncing/the-ship'] + args + ['--', 'echo'],
+                     cwd=root_dir, env=dict(os.environ, PYTHONPATH=root_dir), stdout=sp.PIPE, stderr=sp.PIPE)
+
+    assert process.returncode == 2
+    assert 'kbatch: error: --spool can not be used with' in process.stderr.decode('utf-8')
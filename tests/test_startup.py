@@ -0,0 +1,89 @@
+import os
+import subprocess as sp
+import sys
+
+import pytest
+
+
+root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Modules only needed by some commands, which should not be imported just to start the scripts
+LAZY_MODULES = ['yaml', 'semantic_version', 'tempfile', 'pkgutil', 'base64', 'k8s_jobs.template']
+
+# Modules that are imported once a script makes requests to the API server, submits jobs or renders templates
+HEAVY_MODULES = LAZY_MODULES + ['k8s_jobs.api', 'concurrent.futures', 'asyncio', 'ssl', 'http.client']
+
+SCRIPTS = ['kbatch', 'krun', 'kbatchd', 'kwait', 'klogs', 'klist', 'kpods', 'kcancel', 'kspool', 'kstatus']
+
+# Loads a script as a module without running main, then prints the modules that were imported
+LOADED_MODULES_CODE = '''
+import importlib.machinery
+import importlib.util
+import sys
+
+loader = importlib.machinery.SourceFileLoader('script', sys.argv[1])
+loader.exec_module(importlib.util.module_from_spec(importlib.util.spec_from_loader('script', loader)))
+print('\\n'.join(sorted(sys.modules)))
+'''
+
+# Importing k8s_jobs.klib takes ~40ms (and took ~100ms when it imported yaml and semantic_version), the budget leaves
+# room for slower machines while still catching a heavy dependency being imported again
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('K8S_JOBS_IMPORT_TIME_BUDGET_MS', 80))
+
+requires_importtime = pytest.mark.skipif(sys.version_info < (3, 7), reason='-X importtime requires Python 3.7')
+
+
+def import_times(args):
+    """Runs python with -X importtime and returns the cumulative import time of each module, in microseconds."""
+    env = dict(os.environ, PYTHONPATH=root_dir)
+    process = sp.run([sys.executable, '-X', 'importtime'] + args, cwd=root_dir, env=env, stdout=sp.PIPE,
+                     stderr=sp.PIPE, check=True)
+
+    times = {}
+    for line in process.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def loaded_modules(script):
+    env = dict(os.environ, PYTHONPATH=root_dir)
+    output = sp.check_output([sys.executable, '-c', LOADED_MODULES_CODE, os.path.join('bin', script)], cwd=root_dir,
+                             env=env)
+
+    return set(output.decode('utf-8').split())
+
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_scripts_do_not_import_heavy_modules(script):
+    modules = loaded_modules(script)
+
+    assert 'k8s_jobs' in modules
+    assert [module for module in HEAVY_MODULES if module in modules] == []
+
+
+@requires_importtime
+@pytest.mark.parametrize('args', [
+    ['-c', 'import k8s_jobs.klib'],
+    ['bin/kbatch', '--version'],
+    ['bin/kbatch', '--help'],
+    ['bin/krun', '--help'],
+    ['bin/kbatchd', '--version'],
+])
+def test_startup_does_not_import_lazy_modules(args):
+    times = import_times(args)
+
+    assert 'k8s_jobs' in times
+    assert [module for module in LAZY_MODULES if module in times] == []
+
+
+@requires_importtime
+def test_klib_import_time():
+    # The fastest of a few runs is the least affected by whatever else the machine is doing
+    import_time_ms = min(import_times(['-c', 'import k8s_jobs.klib'])['k8s_jobs.klib'] for _ in range(3)) / 1000
+
+    assert import_time_ms < IMPORT_TIME_BUDGET_MS
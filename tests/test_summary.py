@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from k8s_jobs import summary
+from k8s_jobs.watch import COMPLETE, DELETED, FAILED
+
+from test_watch import FakeJobs
+
+
+pods_path = '/api/v1/namespaces/default/pods'
+
+
+def job(name, created, finished=None, failed_reason=None, retries=0):
+    conditions = []
+    if failed_reason:
+        conditions.append({'type': 'Failed', 'status': 'True', 'reason': failed_reason,
+                           'lastTransitionTime': finished})
+    elif finished:
+        conditions.append({'type': 'Complete', 'status': 'True', 'lastTransitionTime': finished})
+
+    return {
+        'metadata': {'name': name, 'creationTimestamp': created, 'labels': {'k8s-jobs/batch': 'b'}},
+        'status': {'conditions': conditions, 'failed': retries,
+                   'completionTime': finished if finished and not failed_reason else None},
+    }
+
+
+def pod(job_name, scheduled, started, last_started=None):
+    return {
+        'metadata': {'name': '{job_name}-pod'.format(job_name=job_name), 'labels': {'job-name': job_name}},
+        'status': {
+            'conditions': [{'type': 'PodScheduled', 'status': 'True', 'lastTransitionTime': scheduled}],
+            'containerStatuses': [{
+                'state': {'terminated': {'startedAt': started}},
+                'lastState': {'terminated': {'startedAt': last_started}} if last_started else {},
+            }],
+        },
+    }
+
+
+@pytest.mark.parametrize('values, p, expected', [
+    ([], 50, None),
+    ([5], 99, 5),
+    ([1, 2, 3, 4], 50, 2),
+    (list(range(1, 101)), 95, 95),
+    (list(range(100, 0, -1)), 99, 99),
+])
+def test_percentile(values, p, expected):
+    assert summary.percentile(values, p) == expected
+
+
+def test_summarize():
+    jobs = [
+        job('a', '2020-01-01T00:00:00Z', '2020-01-01T00:10:00Z'),
+        job('b', '2020-01-01T00:00:00Z', '2020-01-01T00:20:00Z', 'BackoffLimitExceeded', retries=2),
+        job('c', '2020-01-01T00:00:00Z', '2020-01-01T00:05:00Z', 'DeadlineExceeded'),
+        job('d', '2020-01-01T00:00:00Z'),
+    ]
+    pods = [
+        pod('a', '2020-01-01T00:00:01Z', '2020-01-01T00:00:10Z'),
+        # The first attempt of a retried job is in the last state of its container
+        pod('b', '2020-01-01T00:00:02Z', '2020-01-01T00:05:00Z', last_started='2020-01-01T00:01:00Z'),
+        pod('c', '2020-01-01T00:00:03Z', '2020-01-01T00:01:00Z'),
+    ]
+    states = {'a': COMPLETE, 'b': FAILED, 'c': FAILED, 'd': 'Pending', 'e': DELETED}
+
+    result = summary.summarize(jobs, pods, states)
+
+    assert result['jobs'] == 5
+    assert result['states'] == {COMPLETE: 1, FAILED: 2, 'Pending': 1, DELETED: 1}
+    assert result['failure_reasons'] == {'BackoffLimitExceeded': 1, 'DeadlineExceeded': 1}
+    assert result['retries'] == 2
+    assert result['jobs_retried'] == 1
+    assert result['elapsed_seconds'] == 1200
+    assert result['completed_per_minute'] == 0.05
+    assert result['schedule_seconds'] == {'p50': 2, 'p95': 3, 'p99': 3, 'max': 3, 'count': 3}
+    assert result['queue_seconds'] == {'p50': 60, 'p95': 60, 'p99': 60, 'max': 60, 'count': 3}
+    assert result['run_seconds'] == {'p50': 590, 'p95': 1140, 'p99': 1140, 'max': 1140, 'count': 3}
+    assert result['job_timings'][1] == {
+        'name': 'b', 'state': FAILED, 'reason': 'BackoffLimitExceeded', 'retries': 2,
+        'schedule_seconds': 2, 'queue_seconds': 60, 'run_seconds': 1140,
+    }
+    assert result['job_timings'][3]['run_seconds'] is None
+
+    report = summary.format_summary(result)
+
+    assert report.splitlines()[:3] == [
+        '5 jobs: 1 Complete, 1 Deleted, 2 Failed, 1 Pending in 20m (0.1 completed/min)',
+        'Failures: 1 BackoffLimitExceeded, 1 DeadlineExceeded',
+        'Retries: 2 in 1 jobs',
+    ]
+    assert report.splitlines()[-1].split() == ['Running', '9m', '19m', '19m', '19m']
+
+
+def test_wait_and_summarize(fake_api, tmpdir):
+    FakeJobs(fake_api, [[job('a', '2020-01-01T00:00:00Z', '2020-01-01T00:10:00Z'), job('other', None)]], [])
+    fake_api.route('GET', pods_path, lambda request: (200, {'metadata': {}, 'items': [
+        pod('a', '2020-01-01T00:00:01Z', '2020-01-01T00:00:10Z'),
+    ]}))
+
+    finished = []
+    result = summary.wait_and_summarize(fake_api.client(), ['a'], label_selector='k8s-jobs/batch=b', timeout=5,
+                                        on_final=lambda name, state: finished.append(name))
+
+    assert finished == ['a']
+    assert result['states'] == {COMPLETE: 1}
+    assert result['queue_seconds']['max'] == 10
+    assert result['timed_out'] is False
+    assert [request.query['labelSelector'] for request in fake_api.requests if request.path == pods_path] == \
+        ['k8s-jobs/batch=b']
+
+    path = str(tmpdir.join('summary.json'))
+    summary.write_summary(result, path)
+
+    with open(path) as f:
+        assert json.load(f) == result
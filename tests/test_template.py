@@ -0,0 +1,179 @@
+import os
+
+import pytest
+
+import yaml
+
+from k8s_jobs import klib
+from k8s_jobs.template import ObjectTemplate, Template, template_loader
+
+
+templates_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'templates')
+
+
+def replace_template_loop(data, values):
+    lines = data.split('\n')
+
+    for key, value in values.items():
+        lines = klib.replace_template(lines, key, value)
+
+    return '\n'.join(lines)
+
+
+def test_render():
+    template = Template('line1: example\nline2: $(TEST_REPLACE)\nline3: $(SOMETHING_ELSE)')
+
+    assert template.names == {'TEST_REPLACE', 'SOMETHING_ELSE'}
+    assert template.render({'TEST_REPLACE': 'value'}) == 'line1: example\nline2: value\nline3: $(SOMETHING_ELSE)'
+    assert template.render({'SOMETHING_ELSE': None}) == 'line1: example\nline2: $(TEST_REPLACE)'
+    assert template.render({'TEST_REPLACE': 'value', 'SOMETHING_ELSE': []}) == 'line1: example\nline2: value'
+    assert template.render({}) == 'line1: example\nline2: $(TEST_REPLACE)\nline3: $(SOMETHING_ELSE)'
+
+
+def test_render_multiple_placeholders_per_line():
+    template = Template('name: $(FIRST)-$(SECOND)-$(FIRST)\nother: $(SECOND)')
+
+    assert template.render({'FIRST': 'a', 'SECOND': 'b'}) == 'name: a-b-a\nother: b'
+    assert template.render({'FIRST': 'a', 'SECOND': None}) == ''
+    assert template.render({'FIRST': None, 'SECOND': 'b'}) == 'other: b'
+
+
+def test_render_values_not_substituted_again():
+    template = Template('command: $(CMD_ARGS)\nname: $(JOB_NAME)')
+
+    rendered = template.render({'CMD_ARGS': 'echo $(JOB_NAME)', 'JOB_NAME': 'kjob'})
+
+    assert rendered == 'command: echo $(JOB_NAME)\nname: kjob'
+
+
+def test_render_reusable():
+    template = Template('name: $(NAME)')
+
+    assert [template.render({'NAME': str(i)}) for i in range(3)] == ['name: 0', 'name: 1', 'name: 2']
+
+
+@pytest.mark.parametrize('template_name', sorted(os.listdir(templates_dir)))
+def test_render_matches_replace_template(template_name):
+    with open(os.path.join(templates_dir, template_name)) as template_file:
+        data = template_file.read()
+
+    values = {
+        'JOB_NAME': 'kjob',
+        'CONTAINER_NAME': 'the-ship',
+        'CONTAINER_IMAGE': 'syncing/the-ship',
+        'CMD_ARGS': '["ls", "-la"]',
+        'TIME_LIMIT_SECONDS': '2100',
+        'CPU_REQUEST': '15500m',
+        'MEM_REQUEST': None,
+        'DISK_REQUEST': [],
+        'CPU_LIMIT': None,
+        'MEM_LIMIT': '16Gi',
+        'DISK_LIMIT': None,
+    }
+
+    assert Template(data).render(values) == replace_template_loop(data, values)
+
+
+def test_object_render():
+    template = ObjectTemplate({
+        'name': '$(NAME)-',
+        'deadline': '$(SECONDS)',
+        'readOnly': '$(READ_ONLY)',
+        'resources': {'cpu': '$(CPU)', 'memory': '$(MEMORY)'},
+        'command': '$(COMMAND)',
+        'args': ['--flag', '$(ARG)'],
+        'quoted': 'a: $(SECONDS)',
+        'unknown': '$(UNKNOWN)',
+        'count': 3,
+    })
+
+    job = template.render({
+        'NAME': 'kjob',
+        'SECONDS': '2100',
+        'READ_ONLY': 'true',
+        'CPU': '3.5',
+        'MEMORY': '1Gi',
+        'COMMAND': ['/bin/sh', '-c', 'ls -la'],
+        'ARG': 'value',
+    })
+
+    assert job == {
+        'name': 'kjob-',
+        'deadline': 2100,
+        'readOnly': True,
+        'resources': {'cpu': 3.5, 'memory': '1Gi'},
+        'command': ['/bin/sh', '-c', 'ls -la'],
+        'args': ['--flag', 'value'],
+        'quoted': 'a: 2100',
+        'unknown': '$(UNKNOWN)',
+        'count': 3,
+    }
+
+
+@pytest.mark.parametrize('value', ['yes', '1', '2.5', 'null'])
+def test_object_render_quoted_placeholders(value):
+    template = ObjectTemplate(yaml.load('\n'.join([
+        'env:',
+        '- {name: QUOTED, value: "$(SAMPLE)"}',
+        "- {name: SINGLE_QUOTED, value: '$(SAMPLE)'}",
+        '- {name: PLAIN, value: $(SAMPLE)}',
+    ]), Loader=template_loader))
+
+    env = template.render({'SAMPLE': value})['env']
+
+    assert [item['value'] for item in env] == [value, value, yaml.safe_load(value)]
+
+
+def test_object_render_removes_values():
+    template = ObjectTemplate({
+        'resources': {'requests': {'cpu': '$(CPU)'}, 'limits': {'cpu': '$(CPU_LIMIT)', 'memory': '1Gi'}},
+        'command': ['$(COMMAND)'],
+        'empty': {},
+    })
+
+    assert template.render({'CPU': None, 'CPU_LIMIT': None, 'COMMAND': []}) == {
+        'resources': {'requests': None, 'limits': {'memory': '1Gi'}},
+        'command': None,
+        'empty': {},
+    }
+
+
+def test_object_render_reusable():
+    template = ObjectTemplate({'metadata': {'labels': {'index': '$(INDEX)', 'static': 'value'}}})
+
+    jobs = [template.render({'INDEX': 'index-{i}'.format(i=i)}) for i in range(2)]
+    jobs[0]['metadata']['labels']['static'] = 'changed'
+
+    assert jobs[1] == {'metadata': {'labels': {'index': 'index-1', 'static': 'value'}}}
+
+
+def test_object_render_inner_values():
+    template = ObjectTemplate({'name': '$(NAME)-$(INDEX)', 'command': '$(COMMAND)'})
+
+    job = template.render({'NAME': 'job-$(SAMPLE)', 'INDEX': '3', 'COMMAND': ['run', '$(SAMPLE)', '$(OTHER)']},
+                          inner_values={'SAMPLE': '42'})
+
+    assert job == {'name': 'job-42-3', 'command': ['run', '42', '$(OTHER)']}
+
+
+@pytest.mark.parametrize('template_name', sorted(os.listdir(templates_dir)))
+def test_object_render_matches_template(template_name):
+    with open(os.path.join(templates_dir, template_name)) as template_file:
+        config_template = yaml.safe_load(template_file.read())
+
+    values = {
+        'JOB_NAME': 'kjob',
+        'CONTAINER_NAME': 'the-ship',
+        'CONTAINER_IMAGE': 'syncing/the-ship',
+        'TIME_LIMIT_SECONDS': '2100',
+        'CPU_REQUEST': '15500m',
+        'MEM_REQUEST': None,
+        'DISK_REQUEST': '1e6',
+        'CPU_LIMIT': '16',
+        'MEM_LIMIT': '16Gi',
+        'DISK_LIMIT': None,
+    }
+
+    data = yaml.safe_dump(config_template, default_flow_style=False)
+
+    assert ObjectTemplate(config_template).render(values) == yaml.safe_load(Template(data).render(values))
@@ -0,0 +1,97 @@
+from k8s_jobs import batch, throttle
+from k8s_jobs.watch import COMPLETE, FAILED, PENDING, RUNNING
+from test_batch import FakeSubmitter, kbatch_args
+from test_watch import complete, jobs_path, FakeJobs
+
+
+class FakeCondition(object):
+    def __init__(self, on_wait):
+        self.on_wait = on_wait
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def wait(self, timeout=None):
+        self.on_wait()
+        return True
+
+
+class FakeWatcher(object):
+    """Stands in for a JobWatcher of the batch: each time the throttle waits for a job to change, the oldest running
+        job finishes."""
+
+    def __init__(self):
+        self.states = {}
+        self.n_lists = 1
+        self.n_events = 0
+        self.error = None
+        self.condition = FakeCondition(self.finish_next)
+
+    def finish_next(self):
+        name = next(name for name, state in self.states.items() if state == RUNNING)
+        self.states[name] = FAILED if name == '3' else COMPLETE
+        self.n_events += 1
+
+    def state(self, name):
+        return self.states.get(name)
+
+
+def test_submit_throttled():
+    watcher = FakeWatcher()
+    chunks = [[str(i)] for i in range(10)]
+    max_active = []
+    progress = []
+
+    def submit(chunk):
+        active = sum(1 for state in watcher.states.values() if state in (PENDING, RUNNING))
+        max_active.append(active + len(chunk))
+
+        for name in chunk:
+            watcher.states[name] = RUNNING
+
+        return chunk
+
+    summary = throttle.submit_throttled(chunks, submit, watcher, 3, lambda result: result.value, concurrency=1,
+                                        on_progress=lambda *args: progress.append(args))
+
+    assert [result.index for result in summary.results] == list(range(10))
+    assert all(result.ok for result in summary.results)
+    assert max(max_active) == 3
+
+    n_submitted, n_jobs, counts = progress[-1]
+    assert (n_submitted, n_jobs) == (10, 10)
+    assert counts[RUNNING] == 3
+    assert counts[COMPLETE] + counts[FAILED] == 7
+
+
+def test_job_counts_unseen_jobs_are_pending():
+    watcher = FakeWatcher()
+    watcher.states = {'a': RUNNING, 'b': COMPLETE}
+
+    counts = throttle.job_counts(watcher, ['a', 'b', 'c'])
+
+    assert (counts[PENDING], counts[RUNNING], counts[COMPLETE]) == (1, 1, 1)
+    assert throttle.format_progress(3, 5, counts) == 'Submitted 3/5 jobs: 1 pending, 1 running, 1 complete, 0 failed'
+
+
+def test_throttled_chunk_size():
+    assert batch.throttled_chunk_size(kbatch_args(chunk_size=200, max_running=100)) == 25
+    assert batch.throttled_chunk_size(kbatch_args(chunk_size=10, max_running=100)) == 10
+    assert batch.throttled_chunk_size(kbatch_args(chunk_size=200, max_running=2)) == 1
+
+
+def test_submit_job_array_max_running(fake_api):
+    # The jobs complete as soon as they are listed, so that each chunk makes room for the next
+    FakeJobs(fake_api, [[complete(str(i), '1') for i in range(6)]], [])
+    submit = FakeSubmitter()
+    args = kbatch_args(array=6, max_running=4, render_mode='object')
+
+    summary = batch.submit_job_array(args, submit, client=fake_api.client())
+
+    assert [len(chunk) for chunk in submit.chunks] == [1] * 6
+    assert len(summary.succeeded) == 6
+    assert fake_api.requests[0].path == jobs_path
+    assert fake_api.requests[0].query['labelSelector'] == 'k8s-jobs/batch={batch_id}'.format(batch_id=args.batch_id)
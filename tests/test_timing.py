@@ -0,0 +1,113 @@
+import json
+from argparse import Namespace
+from unittest.mock import patch
+
+import pytest
+
+from k8s_jobs import klib, timing
+
+
+@pytest.fixture
+def timings():
+    timing.timings.reset()
+    yield timing.timings
+    timing.timings.reset()
+
+
+def test_phases():
+    timings = timing.Timings()
+    traced = []
+    timings.add_hook(lambda name, seconds: traced.append(name))
+
+    with timings.phase('parse'):
+        pass
+
+    with pytest.raises(ValueError):
+        with timings.phase('parse'):
+            raise ValueError()
+
+    timings.record('submit', 2.0)
+    timings.record('submit', 1.0)
+    timings.count('retries')
+    timings.count('retries', 2)
+
+    snapshot = timings.snapshot()
+
+    assert snapshot['phases']['parse']['count'] == 2
+    assert snapshot['phases']['submit'] == {'count': 2, 'seconds': 3.0, 'max_seconds': 2.0}
+    assert snapshot['events'] == {'retries': 3}
+    assert traced == ['parse', 'parse', 'submit', 'submit']
+
+
+def test_format_timings():
+    snapshot = {'phases': {'submit': {'count': 2, 'seconds': 3.0, 'max_seconds': 2.0},
+                           'parse': {'count': 1, 'seconds': 1.0, 'max_seconds': 1.0}},
+                'events': {'retries': 1}}
+
+    assert timing.format_timings(snapshot, elapsed=8.0).splitlines() == [
+        'phase              count     seconds         max       %',
+        'parse                  1      1.0000      1.0000    12.5',
+        'submit                 2      3.0000      2.0000    37.5',
+        'total                         8.0000',
+        'retries: 1',
+    ]
+
+    prometheus = timing.format_prometheus(snapshot, elapsed=8.0)
+
+    assert 'kbatch_phase_seconds{phase="submit"} 3.0\n' in prometheus
+    assert 'kbatch_phase_count{phase="parse"} 1\n' in prometheus
+    assert 'kbatch_events{event="retries"} 1\n' in prometheus
+    assert prometheus.endswith('kbatch_elapsed_seconds 8.0\n')
+
+
+@pytest.mark.parametrize('name', ['kbatch.json', 'kbatch.prom'])
+def test_write_timings(name, tmpdir):
+    snapshot = {'phases': {'parse': {'count': 1, 'seconds': 1.0, 'max_seconds': 1.0}}, 'events': {}}
+    path = str(tmpdir.join(name))
+
+    timing.write_timings(snapshot, path, elapsed=2.0)
+
+    with open(path) as f:
+        data = f.read()
+
+    if name.endswith('.json'):
+        assert json.loads(data) == dict(snapshot, elapsed_seconds=2.0)
+    else:
+        assert data == timing.format_prometheus(snapshot, elapsed=2.0)
+
+    assert tmpdir.listdir() == [tmpdir.join(name)]
+
+
+@patch('k8s_jobs.klib.get_kubernetes_version', return_value='1.20.0')
+def test_render_phases(get_kubernetes_version, timings):
+    args = Namespace(file=None, script=None, cmd_args=['ls'], image='perl', preemptible=None, name=None,
+                     container_name=None, time=None, cpu=None, memory=None, disk=None, cpu_limit=None,
+                     memory_limit=None, disk_limit=None, persistent_disk_name=None, mount_path=None, volume_name=None,
+                     retry_limit='2', labels=[], partition=None, volume_read_write=None)
+
+    klib.render_array_manifests(args, klib.array_template_values(3))
+    klib.render_array_manifests(args, klib.array_template_values(3))
+
+    phases = timings.snapshot()['phases']
+
+    # The template is only parsed once, and the same render only validated once, the second render reads them from
+    # the caches
+    assert phases['parse']['count'] == 1
+    assert timings.snapshot()['events'] == {'template_cache_hits': 1, 'validation_cache_hits': 1}
+    assert {name: phases[name]['count'] for name in ['mutate', 'validate', 'dump', 'substitute', 'version_check']} == \
+        {'mutate': 2, 'validate': 2, 'dump': 2, 'substitute': 4, 'version_check': 2}
+
+
+@patch('k8s_jobs.klib.time.sleep')
+def test_retries_counted(sleep, timings):
+    attempts = []
+
+    @klib.run_with_retries(3, show_errors=False)
+    def submit():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError()
+
+    submit()
+
+    assert timings.snapshot()['events'] == {'retries': 2}
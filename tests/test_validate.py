@@ -0,0 +1,154 @@
+import copy
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from k8s_jobs import batch, klib, validate
+from k8s_jobs.validate import ValidationError
+
+
+class Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+JOB = {
+    'apiVersion': 'batch/v1',
+    'kind': 'Job',
+    'metadata': {'generateName': 'align-', 'labels': {'k8s-jobs/batch': 'b1'}},
+    'spec': {
+        'activeDeadlineSeconds': 600,
+        'backoffLimit': 2,
+        'template': {
+            'metadata': {'labels': {'k8s-jobs/array-index': '$(ARRAY_INDEX)'}},
+            'spec': {
+                'restartPolicy': 'Never',
+                'containers': [{
+                    'name': 'align',
+                    'image': 'syncing/the-ship',
+                    'command': ['/bin/sh', '-c', 'echo $(HOME)'],
+                    'resources': {
+                        'requests': {'cpu': 3.5, 'memory': '16Gi', 'ephemeral-storage': '$(DISK)'},
+                        'limits': {'cpu': '4000m', 'memory': '16Gi'},
+                    },
+                }],
+            },
+        },
+    },
+}
+
+
+def job_args(**kwargs):
+    args = dict(file=None, script=None, cmd_args=['ls', '-la'], image='syncing/the-ship', preemptible=None, name=None,
+                container_name=None, time=None, cpu=None, memory=None, disk=None, cpu_limit=None, memory_limit=None,
+                disk_limit=None, persistent_disk_name=None, mount_path=None, volume_name=None, retry_limit=None,
+                labels=[], partition=None, volume_read_write=None, use_temp_file=False, render_mode='text')
+    args.update(kwargs)
+
+    return Namespace(**args)
+
+
+def invalid_job(path, value):
+    job = copy.deepcopy(JOB)
+    keys = path.split('.')
+    obj = klib.get_path(job, '.'.join(keys[:-1])) if len(keys) > 1 else job
+
+    if value is None:
+        del obj[keys[-1] if isinstance(obj, dict) else int(keys[-1])]
+    else:
+        obj[keys[-1] if isinstance(obj, dict) else int(keys[-1])] = value
+
+    return job
+
+
+def test_validate_job():
+    validate.validate_job(JOB)
+
+
+@pytest.mark.parametrize('path, value, problem', [
+    ('kind', 'Pod', 'kind: "Pod" must be Job'),
+    ('apiVersion', None, 'apiVersion: is required'),
+    ('metadata.generateName', None, 'metadata: name or generateName is required'),
+    ('metadata.generateName', 'Align_', 'metadata.generateName: "Align_"'),
+    ('metadata.name', 'a' * 64, 'metadata.name: "{name}"'.format(name='a' * 64)),
+    ('metadata.labels', {'k8s-jobs/batch': 'not valid'}, 'metadata.labels.k8s-jobs/batch: "not valid"'),
+    ('spec.activeDeadlineSeconds', 0, 'spec.activeDeadlineSeconds: "0"'),
+    ('spec.backoffLimit', 'two', 'spec.backoffLimit: "two"'),
+    ('spec.template.spec.restartPolicy', 'Always', 'spec.template.spec.restartPolicy: "Always"'),
+    ('spec.template.spec.restartPolicy', None, 'spec.template.spec.restartPolicy: "None"'),
+    ('spec.template.spec.containers', [], 'spec.template.spec.containers: at least one container is required'),
+    ('spec.template.spec.containers.0.name', 'Align', 'spec.template.spec.containers.0.name: "Align"'),
+    ('spec.template.spec.containers.0.image', None, 'spec.template.spec.containers.0.image'),
+    ('spec.template.spec.containers.0.resources.requests.cpu', '4 cores',
+     'spec.template.spec.containers.0.resources.requests.cpu: "4 cores" is not a valid quantity'),
+    ('spec.template.spec.containers.0.resources.requests.cpu', '-1',
+     'spec.template.spec.containers.0.resources.requests.cpu: "-1" must not be negative'),
+    ('spec.template.spec.containers.0.resources.limits.memory', '8Gi',
+     'spec.template.spec.containers.0.resources.requests.memory: "16Gi" must not be more than the limit "8Gi"'),
+])
+def test_validate_job_invalid(path, value, problem):
+    with pytest.raises(ValidationError) as e:
+        validate.validate_job(invalid_job(path, value))
+
+    assert len(e.value.problems) == 1
+    assert e.value.problems[0].startswith(problem)
+    assert isinstance(e.value, klib.NonRetryableError)
+
+
+def test_validate_job_lists_every_problem():
+    job = invalid_job('kind', 'Pod')
+    job['spec']['template']['spec']['containers'][0]['resources']['requests']['memory'] = '10Gb'
+
+    with pytest.raises(ValidationError) as e:
+        validate.validate_job(job)
+
+    assert len(e.value.problems) == 2
+    assert str(e.value).startswith('Invalid job: kind: "Pod" must be Job; ')
+
+
+def test_validate_arguments():
+    validate.validate_arguments(job_args(cpu='500m', memory='$(MEMORY)', time='30', retry_limit='3'))
+
+    with pytest.raises(ValidationError) as e:
+        validate.validate_arguments(job_args(cpu='4 cores', memory_limit='1GB', time='1.5', retry_limit='3'))
+
+    assert [problem.split(':')[0] for problem in e.value.problems] == ['--cpu', '--memory-limit', '--time']
+
+
+def test_validate_render_cached():
+    config_template, template_values = klib.prepare_template(klib.read_template_data(job_args()), job_args())
+
+    with patch('k8s_jobs.validate.validate_job', wraps=validate.validate_job) as validate_job:
+        assert validate.validate_render(config_template, template_values)
+        assert validate.validate_render(copy.deepcopy(config_template), dict(template_values))
+        assert not validate.validate_render(config_template, dict(template_values, CPU_REQUEST='2'))
+
+    assert validate_job.call_count == 1
+
+
+def test_array_validated_once():
+    with patch('k8s_jobs.validate.validate_job', wraps=validate.validate_job) as validate_job:
+        manifests = klib.render_array_manifests(job_args(), klib.array_template_values(5))
+
+    assert len(manifests) == 5
+    assert validate_job.call_count == 1
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(cpu='4 cores'),
+    dict(name='My_Job'),
+    dict(memory='2Gi', memory_limit='1Gi'),
+])
+def test_invalid_job_not_submitted(kwargs):
+    submit = MagicMock()
+
+    with pytest.raises(ValidationError):
+        batch.submit_job(job_args(**kwargs), submit)
+
+    assert submit.call_count == 0
+
+
+def test_skip_validation():
+    submit = MagicMock(return_value=['my-job'])
+
+    assert batch.submit_job(job_args(name='My_Job', skip_validation=True), submit) == ['my-job']
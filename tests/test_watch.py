@@ -0,0 +1,164 @@
+import time
+
+import pytest
+
+from k8s_jobs import api
+from k8s_jobs.watch import COMPLETE, DELETED, FAILED, NOT_FOUND, PENDING, RUNNING, JobWatcher, job_state
+
+
+jobs_path = '/apis/batch/v1/namespaces/default/jobs'
+
+
+def job(name, resource_version, labels=None, status=None):
+    return {
+        'metadata': {'name': name, 'resourceVersion': resource_version, 'labels': labels or {}},
+        'status': status or {},
+    }
+
+
+def complete(name, resource_version, labels=None):
+    return job(name, resource_version, labels, {'conditions': [{'type': 'Complete', 'status': 'True'}]})
+
+
+def event(event_type, obj):
+    return {'type': event_type, 'object': obj}
+
+
+class FakeJobs(object):
+    """Routes listing and watching jobs on the fake API server: each list returns the jobs of the next of lists (or
+        of the last one), and each watch streams the next of watches (or waits briefly and ends without events)."""
+
+    def __init__(self, fake_api, lists, watches, resource_version='10'):
+        self.lists = list(lists)
+        self.watches = list(watches)
+        self.resource_version = resource_version
+
+        fake_api.route('GET', jobs_path, self.get)
+
+    def get(self, request):
+        if request.query.get('watch'):
+            if not self.watches:
+                time.sleep(0.02)
+                return 200, []
+
+            return 200, self.watches.pop(0)
+
+        jobs = self.lists.pop(0) if len(self.lists) > 1 else self.lists[0]
+
+        return 200, {'items': jobs, 'metadata': {'resourceVersion': self.resource_version}}
+
+
+def watch_requests(fake_api):
+    return [request for request in fake_api.requests if request.query.get('watch')]
+
+
+@pytest.mark.parametrize('status, expected_state', [
+    ({}, PENDING),
+    ({'active': 1}, RUNNING),
+    ({'active': 1, 'conditions': [{'type': 'Failed', 'status': 'False'}]}, RUNNING),
+    ({'conditions': [{'type': 'Complete', 'status': 'True'}]}, COMPLETE),
+    ({'failed': 4, 'conditions': [{'type': 'Failed', 'status': 'True'}]}, FAILED),
+])
+def test_job_state(status, expected_state):
+    assert job_state({'status': status}) == expected_state
+
+
+def test_index(fake_api):
+    FakeJobs(fake_api, [[job('a', '8', {'batch': 'x'}), job('b', '9', {'batch': 'x'})]], [[
+        event('MODIFIED', complete('a', '11', {'batch': 'x'})),
+        event('ADDED', job('c', '12', {'batch': 'y', 'app': 'align'})),
+        event('DELETED', job('b', '13', {'batch': 'x'})),
+        event('BOOKMARK', {'metadata': {'resourceVersion': '14'}}),
+    ]])
+    watcher = JobWatcher(fake_api.client())
+
+    watcher.list()
+
+    assert watcher.resource_version == '10'
+    assert watcher.find({'batch': 'x'}) == ['a', 'b']
+
+    watcher.watch()
+
+    assert watcher.resource_version == '14'
+    assert watcher.n_events == 4
+    assert [watcher.state(name) for name in ['a', 'b', 'c', 'd']] == [COMPLETE, DELETED, PENDING, None]
+    assert watcher.find({'batch': 'x'}) == ['a']
+    assert watcher.find({'batch': 'y', 'app': 'align'}) == ['c']
+    assert watcher.find({}) == ['a', 'c']
+    assert watch_requests(fake_api)[0].query == {
+        'watch': '1',
+        'allowWatchBookmarks': 'true',
+        'resourceVersion': '10',
+        'timeoutSeconds': '50',
+    }
+
+
+def test_wait_resumes_watches(fake_api):
+    FakeJobs(fake_api, [[job('a', '8'), job('b', '9')]], [
+        [event('MODIFIED', job('a', '11', status={'active': 1}))],
+        [event('MODIFIED', complete('a', '12'))],
+        [event('MODIFIED', job('b', '13', status={'conditions': [{'type': 'Failed', 'status': 'True'}]}))],
+    ])
+    watcher = JobWatcher(fake_api.client()).start()
+    finished = []
+
+    states = watcher.wait(['a', 'b'], timeout=5, on_final=lambda name, state: finished.append((name, state)))
+    watcher.stop()
+
+    assert states == {'a': COMPLETE, 'b': FAILED}
+    assert finished == [('a', COMPLETE), ('b', FAILED)]
+    assert watcher.n_lists == 1
+    assert [request.query['resourceVersion'] for request in watch_requests(fake_api)[:3]] == ['10', '11', '12']
+
+
+def test_wait_for_all_jobs(fake_api):
+    FakeJobs(fake_api, [[complete('a', '8'), job('b', '9')]], [[event('MODIFIED', complete('b', '11'))]])
+    watcher = JobWatcher(fake_api.client(), label_selector='batch=x').start()
+
+    assert watcher.wait(timeout=5) == {'a': COMPLETE, 'b': COMPLETE}
+    assert fake_api.requests[0].query['labelSelector'] == 'batch=x'
+
+    watcher.stop()
+
+
+def test_relist_when_resource_version_expired(fake_api):
+    # The job finishes while the watcher can't watch it, so it is only seen by listing again
+    FakeJobs(fake_api, [[job('a', '8')], [complete('a', '20')]], [
+        [event('ERROR', {'kind': 'Status', 'code': 410, 'message': 'too old resource version'})],
+    ])
+    watcher = JobWatcher(fake_api.client()).start()
+
+    assert watcher.wait(['a'], timeout=5) == {'a': COMPLETE}
+    assert watcher.n_lists == 2
+
+    watcher.stop()
+
+
+def test_wait_timeout(fake_api):
+    FakeJobs(fake_api, [[job('a', '8', status={'active': 1})]], [])
+    watcher = JobWatcher(fake_api.client()).start()
+
+    assert watcher.wait(['a'], timeout=0.1) == {'a': RUNNING}
+
+    watcher.stop()
+
+
+def test_wait_for_jobs_not_found(fake_api):
+    FakeJobs(fake_api, [[complete('a', '8')]], [])
+    watcher = JobWatcher(fake_api.client()).start()
+    finished = []
+
+    # A job that doesn't exist when the jobs are listed is final, instead of being waited for forever
+    states = watcher.wait(['a', 'typo'], timeout=5, on_final=lambda name, state: finished.append((name, state)))
+    watcher.stop()
+
+    assert states == {'a': COMPLETE, 'typo': NOT_FOUND}
+    assert finished == [('a', COMPLETE), ('typo', NOT_FOUND)]
+
+
+def test_wait_raises_permanent_errors(fake_api):
+    fake_api.route('GET', jobs_path, lambda request: (403, {'kind': 'Status', 'message': 'forbidden'}))
+    watcher = JobWatcher(fake_api.client()).start()
+
+    with pytest.raises(api.NonRetryableApiError):
+        watcher.wait(['a'], timeout=5)